@@ -1,6 +1,9 @@
 import streamlit as st
 import time
-from modules.database import init_db
+from modules.database import clear_cache
+from modules import change_feed
+from modules.migrations import ensure_schema, schema_error
+from modules.stock_history import ensure_checkpoint
 from modules.auth import login_user, register_user, update_user_profile_full
 from modules.utils import setup_styles, show_footer
 from modules.config import TEXT as txt, AREAS
@@ -49,7 +52,7 @@ def show_login():
                 # Join regions with comma
                 region_str = ",".join(nr)
                 if register_user(nu.strip(), np.strip(), nn, region_str): 
-                    st.success(txt['success_reg']); st.cache_data.clear()
+                    st.success(txt['success_reg'])
                 else: st.error("Error: Username might exist")
 
 def show_main_app():
@@ -86,7 +89,7 @@ def show_main_app():
     @st.fragment
     def refresh_button():
         if st.button(txt['refresh_data'], width="stretch"):
-            st.cache_data.clear()
+            clear_cache()
             st.toast("✅ Data refreshed!", icon="🔄")
             st.rerun(scope="fragment")
     
@@ -110,7 +113,6 @@ def show_main_app():
                     time.sleep(1)
                     st.session_state.logged_in = False
                     st.session_state.user_info = {}
-                    st.cache_data.clear()
                     st.rerun()
                 else: st.error(msg)
         render_profile_editor(info)
@@ -148,7 +150,13 @@ def show_main_app():
     show_footer()
 
 if __name__ == "__main__":
-    init_db() # Ensure tables exist
+    # Ensure tables exist (runs pending migrations once per server process)
+    if not ensure_schema():
+        # Never run the app against a partially upgraded schema (retried on the next rerun)
+        st.error(f"⚠️ Database schema upgrade failed: {schema_error()}. Contact the administrator.")
+        st.stop()
+    ensure_checkpoint() # Daily stock snapshot for "as of" queries (cheap no-op most of the time)
+    change_feed.start() # Once per process: other servers' writes invalidate our cached reads
     if st.session_state.logged_in:
         show_main_app()
     else:
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from modules.database import values_cte, write_session, execute_batch
+from modules.inventory_logic import get_inventory
+from modules.reservations import reserve_actions
+
+# Approval allocation for Bulk Review.
+# allocate() shares the available-to-promise NSTC stock between all candidate request lines at once
+# (sort + groupby/cumsum, no per-row loop) and can never hand out more than is available.
+# apply_review() re-reads the stock under row locks, commits the plan in one UPDATE and reserves the approvals.
+# Policies:
+#   fifo       - oldest request_date first
+#   priority   - regions in the given order first, then FIFO inside a region
+#   fair_share - every line gets the same fraction of its request (largest remainders get the spare units)
+
+POLICIES = {"fifo": "FIFO (oldest first)", "fair_share": "Fair share (proportional)", "priority": "Region priority"}
+LINE_COLUMNS = ["req_id", "item_name", "region", "request_date", "qty"]
+
+def allocate(lines, available, policy="fifo", priorities=None, allow_partial=True):
+    """
+    lines: DataFrame with LINE_COLUMNS (qty = quantity to approve).
+    available: Series item_name -> units still free to approve.
+    Returns lines + allocated / decision ('Approve', 'Partial', 'Reject') in the original order.
+    """
+    if policy not in POLICIES: raise ValueError(f"Unknown allocation policy: {policy}")
+    df = lines[LINE_COLUMNS].copy()
+    df['qty'] = pd.to_numeric(df['qty'], errors='coerce').fillna(0).clip(lower=0).astype(np.int64)
+    df['request_date'] = pd.to_datetime(df['request_date'])
+    df['avail'] = df['item_name'].map(available).fillna(0).clip(lower=0).astype(np.int64)
+
+    if policy == "fair_share":
+        total = df.groupby('item_name')['qty'].transform('sum')
+        share = np.where(total > df['avail'], df['qty'] * df['avail'] / total.where(total > 0, 1), df['qty'])
+        base = np.floor(share).astype(np.int64)
+        # Hand out the rounding leftovers one unit each, largest fractional part (then oldest) first
+        df['_base'], df['_frac'] = base, share - base
+        spare = df['avail'] - df.groupby('item_name')['_base'].transform('sum')
+        order = df.sort_values(['item_name', '_frac', 'request_date', 'req_id'], ascending=[True, False, True, True])
+        rank = order.groupby('item_name').cumcount().reindex(df.index)
+        df['allocated'] = base + ((rank < spare) & (df['_frac'] > 0)).astype(np.int64)
+    else:
+        keys = ['item_name', 'request_date', 'req_id']
+        if policy == "priority":
+            rank = {r: i for i, r in enumerate(priorities or [])}
+            df['_prio'] = df['region'].map(rank).fillna(len(rank))
+            keys.insert(1, '_prio')
+        order = df.sort_values(keys)
+        before = order.groupby('item_name')['qty'].cumsum() - order['qty'] # Units claimed by earlier lines
+        df['allocated'] = (order['avail'] - before).clip(lower=0).clip(upper=order['qty']).reindex(df.index)
+
+    if not allow_partial: df.loc[df['allocated'] < df['qty'], 'allocated'] = 0
+    df['allocated'] = df['allocated'].astype(np.int64)
+    df['decision'] = np.select([df['allocated'] <= 0, df['allocated'] < df['qty']], ["Reject", "Partial"], "Approve")
+    return df.drop(columns=[c for c in df.columns if c.startswith('_')])
+
+def available_stock():
+    """Available-to-promise NSTC stock per item for previews (the commit re-reads it under locks)."""
+    df = get_inventory("NSTC")
+    return df.set_index('name_en')['atp'] if not df.empty else pd.Series(dtype="int64")
+
+def _available(s, items):
+    """Available-to-promise NSTC stock per item, read under row locks (qty minus reservations)."""
+    ph = ", ".join(f":i{n}" for n in range(len(items)))
+    params = {f"i{n}": item for n, item in enumerate(items)}
+    rows = s.execute(text(f"SELECT name_en, qty - COALESCE(reserved_qty, 0) FROM inventory WHERE location = 'NSTC' AND name_en IN ({ph}) FOR UPDATE"), params).fetchall()
+    atp = dict(rows)
+    return pd.Series({i: int(atp.get(i) or 0) for i in items}, dtype="int64")
+
+def apply_review(approve, reject=None, policy="fifo", priorities=None, allow_partial=True, reject_unfilled=False):
+    """
+    Commits a Bulk Review in one transaction.
+    approve: DataFrame with LINE_COLUMNS + note (manager note); allocated against locked stock.
+    reject: DataFrame with req_id + note.
+    Lines that get no stock stay Pending unless reject_unfilled; a missing note keeps the current notes.
+    Only rows still Pending are touched.
+    Returns (ok, plan DataFrame or error message).
+    """
+    reject = reject if reject is not None else pd.DataFrame(columns=["req_id", "note"])
+    rows = []
+    try:
+        with write_session(["requests", "reservations", "inventory"]) as s:
+            plan = pd.DataFrame(columns=LINE_COLUMNS + ["allocated", "decision"])
+            if not approve.empty:
+                plan = allocate(approve, _available(s, sorted(approve['item_name'].unique())), policy, priorities, allow_partial)
+                notes = approve['note'].reindex(plan.index)
+                for (rid, q, alloc, dec), note in zip(plan[['req_id', 'qty', 'allocated', 'decision']].itertuples(index=False, name=None), notes):
+                    note = f"Manager: {note}" if isinstance(note, str) and note else None
+                    if dec == "Reject":
+                        if reject_unfilled: rows.append((rid, "Rejected", None, " | ".join(filter(None, [note, "Insufficient stock"]))))
+                    elif dec == "Partial": rows.append((rid, "Approved", alloc, " | ".join(filter(None, [note, f"Partial: {alloc} of {q}"]))))
+                    else: rows.append((rid, "Approved", alloc, note))
+            for rid, note in reject[['req_id', 'note']].itertuples(index=False, name=None):
+                rows.append((rid, "Rejected", None, note if isinstance(note, str) else None))
+            if rows:
+                cte, params = values_cte("v", ["id", "st", "q", "n"], rows, {"id": "INTEGER", "st": "TEXT", "q": "INTEGER", "n": "TEXT"})
+                done = s.execute(text(f"""
+                    WITH {cte}
+                    UPDATE requests SET status = v.st, qty = COALESCE(v.q, requests.qty), notes = COALESCE(v.n, requests.notes)
+                    FROM v WHERE requests.req_id = v.id AND requests.status = 'Pending'
+                    RETURNING req_id, status, item_name, qty
+                """), params).fetchall()
+                # Approved lines reserve their stock in the same transaction
+                execute_batch(s, reserve_actions([(rid, item, q) for rid, st_, item, q in done if st_ == "Approved"]))
+        return True, plan
+    except Exception as e:
+        return False, str(e)
@@ -0,0 +1,96 @@
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime, timezone
+from modules.config import AUDIT_QUEUE_MAX, AUDIT_FLUSH_SIZE, AUDIT_FLUSH_SECONDS
+
+# Asynchronous audit-log writer.
+# log_audit() only enqueues; a daemon thread bulk-inserts events into audit_logs
+# when AUDIT_FLUSH_SIZE events are waiting or AUDIT_FLUSH_SECONDS have passed.
+
+INSERT_SQL = "INSERT INTO audit_logs (timestamp, user_name, action, details, module) VALUES (:t, :u, :a, :d, :m)"
+
+class AuditWriter:
+    def __init__(self, max_queue=AUDIT_QUEUE_MAX, flush_size=AUDIT_FLUSH_SIZE, flush_seconds=AUDIT_FLUSH_SECONDS):
+        self._q = queue.Queue(maxsize=max_queue)
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, user_name, action, details=None, module=None):
+        """Queue one event; never blocks the script thread. Returns False if the event was dropped."""
+        self._ensure_started()
+        # Event time is taken now (UTC, like the DB default), not when the batch is flushed
+        event = {"t": datetime.now(timezone.utc).replace(tzinfo=None), "u": user_name, "a": action, "d": details, "m": module}
+        try:
+            self._q.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None: return
+        with self._start_lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _next_batch(self):
+        """Blocks for the first event, then collects until flush_size or flush_seconds."""
+        try: batch = [self._q.get(timeout=self.flush_seconds)]
+        except queue.Empty: return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.flush_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: break
+            try: batch.append(self._q.get(timeout=remaining))
+            except queue.Empty: break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch: self._write(batch)
+
+    def _write(self, batch):
+        from modules.database import get_connection, execute_batch, invalidate_tables
+        try:
+            c = get_connection()
+            if not c: raise RuntimeError("no database connection")
+            with c.session as session:
+                execute_batch(session, [(INSERT_SQL, e) for e in batch]) # One executemany per batch
+                session.commit()
+            invalidate_tables(["audit_logs"])
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"[Audit] Failed to write {len(batch)} events: {e}")
+
+    def flush(self):
+        """Synchronously writes everything currently queued."""
+        batch = []
+        while True:
+            try: batch.append(self._q.get_nowait())
+            except queue.Empty: break
+            if len(batch) >= self.flush_size:
+                self._write(batch); batch = []
+        if batch: self._write(batch)
+
+    def close(self, timeout=5.0):
+        """Stops the background thread and drains the queue (registered with atexit)."""
+        self._stop.set()
+        if self._thread is not None: self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {"queued": self._q.qsize(), "written": self.written, "dropped": self.dropped, "failed": self.failed}
+
+writer = AuditWriter()
@@ -0,0 +1,80 @@
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from modules import dialect
+
+# Pluggable database backends for get_connection().
+# "supabase" (default) is the Postgres st.connection from secrets; "sqlite" is an embedded
+# file or in-memory database for local runs, profiling and tests. Every backend returns an
+# object with the st.connection(type="sql") surface the data layer uses: .engine, .session, .query().
+
+class EngineConnection:
+    """Minimal st.connection(type="sql") look-alike around a plain SQLAlchemy engine."""
+    def __init__(self, engine):
+        self.engine = engine
+        self._session_factory = sessionmaker(bind=engine)
+
+    @property
+    def session(self):
+        return self._session_factory()
+
+    @property
+    def driver(self):
+        return self.engine.driver
+
+    def query(self, sql, params=None, ttl=None, **kwargs):
+        with self.engine.connect() as conn:
+            return pd.read_sql(text(sql), conn, params=params)
+
+def _sqlite_on_connect(dbapi_conn, connection_record):
+    # pysqlite only opens a transaction before INSERT/UPDATE/DELETE, so a write starting with
+    # WITH would autocommit; transactions are begun explicitly instead (see _sqlite_begin)
+    dbapi_conn.isolation_level = None
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA foreign_keys=ON")
+    cur.execute("PRAGMA busy_timeout=5000")
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.close()
+
+def _sqlite_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+def _sqlite_translate(conn, cursor, statement, parameters, context, executemany):
+    statement = dialect.translate(statement, "sqlite")
+    if "IF NOT EXISTS" in statement.upper() and "ADD COLUMN" in statement.upper():
+        statement = dialect.sqlite_add_column(cursor, statement)
+    return statement, parameters
+
+def prepare_engine(engine):
+    """Installs the dialect layer on non-Postgres engines (idempotent)."""
+    if engine.dialect.name == "sqlite" and not event.contains(engine, "before_cursor_execute", _sqlite_translate):
+        event.listen(engine, "connect", _sqlite_on_connect)
+        event.listen(engine, "before_cursor_execute", _sqlite_translate, retval=True)
+        event.listen(engine, "begin", _sqlite_begin)
+    return engine
+
+def engine_from_url(url, **kwargs):
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        # One shared connection so every session sees the same in-memory database
+        kwargs.setdefault("poolclass", StaticPool)
+    if url.startswith("sqlite"):
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    return prepare_engine(create_engine(url, **kwargs))
+
+def supabase_connection(name="supabase"):
+    try:
+        # psycopg2: send executemany() as multi-row VALUES / execute_batch pages instead of one trip per row
+        return st.connection(name, type="sql", executemany_mode="values_plus_batch")
+    except Exception:
+        return st.connection(name, type="sql") # Driver without executemany_mode support
+
+def sqlite_connection(path):
+    url = "sqlite://" if path in ("", ":memory:") else f"sqlite:///{path}"
+    return EngineConnection(engine_from_url(url))
+
+def create_connection(backend, sqlite_path=":memory:"):
+    if backend == "sqlite": return sqlite_connection(sqlite_path)
+    if backend == "supabase": return supabase_connection()
+    raise ValueError(f"Unknown DB backend: {backend}")
@@ -0,0 +1,103 @@
+import json
+import time
+import uuid
+import queue
+import select
+import threading
+from modules import query_cache
+from modules.config import CHANGE_FEED_ENABLED, CHANGE_FEED_CHANNEL, CHANGE_FEED_POLL_SECONDS, CHANGE_FEED_RECONNECT_SECONDS
+
+# Database change feed.
+# Every write helper ends in invalidate_tables(), which publish()es the tables it touched.
+# On Postgres one listener thread per process owns a LISTEN connection: it sends the queued
+# events as pg_notify (coalesced, off the script thread) and applies the events of other
+# processes to query_cache, so their cached reads drop and table_version() moves within
+# CHANGE_FEED_POLL_SECONDS. Other backends (SQLite, tests) only have the in-process bus.
+# Subscribers are called as callback(tables, remote) for both local and remote events;
+# pages offer a refresh through views.common.watch_tables(), which only compares in-memory versions.
+
+ALL = "*"  # "Unknown footprint": receivers clear their whole cache
+CHANNEL = CHANGE_FEED_CHANNEL
+
+_origin = uuid.uuid4().hex  # Our own notifications come back to us; skip them
+_lock = threading.Lock()
+_outbox = queue.Queue()
+_subscribers = []
+_state = {"thread": None, "mode": "local", "published": 0, "received": 0, "errors": 0}
+
+def subscribe(callback):
+    with _lock:
+        _subscribers.append(callback)
+
+def _deliver(tables, remote):
+    for cb in list(_subscribers):
+        try: cb(tables, remote)
+        except Exception as e: print(f"[ChangeFeed] Subscriber failed: {e}")
+
+def publish(tables):
+    """Announces a committed write to `tables` (None/empty = unknown, everything)."""
+    tables = sorted({t.lower() for t in tables}) if tables else [ALL]
+    _deliver(tables, remote=False)
+    if _state["mode"] == "postgres": _outbox.put(tables)
+
+def _apply_remote(tables):
+    _state["received"] += 1
+    if ALL in tables: query_cache.clear()
+    else: query_cache.invalidate(tables)
+    _deliver(tables, remote=True)
+
+def _drain_outbox(cur):
+    tables = set()
+    while True:
+        try: tables.update(_outbox.get_nowait())
+        except queue.Empty: break
+    if not tables: return
+    payload = json.dumps({"o": _origin, "t": [ALL] if ALL in tables else sorted(tables)})
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+    _state["published"] += 1
+
+def _listen(engine):
+    raw = engine.raw_connection()
+    try:
+        conn = raw.dbapi_connection
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {CHANNEL}")
+        while True:
+            _drain_outbox(cur)
+            if select.select([conn], [], [], CHANGE_FEED_POLL_SECONDS) == ([], [], []): continue
+            conn.poll()
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                try: event = json.loads(note.payload)
+                except ValueError: continue
+                if event.get("o") != _origin: _apply_remote(event.get("t") or [ALL])
+    finally:
+        raw.invalidate() # Never hand a LISTENing connection back to the pool
+
+def _run(engine):
+    while True:
+        try: _listen(engine)
+        except Exception as e:
+            _state["errors"] += 1
+            print(f"[ChangeFeed] Listener error, reconnecting in {CHANGE_FEED_RECONNECT_SECONDS}s: {e}")
+            query_cache.clear() # Events may have been missed while disconnected
+        time.sleep(CHANGE_FEED_RECONNECT_SECONDS)
+
+def start():
+    """Starts the listener thread once per process (no-op for backends without LISTEN/NOTIFY)."""
+    if _state["thread"] is not None or not CHANGE_FEED_ENABLED: return _state["mode"]
+    with _lock:
+        if _state["thread"] is not None: return _state["mode"]
+        from modules.database import get_connection
+        c = get_connection()
+        if not c or c.engine.dialect.name != "postgresql" or c.engine.driver != "psycopg2":
+            _state["thread"] = False # In-process bus only
+            return _state["mode"]
+        _state["mode"] = "postgres"
+        _state["thread"] = threading.Thread(target=_run, args=(c.engine,), name="change-feed", daemon=True)
+        _state["thread"].start()
+        return _state["mode"]
+
+def stats():
+    return {k: v for k, v in _state.items() if k != "thread"}
@@ -1,5 +1,7 @@
 
 # Constants and Configuration
+import os
+import tempfile
 
 CATS_EN = ["Electrical", "Chemical", "Hand Tools", "Consumables", "Safety", "Others"]
 LOCATIONS = ["NSTC", "SNC"]
@@ -34,3 +36,60 @@ TEXT = {
 }
 
 ATTENDANCE_STATUSES = ["Present", "Absent", "Vacation", "Day Off", "Eid Holiday", "Sick Leave"]
+
+# Database Backend: "supabase" (Postgres via st.connection secrets) or "sqlite" (embedded, for local runs/tests)
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "warehouse.db")  # ":memory:" for a throwaway database
+
+# Database Instrumentation (DB Performance panel)
+QUERY_STATS_BUFFER = int(os.environ.get("QUERY_STATS_BUFFER", "5000"))  # Statements kept in memory
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH")  # Optional JSON-lines export of every statement
+
+# Read Replica (optional): a second st.connection used for cached (ttl > 0) reads
+REPLICA_CONNECTION = os.environ.get("REPLICA_CONNECTION", "supabase_replica")  # Name under [connections] in secrets
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "30"))  # Fall back to primary beyond this lag
+REPLICA_LAG_CHECK_SECONDS = 15  # How often the replication lag is sampled
+REPLICA_RETRY_SECONDS = 60  # Cool-off before retrying a replica that failed
+
+# Audit Log Writer (background, batched)
+AUDIT_QUEUE_MAX = 10000  # Events held in memory; beyond this new events are dropped (and counted)
+AUDIT_FLUSH_SIZE = 200  # Flush as soon as this many events are queued
+AUDIT_FLUSH_SECONDS = 2.0  # ...or after this long, whichever comes first
+
+# Streamed exports (temporary files, swept by age and count; also clears files left by a restarted process)
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "warehouse_exports"))
+EXPORT_MAX_AGE_SECONDS = int(os.environ.get("EXPORT_MAX_AGE_SECONDS", "3600"))
+EXPORT_MAX_FILES = 50
+
+# Inventory Index (process-wide, delta-refreshed on inventory.last_updated)
+INVENTORY_INDEX_POLL_SECONDS = float(os.environ.get("INVENTORY_INDEX_POLL_SECONDS", "10"))  # Delta check for writes from other processes
+INVENTORY_INDEX_RESYNC_SECONDS = 600  # Full re-read (catches deletes / rows without last_updated)
+INVENTORY_INDEX_OVERLAP_SECONDS = 5  # Re-read window below the watermark (NOW() is the transaction start time)
+
+# Stock Checkpoints (point-in-time stock = nearest checkpoint +/- stock_logs in between)
+CHECKPOINT_INTERVAL_HOURS = int(os.environ.get("CHECKPOINT_INTERVAL_HOURS", "24"))  # 168 for weekly
+
+# Reorder Levels (inventory.min_qty / max_qty; items without min_qty use the default)
+LOW_STOCK_DEFAULT_MIN = int(os.environ.get("LOW_STOCK_DEFAULT_MIN", "10"))
+
+# Consumption Forecast (from "Issued <region>" stock logs)
+FORECAST_WINDOWS = (7, 30, 90)  # Averaging windows in days (the longest bounds the history kept in memory)
+FORECAST_LEAD_TIME_DAYS = 7  # Supplier lead time
+FORECAST_COVER_DAYS = 30  # Days of consumption a reorder should cover beyond the lead time
+FORECAST_POLL_SECONDS = 60  # Check for new issue logs written by other processes
+
+# Executive dashboard snapshot (one background refresher per process)
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get("DASHBOARD_REFRESH_SECONDS", "30"))  # Recompute at least this often
+DASHBOARD_CHECK_SECONDS = 2  # How often the refresher looks for local writes to the dashboard tables
+DASHBOARD_IDLE_SECONDS = 120  # The refresher stops when no session has read the dashboard for this long
+
+# Change feed (LISTEN/NOTIFY on Postgres, in-process bus otherwise). Disable behind poolers without LISTEN support
+CHANGE_FEED_ENABLED = os.environ.get("CHANGE_FEED", "1") != "0"
+CHANGE_FEED_CHANNEL = "warehouse_changes"
+CHANGE_FEED_POLL_SECONDS = 0.25  # Listener wake-up (sends queued events, max delay of our own notifications)
+CHANGE_FEED_RECONNECT_SECONDS = 5
+# How often watching pages compare table versions: no query, but every check is a fragment rerun per open session
+CHANGE_FEED_WATCH_SECONDS = float(os.environ.get("CHANGE_FEED_WATCH_SECONDS", "10"))
+
+# Branch (local) inventory counts: keep an old -> new history in local_inventory_logs
+LOCAL_COUNT_LOG = os.environ.get("LOCAL_COUNT_LOG", "1") != "0"
@@ -0,0 +1,130 @@
+import time
+import threading
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from modules import query_cache
+from modules.config import DASHBOARD_REFRESH_SECONDS, DASHBOARD_CHECK_SECONDS, DASHBOARD_IDLE_SECONDS
+
+# Process-wide executive dashboard snapshot.
+# Every manager session renders the same numbers, so one daemon thread computes them for the
+# whole process: all metrics and chart series come from a single UNION ALL aggregate query and
+# the Plotly figures are built once per refresh. The snapshot is recomputed every
+# DASHBOARD_REFRESH_SECONDS, or sooner (at most every DASHBOARD_CHECK_SECONDS) after a local
+# write to one of TABLES. Dashboard DB load no longer grows with the number of open screens.
+# The refresher only runs while someone reads the dashboard: it exits after DASHBOARD_IDLE_SECONDS
+# without a get(), and the next get() restarts it (refreshing first if the snapshot is old).
+# Figures are kept serialized; every get() hands out its own Figure objects.
+
+TABLES = ["workers", "attendance", "requests", "reservations", "inventory", "low_stock_alerts"]
+
+# kind, label, value rows; a kind is either one metric or one chart series
+_AGGREGATES = """
+    SELECT 'metric' AS kind, 'active_workers' AS label, COUNT(*) AS value FROM workers WHERE status = 'Active'
+    UNION ALL SELECT 'metric', 'present_today', COUNT(*) FROM attendance WHERE date = :today AND status = 'Present'
+    UNION ALL SELECT 'metric', 'attendance_today', COUNT(*) FROM attendance WHERE date = :today
+    UNION ALL SELECT 'metric', 'pending_requests', COUNT(*) FROM requests WHERE status = 'Pending'
+    UNION ALL SELECT 'metric', 'reserved_lines', COUNT(*) FROM reservations
+    UNION ALL SELECT 'metric', 'reserved_units', COALESCE(SUM(qty), 0) FROM reservations
+    UNION ALL SELECT 'workers_by_region', region, COUNT(*) FROM workers WHERE status = 'Active' GROUP BY region
+    UNION ALL SELECT 'top_stock', item, qty FROM (
+        SELECT name_en AS item, qty FROM inventory WHERE location = 'NSTC' ORDER BY qty DESC LIMIT 10
+    ) top_items
+    UNION ALL SELECT 'attendance_trend', CAST(date AS TEXT), COUNT(*) FROM attendance
+        WHERE status = 'Present' AND date >= CURRENT_DATE - INTERVAL '7 days' GROUP BY date
+"""
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()  # One recompute at a time (refresher thread or a first caller)
+_state = {"snapshot": None, "table_version": None, "thread": None, "read_at": 0.0, "refreshes": 0, "failures": 0}
+
+def _series(rows, kind, label, value):
+    return rows.loc[rows['kind'] == kind, ['label', 'value']].rename(columns={'label': label, 'value': value}).reset_index(drop=True)
+
+def _compute():
+    from modules.database import run_query
+    from modules.inventory_logic import get_low_stock
+    tv = query_cache.table_version(*TABLES) # Taken before reading: a racing write triggers another refresh
+    rows = run_query(_AGGREGATES, params={"today": pd.Timestamp.now().strftime('%Y-%m-%d')}, ttl=0)
+    if 'kind' not in rows.columns: raise RuntimeError("Dashboard read failed") # run_query already reported it
+    rows['value'] = pd.to_numeric(rows['value'], errors='coerce').fillna(0).astype(int)
+    metrics = _series(rows, 'metric', 'name', 'value')
+    metrics = dict(zip(metrics['name'], metrics['value']))
+
+    by_region = _series(rows, 'workers_by_region', 'region', 'count')
+    stock = _series(rows, 'top_stock', 'item', 'qty').sort_values('qty', ascending=False)
+    trend = _series(rows, 'attendance_trend', 'date', 'present_count')
+    trend['date'] = pd.to_datetime(trend['date'])
+    trend = trend.sort_values('date')
+
+    figures = {}
+    if not by_region.empty: figures['workers_by_region'] = px.pie(by_region, values='count', names='region', hole=0.4)
+    if not stock.empty:
+        figures['top_stock'] = px.bar(stock, x='item', y='qty', color='qty', color_continuous_scale='Blues')
+        figures['top_stock'].update_layout(xaxis_tickangle=-45)
+    if not trend.empty: figures['attendance_trend'] = px.line(trend, x='date', y='present_count', markers=True)
+    figures = {name: fig.to_dict() for name, fig in figures.items()}
+
+    return tv, {
+        "metrics": {k: int(metrics.get(k, 0)) for k in ("active_workers", "present_today", "attendance_today",
+                                                         "pending_requests", "reserved_lines", "reserved_units")},
+        "low_stock": get_low_stock(),
+        "figures": figures,
+        "computed_at": pd.Timestamp.now(),
+    }
+
+def _age(snapshot):
+    return (pd.Timestamp.now() - snapshot["computed_at"]).total_seconds() if snapshot else float("inf")
+
+def refresh(max_age=None):
+    """
+    Recomputes the snapshot now (or only if it is older than max_age seconds).
+    Keeps the previous one if the database is unreachable.
+    """
+    with _refresh_lock:
+        if max_age is not None and _age(_state["snapshot"]) < max_age: return True
+        try:
+            tv, snapshot = _compute()
+        except RuntimeError:
+            _state["failures"] += 1
+            return False
+        _state.update(snapshot=snapshot, table_version=tv, refreshes=_state["refreshes"] + 1)
+        return True
+
+def _run():
+    while True:
+        time.sleep(DASHBOARD_CHECK_SECONDS)
+        with _lock:
+            if time.monotonic() - _state["read_at"] > DASHBOARD_IDLE_SECONDS:
+                _state["thread"] = None # Nobody is looking: stop until the next get()
+                return
+        if _age(_state["snapshot"]) >= DASHBOARD_REFRESH_SECONDS or query_cache.table_version(*TABLES) != _state["table_version"]:
+            try: refresh()
+            except Exception as e:
+                _state["failures"] += 1
+                print(f"[Dashboard] Refresh failed: {e}")
+
+def _ensure_started():
+    if _state["thread"] is not None: return
+    with _lock:
+        if _state["thread"] is not None: return
+        _state["thread"] = threading.Thread(target=_run, name="dashboard-snapshot", daemon=True)
+        _state["thread"].start()
+
+def get():
+    """
+    The current snapshot: {"metrics": {...}, "low_stock": DataFrame, "figures": {name: Figure},
+    "computed_at": Timestamp}, or None if the first read failed. The caller gets its own copies.
+    """
+    _state["read_at"] = time.monotonic()
+    _ensure_started()
+    # First caller (or the first one after an idle period) pays for the read
+    refresh(max_age=DASHBOARD_REFRESH_SECONDS + DASHBOARD_CHECK_SECONDS)
+    snap = _state["snapshot"]
+    if snap is None: return None
+    return dict(snap, metrics=dict(snap["metrics"]), low_stock=snap["low_stock"].copy(),
+                figures={name: go.Figure(fig) for name, fig in snap["figures"].items()})
+
+def stats():
+    s = _state["snapshot"]
+    return {"refreshes": _state["refreshes"], "failures": _state["failures"], "computed_at": s["computed_at"] if s else None}
@@ -1,7 +1,10 @@
-
 import streamlit as st
 import pandas as pd
 from sqlalchemy import text
+import time
+from contextlib import contextmanager
+from modules import query_cache, instrumentation, backends, change_feed
+from modules.config import DB_BACKEND, SQLITE_PATH, REPLICA_CONNECTION, REPLICA_MAX_LAG_SECONDS, REPLICA_LAG_CHECK_SECONDS, REPLICA_RETRY_SECONDS
 
 # Database Connection
 # Lazy loading to prevent import errors and st.stop() at module level
@@ -12,195 +15,349 @@ def get_connection():
     if _conn is not None:
         return _conn
     try:
-        _conn = st.connection("supabase", type="sql")
+        _conn = backends.create_connection(DB_BACKEND, SQLITE_PATH)
+        backends.prepare_engine(_conn.engine) # Dialect layer for non-Postgres engines
+        instrumentation.attach(_conn.engine) # Per-statement timing for the DB Performance panel
         return _conn
     except Exception as e:
         st.error(f"⚠️ Connection Error: {e}")
         return None
 
-def run_query(query, params=None, ttl=600):
+# Optional read replica (None = not configured / not yet probed)
+_read_conn = None
+_replica = {"configured": None, "down_until": 0.0, "lag_checked": 0.0, "lagging": False}
+_recent_writes = {}  # table -> monotonic time of the last local write (read-your-writes window)
+
+def _replica_configured():
+    if _replica["configured"] is None:
+        try: _replica["configured"] = REPLICA_CONNECTION in st.secrets.get("connections", {})
+        except Exception: _replica["configured"] = False # No secrets file
+    return _replica["configured"]
+
+def _replica_lag_seconds(c):
+    with c.engine.connect() as conn:
+        if conn.dialect.name != "postgresql": return 0.0 # Local stand-in (e.g. SQLite) has no replication lag
+        lag = conn.execute(text(
+            "SELECT CASE WHEN pg_is_in_recovery() THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END"
+        )).scalar()
+        return float(lag or 0)
+
+def mark_replica_down(reason=None):
+    _replica["down_until"] = time.monotonic() + REPLICA_RETRY_SECONDS
+    print(f"[DB Replica] Falling back to primary for {REPLICA_RETRY_SECONDS}s: {reason}")
+
+def get_read_connection(tables=()):
+    """
+    Connection for cacheable reads: the read replica when it is configured, reachable and
+    not lagging more than REPLICA_MAX_LAG_SECONDS; otherwise the primary.
+    Reads of `tables` written by this process within the lag window also stay on the primary.
+    """
+    global _read_conn
+    primary = get_connection()
+    if not _replica_configured() or time.monotonic() < _replica["down_until"]:
+        return primary
+    now = time.monotonic()
+    if any(now - _recent_writes.get(t, -REPLICA_MAX_LAG_SECONDS) < REPLICA_MAX_LAG_SECONDS for t in ("*", *tables)):
+        return primary
+    try:
+        if _read_conn is None:
+            _read_conn = st.connection(REPLICA_CONNECTION, type="sql")
+            backends.prepare_engine(_read_conn.engine)
+            instrumentation.attach(_read_conn.engine)
+        now = time.monotonic()
+        if now - _replica["lag_checked"] > REPLICA_LAG_CHECK_SECONDS:
+            _replica["lag_checked"] = now
+            lag = _replica_lag_seconds(_read_conn)
+            _replica["lagging"] = lag > REPLICA_MAX_LAG_SECONDS
+            if _replica["lagging"]: print(f"[DB Replica] Lagging {lag:.0f}s, reading from primary")
+        return primary if _replica["lagging"] else _read_conn
+    except Exception as e:
+        mark_replica_down(e)
+        return primary
+
+def dialect_name():
+    """'postgresql' or 'sqlite' - for the few statements that need a per-backend form."""
+    c = get_connection()
+    return c.engine.dialect.name if c else None
+
+def _read_frame(c, query, params=None):
+    with c.engine.connect() as conn:
+        return pd.read_sql(text(query) if isinstance(query, str) else query, conn, params=params)
+
+def _write_tables(queries, tables=None):
+    """Tables touched by a write: explicit tags win, otherwise parsed from the SQL."""
+    if tables is not None: return set(tables)
+    found = set()
+    for q in queries:
+        found |= query_cache.extract_tables(q)
+    return found
+
+def invalidate_tables(tables):
+    """Drop cached run_query results that read any of `tables` (call after raw-session writes)."""
+    now = time.monotonic()
+    if tables:
+        query_cache.invalidate(tables)
+        for t in tables: _recent_writes[t.lower()] = now
+    else:
+        query_cache.clear() # Unknown footprint: be safe
+        _recent_writes["*"] = now
+    change_feed.publish(tables) # Other processes drop their cached reads too
+
+def _on_remote_change(tables, remote):
+    # Another process wrote these tables: read them from the primary until the replica has caught up
+    if remote:
+        now = time.monotonic()
+        for t in tables: _recent_writes[t] = now
+
+change_feed.subscribe(_on_remote_change)
+
+def clear_cache():
+    query_cache.clear()
+
+def run_query(query, params=None, ttl=600, tables=None):
     c = get_connection()
     if not c: return pd.DataFrame()
     try: 
         # Caching strategy: Default strict cache (10 mins) for extreme speed.
-        # Writes will auto-invalidate via st.cache_data.clear()
-        return c.query(query, params=params, ttl=ttl)
+        # Each entry is tagged with the tables it reads; writes only invalidate those tables.
+        if not ttl:
+            with instrumentation.context(cache="bypass"):
+                return _read_frame(c, query, params)
+        tags = set(tables) if tables is not None else query_cache.extract_tables(query)
+        key = query_cache.make_key(query, params)
+        start = time.perf_counter()
+        cached = query_cache.get(key)
+        if cached is not None:
+            instrumentation.record(query, "cache", (time.perf_counter() - start) * 1000, len(cached), cache="hit")
+            return cached
+        snapshot = query_cache.generation(tags)
+        # Cacheable reads may be served by the replica; writes and ttl=0 checks stay on the primary
+        rc = get_read_connection(tags) or c
+        with instrumentation.context(cache="miss"):
+            try:
+                df = _read_frame(rc, query, params)
+            except Exception as e:
+                if rc is c: raise
+                mark_replica_down(e)
+                df = _read_frame(c, query, params)
+        query_cache.put(key, df.copy(), tags, ttl, snapshot)
+        return df
     except Exception as e: 
         st.error(f"DB Error: {e}")
         return pd.DataFrame()
 
-def run_action(query, params=None):
+def run_action(query, params=None, tables=None):
     c = get_connection()
     if not c: return False
     try:
         with c.session as session:
             session.execute(text(query) if isinstance(query, str) else query, params)
             session.commit()
-            st.cache_data.clear() # Auto-invalidate cache on write
+        invalidate_tables(_write_tables([query], tables)) # Auto-invalidate affected tables on write
         return True
     except Exception as e: 
         st.error(f"DB Action Error: {e}")
         return False
 
+def _py(v):
+    """Plain Python value for a bind parameter (numpy/pandas scalars -> int/float/datetime, NaN -> None)."""
+    if v is None or v is pd.NaT or v is pd.NA: return None
+    if isinstance(v, pd.Timestamp): return v.to_pydatetime()
+    if hasattr(v, "item") and not isinstance(v, (str, bytes)): v = v.item()
+    if isinstance(v, float) and v != v: return None
+    return v
+
+def values_cte(name, columns, rows, types=None):
+    """
+    `name(col, ...) AS (VALUES (...), (...))` fragment for a WITH clause, plus its bind params.
+    Lets one statement join/update against a whole list of rows (works on Postgres and SQLite).
+    types: optional {col: SQL type}; the first row is CAST so Postgres infers the column type
+    even when every value is NULL.
+    """
+    params, tuples = {}, []
+    for i, row in enumerate(rows):
+        ph = []
+        for col, val in zip(columns, row):
+            p = f"{name}_{col}_{i}"
+            params[p] = _py(val)
+            ph.append(f"CAST(:{p} AS {types[col]})" if i == 0 and types and col in types else f":{p}")
+        tuples.append("(" + ", ".join(ph) + ")")
+    return f"{name}({', '.join(columns)}) AS (VALUES {', '.join(tuples)})", params
+
+@contextmanager
+def write_session(tables):
+    """
+    Session for multi-statement writes in one transaction: commits when the block succeeds
+    (rolls back on error) and then invalidates the cached reads of `tables`.
+    """
+    c = get_connection()
+    if not c: raise RuntimeError("Database connection failed")
+    with c.session as session:
+        yield session
+        session.commit()
+    invalidate_tables(tables)
+
+def update_rows(table, key, rows, types=None):
+    """
+    Writes several rows of `table` with one set-based UPDATE ... FROM (VALUES ...) in one transaction.
+    rows: DataFrame with the `key` column plus the columns to set. types: {col: SQL type} (see values_cte).
+    Returns (ok, rows updated or error message).
+    """
+    if rows.empty: return True, 0
+    cols = list(rows.columns)
+    sets = ", ".join(f"{c} = v.{c}" for c in cols if c != key)
+    cte, params = values_cte("v", cols, rows.itertuples(index=False, name=None), types)
+    try:
+        with write_session([table]) as s:
+            n = len(s.execute(text(f"WITH {cte} UPDATE {table} SET {sets} FROM v WHERE {table}.{key} = v.{key} RETURNING {table}.{key}"), params).fetchall())
+        return True, n
+    except Exception as e: return False, str(e)
+
 def log_audit(user_name: str, action: str, details: str = None, module: str = None):
-    """Log user action to audit_logs table for tracking."""
+    """Queue a user action for the audit_logs table (written in batches by a background thread)."""
     try:
-        run_action(
-            "INSERT INTO audit_logs (user_name, action, details, module) VALUES (:u, :a, :d, :m)",
-            {"u": user_name, "a": action, "d": details, "m": module}
-        )
+        from modules.audit_writer import writer
+        writer.submit(user_name, action, details, module)
     except Exception:
         pass  # Silent fail - audit logging should not break main functionality
 
-def run_batch_action(actions):
+def group_actions(actions):
+    """
+    Groups consecutive (query, params) tuples that share the same SQL text.
+    Returns a list of (query, [params, ...]) so each group can go out as one executemany.
+    Only consecutive statements are merged, so the original execution order is preserved.
+    A statement without params always runs on its own.
+    """
+    groups = []
+    for q, p in actions:
+        if groups and groups[-1][0] == q and groups[-1][1] and p is not None:
+            groups[-1][1].append(p)
+        else:
+            groups.append((q, [p] if p is not None else []))
+    return groups
+
+def execute_batch(session, actions):
+    """Runs `actions` on an open session using one executemany per group. Returns batch stats."""
+    groups = group_actions(actions)
+    for q, param_list in groups:
+        stmt = text(q) if isinstance(q, str) else q
+        if len(param_list) > 1: session.execute(stmt, param_list) # executemany (multi-row VALUES / execute_batch)
+        else: session.execute(stmt, param_list[0] if param_list else None)
+    return {"statements": len(actions), "round_trips": len(groups), "coalesced": len(actions) - len(groups)}
+
+def run_batch_action(actions, tables=None, with_stats=False):
     """
     Executes a list of (query, params) tuples in a single transaction.
     actions: list of (query_string, params_dict)
+    tables: optional explicit list of tables written (parsed from the SQL otherwise)
+    with_stats: return (ok, stats) where stats reports how many statements were coalesced
     """
     c = get_connection()
-    if not c: return False
+    stats = {"statements": len(actions), "round_trips": 0, "coalesced": 0}
+    if not c: return (False, stats) if with_stats else False
     try:
         with st.spinner("Processing..."):
             with c.session as session:
-                for q, p in actions:
-                    session.execute(text(q), p)
+                stats = execute_batch(session, actions)
                 session.commit()
-                st.cache_data.clear() # Auto-invalidate cache on batch write
-            return True
-    except Exception as e: st.error(f"Batch DB Error: {e}"); return False
-
-def init_db():
-    # Users Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT NOT NULL,
-            name TEXT,
-            role TEXT,
-            region TEXT,
-            shift_id INTEGER,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-
-    # Inventory Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS inventory (
-            id SERIAL PRIMARY KEY,
-            name_en TEXT NOT NULL,
-            category TEXT,
-            unit TEXT,
-            qty INTEGER DEFAULT 0,
-            location TEXT NOT NULL,
-            status TEXT,
-            last_updated TIMESTAMP DEFAULT NOW(),
-            UNIQUE(name_en, location)
-        );
-    """)
-
-    # Requests Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS requests (
-            req_id SERIAL PRIMARY KEY,
-            supervisor_name TEXT,
-            region TEXT,
-            item_name TEXT,
-            category TEXT,
-            qty INTEGER,
-            unit TEXT,
-            status TEXT,
-            request_date TIMESTAMP DEFAULT NOW(),
-            notes TEXT
-        );
-    """)
-
-    # Workers Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS workers (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            role TEXT,
-            region TEXT,
-            status TEXT DEFAULT 'Active',
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-    # Shifts Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS shifts (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            start_time TEXT,
-            end_time TEXT
-        );
-    """)
-    # Attendance Table
-    run_action("""
-        CREATE TABLE IF NOT EXISTS attendance (
-            id SERIAL PRIMARY KEY,
-            worker_id INTEGER REFERENCES workers(id),
-            date DATE NOT NULL,
-            status TEXT,
-            shift_id INTEGER,
-            return_date DATE,
-            notes TEXT,
-            supervisor TEXT,
-            created_at TIMESTAMP DEFAULT NOW()
-        );
-    """)
-    
-    # 4.2 Migration (Safe Add Columns)
-    try:
-        run_action("ALTER TABLE workers ADD COLUMN IF NOT EXISTS shift_id INTEGER;")
-        run_action("ALTER TABLE users ADD COLUMN IF NOT EXISTS shift_id INTEGER;")
-        run_action("ALTER TABLE workers ADD COLUMN IF NOT EXISTS emp_id TEXT;") # Add EMP ID
-        run_action("ALTER TABLE inventory ADD COLUMN IF NOT EXISTS last_updated TIMESTAMP DEFAULT NOW();") # Fix for UndefinedColumn error
-        
-        # Performance Indexes
-        run_action("CREATE INDEX IF NOT EXISTS idx_inv_loc ON inventory(location);")
-        run_action("CREATE INDEX IF NOT EXISTS idx_inv_name ON inventory(name_en);")
-        run_action("CREATE INDEX IF NOT EXISTS idx_workers_reg ON workers(region);")
-        run_action("CREATE INDEX IF NOT EXISTS idx_att_date ON attendance(date);")
-        run_action("CREATE INDEX IF NOT EXISTS idx_req_stat ON requests(status);")
-        
-        # Support for Batch Upsert in Warehouse
-        run_action("CREATE TABLE IF NOT EXISTS local_inventory (region TEXT, item_name TEXT, qty INTEGER, last_updated TIMESTAMP, updated_by TEXT);")
-        run_action("CREATE UNIQUE INDEX IF NOT EXISTS idx_local_inv_uniq ON local_inventory (region, item_name);")
-        
-        # Stock Logs Table (Fix for UndefinedColumn)
-        run_action("""
-            CREATE TABLE IF NOT EXISTS stock_logs (
-                id SERIAL PRIMARY KEY,
-                log_date TIMESTAMP DEFAULT NOW(),
-                item_name TEXT,
-                change_amount INTEGER,
-                location TEXT,
-                action_by TEXT,
-                action_type TEXT,
-                unit TEXT,
-                new_qty INTEGER,
-                user_name TEXT -- Legacy support
-            );
-        """)
-        # Safe migrations for stock_logs
-        run_action("ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS action_by TEXT;")
-        run_action("ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS unit TEXT;")
-        run_action("ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS new_qty INTEGER;")
-        run_action("ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS user_name TEXT;")
-        
-        # Audit Logs Table - Track all user actions
-        run_action("""
-            CREATE TABLE IF NOT EXISTS audit_logs (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP DEFAULT NOW(),
-                user_name TEXT NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                module TEXT
-            );
-        """)
-        run_action("CREATE INDEX IF NOT EXISTS idx_audit_time ON audit_logs(timestamp DESC);")
-        
+            invalidate_tables(_write_tables([q for q, _ in actions], tables)) # Auto-invalidate affected tables
+            return (True, stats) if with_stats else True
     except Exception as e:
-        # Log migration errors but don't crash - these are often just "column already exists"
-        print(f"[DB Migration] Non-critical warning: {e}")
+        st.error(f"Batch DB Error: {e}")
+        return (False, stats) if with_stats else False
+
+# Keyset-pageable tables: ordering key (newest first, last column unique) and server-side filters.
+# Filter modes: "eq" exact match, "like" case-insensitive contains; a list value ORs its entries.
+PAGEABLE = {
+    "stock_logs": {
+        "columns": "*", "order": ("log_date", "id"),
+        "filters": {"item": ("item_name", "like"), "location": ("location", "eq"), "user": ("action_by", "like"), "action": ("action_type", "like")}
+    },
+    "audit_logs": {
+        "columns": "timestamp, user_name, action, details, module, id", "order": ("timestamp", "id"),
+        "filters": {"user": ("user_name", "like"), "action": ("action", "like"), "module": ("module", "eq")}
+    },
+    "workers": {
+        "columns": "*", "order": ("id",),
+        "filters": {"region": ("region", "eq"), "status": ("status", "eq"), "name": ("name", "like")}
+    },
+}
+
+def page_key(df, table, edge="last"):
+    """Keyset cursor (tuple of ordering values) of the first/last row of a page."""
+    if df.empty: return None
+    row = df.iloc[-1 if edge == "last" else 0]
+    return tuple(_py(row[k]) for k in PAGEABLE[table]["order"])
+
+def _page_filters(spec, filters):
+    keys = spec["order"]
+    where, params = [], {}
+    for name, value in (filters or {}).items():
+        if value is None or (isinstance(value, (str, list, tuple)) and not value): continue
+        if name == "date_from":
+            where.append(f"{keys[0]} >= :date_from"); params["date_from"] = value
+        elif name == "date_to":
+            where.append(f"{keys[0]} < :date_to"); params["date_to"] = value + pd.Timedelta(days=1)
+        else:
+            col, mode = spec["filters"][name]
+            parts = []
+            for i, v in enumerate(value if isinstance(value, (list, tuple)) else [value]):
+                p = f"f_{name}_{i}"
+                parts.append(f"{col} ILIKE :{p}" if mode == "like" else f"{col} = :{p}")
+                params[p] = f"%{v}%" if mode == "like" else v
+            where.append("(" + " OR ".join(parts) + ")")
+    return where, params
+
+def filtered_query(table, filters=None, columns=None):
+    """(sql, params) for every row of a PAGEABLE table matching `filters` (newest first) - used by exports."""
+    spec = PAGEABLE[table]
+    where, params = _page_filters(spec, filters)
+    sql = f"SELECT {columns or spec['columns']} FROM {table}"
+    if where: sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY " + ", ".join(f"{k} DESC" for k in spec["order"]), params
+
+def fetch_page(table, filters=None, after=None, before=None, limit=50, ttl=60):
+    """
+    Keyset pagination over PAGEABLE[table], newest first. Cost is constant per page.
+    filters: {"date_from": date, "date_to": date (inclusive), <filter name>: value or [values]}
+    after: page_key of the last row seen -> next older page
+    before: page_key of the first row seen -> next newer page
+    Returns (DataFrame, has_more) where has_more tells if another page exists in that direction.
+    """
+    spec = PAGEABLE[table]
+    keys = spec["order"]
+    where, params = _page_filters(spec, filters)
+
+    order = "DESC"
+    cursor = after if after is not None else before
+    if cursor is not None:
+        # Row-value comparison lets the (ts, id) index seek straight to the page
+        key_expr = "(" + ", ".join(keys) + ")"
+        cur_expr = "(" + ", ".join(f":k{i}" for i in range(len(keys))) + ")"
+        where.append(f"{key_expr} {'<' if after is not None else '>'} {cur_expr}")
+        params.update({f"k{i}": _py(v) for i, v in enumerate(cursor)})
+        if after is None: order = "ASC"
+
+    sql = f"SELECT {spec['columns']} FROM {table}"
+    if where: sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY " + ", ".join(f"{k} {order}" for k in keys) + f" LIMIT {int(limit) + 1}"
+
+    df = run_query(sql, params, ttl=ttl, tables=[table])
+    has_more = len(df) > limit
+    df = df.head(limit)
+    if order == "ASC": df = df.iloc[::-1].reset_index(drop=True)
+    return df, has_more
+
+def iter_query_chunks(query, params=None, chunk_size=5000):
+    """
+    Streams a result set through a server-side cursor, yielding (columns, rows) chunks of at
+    most `chunk_size` rows. Nothing is cached and the full result is never held in memory.
+    """
+    c = get_connection()
+    if not c: return
+    with c.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(
+            text(query) if isinstance(query, str) else query, params or {})
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_size):
+            yield columns, rows
@@ -0,0 +1,53 @@
+import re
+from functools import lru_cache
+
+# Small Postgres -> SQLite dialect layer.
+# The app's SQL is written for Postgres (Supabase); when running on the embedded SQLite
+# backend each statement is rewritten just before it reaches the driver. Only the
+# constructs actually used in modules/ are covered.
+
+_SQLITE_RULES = [
+    (re.compile(r'\bSERIAL\s+PRIMARY\s+KEY\b', re.I), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\bNOW\(\)', re.I), 'CURRENT_TIMESTAMP'),
+    # CURRENT_DATE - INTERVAL '7 days'  ->  date('now', '-7 days')
+    (re.compile(r"\bCURRENT_DATE\s*([-+])\s*INTERVAL\s*'(\d+)\s*days?'", re.I), r"date('now', '\1\2 days')"),
+    (re.compile(r"\bCURRENT_TIMESTAMP\s*([-+])\s*INTERVAL\s*'(\d+)\s*(day|hour|minute|second)s?'", re.I), r"datetime('now', '\1\2 \3s')"),
+    # x::date / x::timestamp / x::int / x::text casts
+    (re.compile(r'([\w.]+|\([^()]*\))::date\b', re.I), r'date(\1)'),
+    (re.compile(r'([\w.]+|\([^()]*\))::timestamp\b', re.I), r'datetime(\1)'),
+    (re.compile(r'([\w.]+|\([^()]*\))::(?:int|integer|bigint)\b', re.I), r'CAST(\1 AS INTEGER)'),
+    (re.compile(r'([\w.]+|\([^()]*\))::text\b', re.I), r'CAST(\1 AS TEXT)'),
+    (re.compile(r'\bCAST\(([^()]+?)\s+AS\s+DATE\)', re.I), r'date(\1)'),
+    (re.compile(r"\bdate_trunc\('day',\s*([^()]+?)\)", re.I), r'date(\1)'),
+    (re.compile(r'\bGREATEST\(', re.I), 'MAX('),
+    (re.compile(r'\bLEAST\(', re.I), 'MIN('),
+    (re.compile(r'\bILIKE\b', re.I), 'LIKE'),
+    # SQLite serializes writers on the whole database; row locks are implicit
+    (re.compile(r'\s+FOR\s+UPDATE(?:\s+SKIP\s+LOCKED)?\b', re.I), ''),
+]
+
+_ADD_COLUMN_RE = re.compile(r'ALTER\s+TABLE\s+"?(\w+)"?\s+ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\s+"?(\w+)"?', re.I)
+
+@lru_cache(maxsize=1024)
+def to_sqlite(sql):
+    for pattern, repl in _SQLITE_RULES:
+        sql = pattern.sub(repl, sql)
+    return sql
+
+def translate(sql, dialect):
+    """Rewrites a Postgres statement for `dialect` (currently only 'sqlite' needs changes)."""
+    if dialect != "sqlite" or not isinstance(sql, str): return sql
+    return to_sqlite(sql)
+
+def sqlite_add_column(cursor, sql):
+    """
+    SQLite has no ADD COLUMN IF NOT EXISTS: check PRAGMA table_info and return either the
+    plain ADD COLUMN statement or a no-op when the column is already there.
+    """
+    m = _ADD_COLUMN_RE.search(sql)
+    if not m: return sql
+    table, column = m.group(1), m.group(2)
+    cursor.execute(f'PRAGMA table_info("{table}")')
+    if any(row[1].lower() == column.lower() for row in cursor.fetchall()):
+        return "SELECT 1"
+    return _ADD_COLUMN_RE.sub(lambda x: f'ALTER TABLE "{table}" ADD COLUMN "{column}"', sql, count=1)
@@ -0,0 +1,116 @@
+import time
+import threading
+import numpy as np
+import pandas as pd
+from modules import query_cache
+from modules.database import run_query
+from modules.inventory_logic import get_inventory
+from modules.config import FORECAST_WINDOWS, FORECAST_LEAD_TIME_DAYS, FORECAST_COVER_DAYS, FORECAST_POLL_SECONDS
+
+# Consumption forecasting.
+# Issue events come from stock_logs ("Issued <region>" rows written by the storekeeper issue):
+# the log is append-only with a monotonic id, so new events are pulled incrementally
+# (`id > watermark - overlap`) and kept in memory for the longest window. Open requests
+# (Pending/Approved) are the demand already committed on top of the run rate.
+# Rates for every item/region come from one item x day matrix (pivot + cumulative sum).
+
+REQUEST_SOURCE = "NSTC"  # Supervisor requests are issued from this location only
+
+ID_OVERLAP = 500  # Re-read ids below the watermark (SERIAL ids can commit out of order)
+EVENT_COLUMNS = ["id", "day", "item_name", "location", "region", "qty"]
+
+_lock = threading.Lock()
+_state = {"events": None, "watermark": 0, "table_version": None, "polled_at": 0.0}
+_results = {}  # (kind, args, day) -> computed frame; cleared when the events change
+
+def _load_events():
+    """Issue events of the last max(FORECAST_WINDOWS) days (columns EVENT_COLUMNS)."""
+    tv = query_cache.table_version("stock_logs")
+    now = time.monotonic()
+    events = _state["events"]
+    if events is not None and tv == _state["table_version"] and now - _state["polled_at"] < FORECAST_POLL_SECONDS:
+        return events
+    since = pd.Timestamp.now().normalize() - pd.Timedelta(days=max(FORECAST_WINDOWS))
+    new = run_query("""
+        SELECT id, log_date, item_name, location, action_type, change_amount FROM stock_logs
+        WHERE id > :wm AND action_type LIKE 'Issued %' AND log_date >= :since
+    """, params={"wm": max(_state["watermark"] - ID_OVERLAP, 0), "since": since.to_pydatetime()}, ttl=0)
+    if 'id' not in new.columns: # Read failed (already reported): keep what we have
+        return events if events is not None else pd.DataFrame(columns=EVENT_COLUMNS)
+    new = pd.DataFrame({
+        "id": new['id'].astype(int),
+        "day": pd.to_datetime(new['log_date']).dt.normalize(),
+        "item_name": new['item_name'],
+        "location": new['location'],
+        "region": new['action_type'].str.slice(len("Issued ")),
+        "qty": -pd.to_numeric(new['change_amount'], errors='coerce').fillna(0),
+    })
+    old = events
+    if old is not None: new = pd.concat([old, new]).drop_duplicates('id', keep='last')
+    events = new[new['day'] >= since].reset_index(drop=True)
+    _state.update(events=events, table_version=tv, polled_at=now,
+                  watermark=max(_state["watermark"], int(events['id'].max()) if not events.empty else 0))
+    if old is None or len(old) != len(events) or set(old['id']) != set(events['id']):
+        _results.clear()
+    return events
+
+def _cached(kind, args, compute):
+    """Results are recomputed only when new events arrive (or the day changes)."""
+    with _lock:
+        events = _load_events()
+        key = (kind, args, pd.Timestamp.now().normalize())
+        if key not in _results:
+            _results[key] = compute(events, *args)
+        return _results[key].copy()
+
+def _rates(events, windows, by_region, location):
+    keys = ["item_name", "region"] if by_region else ["item_name"]
+    cols = [f"rate_{w}d" for w in windows]
+    if location: events = events[events['location'] == location]
+    if events.empty: return pd.DataFrame(columns=keys + cols)
+    age = (pd.Timestamp.now().normalize() - events['day']).dt.days.clip(lower=0)
+    # rows = item(/region), columns = age in days; cumulative sum gives "consumed in the last N days"
+    matrix = events.assign(age=age).pivot_table(index=keys, columns='age', values='qty', aggfunc='sum', fill_value=0)
+    cum = np.cumsum(matrix.reindex(columns=range(max(windows)), fill_value=0).to_numpy(dtype=float), axis=1)
+    rates = cum[:, [w - 1 for w in windows]] / np.asarray(windows, dtype=float)
+    return pd.DataFrame(rates.round(3), index=matrix.index, columns=cols).reset_index()
+
+def consumption_rates(windows=FORECAST_WINDOWS, by_region=True, location=None):
+    """
+    Average daily consumption per item (and region) over each window (days), of one issuing
+    location or all of them. Columns: item_name, [region,] rate_<w>d...
+    """
+    return _cached("rates", (tuple(windows), by_region, location), _rates)
+
+def reorder_report(location="NSTC", window=30, lead_time_days=FORECAST_LEAD_TIME_DAYS, cover_days=FORECAST_COVER_DAYS):
+    """
+    Per item of `location`: stock, open demand (REQUEST_SOURCE only), daily rate of the issues made
+    from `location` (over `window` days), days of cover and a suggested order qty.
+    An item is due when stock - open demand would not last the lead time;
+    the suggestion then tops it up to lead_time + cover_days of consumption.
+    """
+    windows = tuple(sorted(set(FORECAST_WINDOWS) | {window}))
+    rates = consumption_rates(windows, by_region=False, location=location)
+    stock = get_inventory(location)[['name_en', 'category', 'unit', 'qty']].rename(columns={'name_en': 'item_name'})
+    if location == REQUEST_SOURCE:
+        open_req = run_query("SELECT item_name, SUM(qty) AS open_demand FROM requests WHERE status IN ('Pending', 'Approved') GROUP BY item_name",
+                             ttl=60, tables=["requests"])
+    else: open_req = pd.DataFrame({'item_name': pd.Series(dtype=object), 'open_demand': pd.Series(dtype=float)}) # Requests never draw on this location
+    df = stock.merge(rates, on='item_name', how='left').merge(open_req.reindex(columns=['item_name', 'open_demand']), on='item_name', how='left')
+    rate_cols = [f"rate_{w}d" for w in windows]
+    df[rate_cols + ['open_demand']] = df[rate_cols + ['open_demand']].fillna(0)
+
+    rate = df[f"rate_{window}d"].to_numpy(dtype=float)
+    qty = df['qty'].to_numpy(dtype=float)
+    free = qty - df['open_demand'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['days_of_cover'] = np.where(rate > 0, np.round(np.maximum(free, 0) / rate, 1), np.nan) # NaN = no consumption
+    due = free <= rate * lead_time_days
+    target = rate * (lead_time_days + cover_days)
+    df['suggested_qty'] = np.where(due & (rate > 0), np.ceil(np.maximum(target - free, 0)), 0).astype(int)
+    return df.sort_values(['suggested_qty', 'days_of_cover'], ascending=[False, True]).reset_index(drop=True)
+
+def reset():
+    with _lock:
+        _state.update(events=None, watermark=0, table_version=None, polled_at=0.0)
+        _results.clear()
@@ -0,0 +1,152 @@
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+from modules.config import QUERY_STATS_BUFFER, QUERY_LOG_PATH
+
+# Lightweight query instrumentation.
+# Statements are captured via SQLAlchemy engine events (so raw sessions are covered too),
+# cache hits are recorded by run_query. Everything lands in a bounded ring buffer.
+
+_buffer = deque(maxlen=QUERY_STATS_BUFFER)
+_lock = threading.Lock()
+_local = threading.local()
+_export_file = None
+
+_COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'(?<!:):\w+|%\(\w+\)s|%s|\?')
+_VALUES_RE = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_SPACE_RE = re.compile(r'\s+')
+
+def normalize(sql):
+    """SQL text with literals/parameters replaced by ? (multi-row VALUES collapsed to one row)."""
+    s = _COMMENT_RE.sub(' ', str(sql))
+    s = _STRING_RE.sub('?', s)
+    s = _PARAM_RE.sub('?', s)
+    s = _NUMBER_RE.sub('?', s)
+    s = _VALUES_RE.sub(r'\1, ...', s)
+    return _SPACE_RE.sub(' ', s).strip()
+
+def fingerprint(sql):
+    norm = normalize(sql)
+    return hashlib.md5(norm.encode()).hexdigest()[:12], norm
+
+def _caller():
+    """First view/app function on the stack (e.g. 'warehouse.render_manager_bulk_review')."""
+    f = sys._getframe(2)
+    fallback = None
+    while f is not None:
+        mod = f.f_globals.get('__name__', '')
+        if mod.startswith('modules.views') or mod == '__main__':
+            return f"{mod.rsplit('.', 1)[-1]}.{f.f_code.co_name}"
+        if fallback is None and mod.startswith('modules.') and mod not in ('modules.database', 'modules.instrumentation'):
+            fallback = f"{mod.rsplit('.', 1)[-1]}.{f.f_code.co_name}"
+        f = f.f_back
+    return fallback or "unknown"
+
+@contextmanager
+def context(cache=None):
+    """Tags statements executed inside the block (e.g. cache='miss' for run_query misses)."""
+    prev = getattr(_local, 'cache', None)
+    _local.cache = cache
+    try: yield
+    finally: _local.cache = prev
+
+def record(sql, kind, elapsed_ms, rows=None, cache=None, statements=1):
+    fp, norm = fingerprint(sql)
+    entry = {
+        "ts": time.time(), "fingerprint": fp, "sql": norm[:500], "kind": kind,
+        "ms": round(elapsed_ms, 3), "rows": rows, "cache": cache if cache is not None else getattr(_local, 'cache', None),
+        "statements": statements, "caller": _caller()
+    }
+    with _lock:
+        _buffer.append(entry)
+        if QUERY_LOG_PATH: _export(entry)
+
+def _export(entry):
+    global _export_file
+    if _export_file is False: return
+    try:
+        if _export_file is None:
+            _export_file = open(QUERY_LOG_PATH, "a", buffering=1, encoding="utf-8")
+        _export_file.write(json.dumps(entry) + "\n")
+    except Exception as e:
+        print(f"[Instrumentation] Export disabled: {e}")
+        _export_file = False
+
+# --- SQLAlchemy engine hooks ---
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_qstart', []).append(time.perf_counter())
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['_qstart'].pop()
+    rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+    n = len(parameters) if executemany and parameters else 1
+    record(statement, "executemany" if executemany else "execute", (time.perf_counter() - start) * 1000, rows, statements=n)
+
+def _on_error(exception_context):
+    starts = exception_context.connection.info.get('_qstart') if exception_context.connection is not None else None
+    if starts: starts.pop()
+
+def attach(engine):
+    """Installs the timing hooks on an engine (idempotent)."""
+    from sqlalchemy import event
+    if event.contains(engine, "before_cursor_execute", _before_execute): return
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+    event.listen(engine, "handle_error", _on_error)
+
+# --- Reporting ---
+def records():
+    with _lock:
+        return list(_buffer)
+
+def reset():
+    with _lock:
+        _buffer.clear()
+
+def to_jsonl():
+    return "\n".join(json.dumps(r) for r in records()).encode()
+
+def summarize(top_n=20):
+    """Top-N statements by total time with p50/p95 latency and cache hit ratio."""
+    df = pd.DataFrame(records())
+    if df.empty: return df
+    df['hit'] = (df['cache'] == 'hit').astype(int)
+    df['cached_read'] = df['cache'].isin(['hit', 'miss']).astype(int)
+    g = df.groupby('fingerprint')
+    summary = pd.DataFrame({
+        "sql": g['sql'].first(),
+        "calls": g.size(),
+        "statements": g['statements'].sum(),
+        "total_ms": g['ms'].sum().round(1),
+        "p50_ms": g['ms'].quantile(0.5).round(2),
+        "p95_ms": g['ms'].quantile(0.95).round(2),
+        "rows": g['rows'].sum(min_count=1),
+        "cache_hits": g['hit'].sum(),
+        "cached_reads": g['cached_read'].sum(),
+        "callers": g['caller'].agg(lambda c: ", ".join(sorted(set(c)))),
+    })
+    summary['hit_ratio'] = (summary['cache_hits'] / summary['cached_reads'].where(summary['cached_reads'] > 0)).round(3)
+    summary = summary.drop(columns=['cached_reads']).sort_values('total_ms', ascending=False)
+    return summary.head(top_n).reset_index()
+
+def overview():
+    """Headline numbers for the whole buffer."""
+    df = pd.DataFrame(records())
+    if df.empty: return {"statements": 0, "p50_ms": 0.0, "p95_ms": 0.0, "hit_ratio": None}
+    db = df[df['cache'] != 'hit']
+    cached = df[df['cache'].isin(['hit', 'miss'])]
+    return {
+        "statements": int(len(df)),
+        "p50_ms": float(db['ms'].quantile(0.5)) if not db.empty else 0.0,
+        "p95_ms": float(db['ms'].quantile(0.95)) if not db.empty else 0.0,
+        "hit_ratio": float((cached['cache'] == 'hit').mean()) if not cached.empty else None,
+    }
@@ -0,0 +1,120 @@
+import time
+import threading
+from datetime import timedelta
+import pandas as pd
+from modules import query_cache
+from modules.config import INVENTORY_INDEX_POLL_SECONDS, INVENTORY_INDEX_RESYNC_SECONDS, INVENTORY_INDEX_OVERLAP_SECONDS
+
+# Process-wide inventory index.
+# One frame per location keyed by name_en, kept current with delta reads
+# (`last_updated >= watermark - overlap`) instead of re-reading the whole location.
+# Local writes are noticed through query_cache.table_version("inventory"); writes made by
+# other server processes are picked up by the periodic poll. A full resync runs every
+# INVENTORY_INDEX_RESYNC_SECONDS (and after clear_cache) to catch deletes and NULL timestamps.
+
+COLUMNS = ["name_en", "category", "unit", "qty", "reserved_qty", "atp", "location", "status"]  # atp = qty - reserved_qty
+_SELECT = "SELECT name_en, category, unit, qty, reserved_qty, location, status, last_updated FROM inventory WHERE location = :loc"
+
+EMPTY_WATERMARK = pd.Timestamp("1970-01-01")  # Empty location (or only NULL timestamps): everything is new
+
+_lock = threading.Lock()  # Guards _locations / _read_locks (held only for dict access, never across a query)
+_locations = {}  # location -> state dict (see _full_sync); replaced as a whole, never mutated in place
+_read_locks = {}  # location -> lock serializing that location's refresh reads
+
+def _read(query, params):
+    from modules.database import run_query
+    df = run_query(query, params=params, ttl=0, tables=["inventory"])
+    if 'last_updated' not in df.columns: raise RuntimeError("Inventory read failed") # run_query already reported it
+    df['last_updated'] = pd.to_datetime(df['last_updated'], errors='coerce')
+    return df.set_index('name_en')
+
+def _build_view(frame):
+    view = frame.sort_index().reset_index()
+    view['reserved_qty'] = view['reserved_qty'].fillna(0).astype(int)
+    view['atp'] = view['qty'] - view['reserved_qty']
+    return view[COLUMNS]
+
+def _full_sync(location, prev, epoch, tv):
+    frame = _read(_SELECT, {"loc": location})
+    now = time.monotonic()
+    return {
+        "location": location, "frame": frame, "view": _build_view(frame),
+        "watermark": frame['last_updated'].max() if frame['last_updated'].notna().any() else EMPTY_WATERMARK,
+        "table_version": tv, "epoch": epoch,
+        "version": (prev["version"] + 1) if prev else 1,
+        "polled_at": now, "synced_at": now,
+    }
+
+def _delta_sync(state, tv):
+    """New state with the rows touched since the watermark merged in."""
+    wm = state["watermark"]
+    since = (wm - timedelta(seconds=INVENTORY_INDEX_OVERLAP_SECONDS)).to_pydatetime()
+    delta = _read(_SELECT + " AND last_updated >= :since", {"loc": state["location"], "since": since})
+    state = dict(state, polled_at=time.monotonic(), table_version=tv)
+    if delta.empty: return state
+    frame, cols = state["frame"], state["frame"].columns
+    known = delta.index.intersection(frame.index)
+    new = delta.index.difference(frame.index)
+    if len(new) > 0 or not frame.loc[known, cols].equals(delta.loc[known, cols]):
+        frame = frame.copy()
+        if len(known): frame.loc[known, cols] = delta.loc[known, cols]
+        if len(new): frame = pd.concat([frame, delta.loc[new, cols]])
+        state.update(frame=frame, view=_build_view(frame), version=state["version"] + 1)
+    state["watermark"] = max(wm, delta['last_updated'].max())
+    return state
+
+def _due(state, epoch, tv):
+    """'full', 'delta' or None (fresh enough)."""
+    now = time.monotonic()
+    if state is None or state["epoch"] != epoch or now - state["synced_at"] > INVENTORY_INDEX_RESYNC_SECONDS: return "full"
+    if tv != state["table_version"] or now - state["polled_at"] > INVENTORY_INDEX_POLL_SECONDS: return "delta"
+    return None
+
+def _refresh(location):
+    """
+    Current state of `location`. The DB read runs under that location's read lock only; while
+    another session is already refreshing it for a timed poll, the current snapshot is served
+    instead of waiting. Other locations and fresh reads never wait for a query.
+    """
+    with _lock:
+        state = _locations.get(location)
+        read_lock = _read_locks.setdefault(location, threading.Lock())
+    # Versions are taken before reading: a write racing the read triggers another refresh
+    tv = query_cache.table_version("inventory")
+    kind = _due(state, query_cache.generation(())[0], tv)
+    if kind is None: return state
+    # A timed poll can serve the current snapshot while someone else reads; a known write (or no data) waits
+    if not read_lock.acquire(blocking=kind == "full" or tv != state["table_version"]): return state
+    try:
+        with _lock: state = _locations.get(location) # Someone may have refreshed while we waited
+        epoch, tv = query_cache.generation(())[0], query_cache.table_version("inventory")
+        kind = _due(state, epoch, tv)
+        if kind is None: return state
+        state = _full_sync(location, state, epoch, tv) if kind == "full" else _delta_sync(state, tv)
+        with _lock: _locations[location] = state
+        return state
+    finally:
+        read_lock.release()
+
+def get(location):
+    """Inventory of `location` (columns COLUMNS, sorted by name_en). The caller gets its own copy."""
+    try: return _refresh(location)["view"].copy()
+    except RuntimeError:
+        # Serve the last good snapshot while the database is unreachable
+        with _lock: state = _locations.get(location)
+        return state["view"].copy() if state else pd.DataFrame(columns=COLUMNS)
+
+def version(location):
+    """Counter that changes whenever the indexed rows of `location` change."""
+    try: return _refresh(location)["version"]
+    except RuntimeError:
+        with _lock: state = _locations.get(location)
+        return state["version"] if state else 0
+
+def reset():
+    with _lock:
+        _locations.clear()
+
+def stats():
+    with _lock:
+        return {loc: {"rows": len(s["frame"]), "version": s["version"], "watermark": s["watermark"]} for loc, s in _locations.items()}
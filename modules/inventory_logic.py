@@ -2,42 +2,266 @@
 import streamlit as st
 import pandas as pd
 from sqlalchemy import text
-from modules.database import run_query, run_action, get_connection
+from modules import inventory_index
+from modules.config import LOW_STOCK_DEFAULT_MIN, LOCAL_COUNT_LOG
+from modules.reservations import release_and_sync, TABLES as RESERVATION_TABLES
+from modules.database import run_query, run_action, dialect_name, values_cte, write_session, execute_batch
 
 def get_inventory(location):
-    # Optimization: Cache inventory for short duration (10s) to balance freshness and speed
-    return run_query("SELECT name_en, category, unit, qty, location, status FROM inventory WHERE location = :loc ORDER BY name_en", params={"loc": location}, ttl=600)
+    # Served from the process-wide index (delta refresh on last_updated instead of a full re-read)
+    return inventory_index.get(location)
+
+STOCK_TABLES = ["inventory", "stock_logs", "low_stock_alerts"]  # Written by every stock mutation
+
+STOCK_LOG_INSERT = "INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit) VALUES (NOW(), :u, :act, :item, :loc, :chg, :nq, :unit)"
+
+def _apply_stock_change(s, item_name, location, change, user, action_desc, unit):
+    """Applies one delta atomically on session `s` and logs the resulting balance. Returns new qty (None if no such item)."""
+    params = {"u": user, "act": action_desc, "item": item_name, "loc": location, "chg": change, "unit": unit}
+    if dialect_name() == "postgresql":
+        # Single round trip: UPDATE ... RETURNING feeds the log row inside the same statement
+        return s.execute(text("""
+            WITH upd AS (
+                UPDATE inventory SET qty = qty + :chg, last_updated = NOW()
+                WHERE name_en = :item AND location = :loc
+                RETURNING qty
+            )
+            INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit)
+            SELECT NOW(), :u, :act, :item, :loc, :chg, upd.qty, :unit FROM upd
+            RETURNING new_qty
+        """), params).scalar()
+    # SQLite has no data-modifying CTEs: same transaction, two statements
+    new_qty = s.execute(text("UPDATE inventory SET qty = qty + :chg, last_updated = NOW() WHERE name_en = :item AND location = :loc RETURNING qty"), params).scalar()
+    if new_qty is not None:
+        s.execute(text(STOCK_LOG_INSERT), {**params, "nq": new_qty})
+    return new_qty
+
+def _apply_and_sync(s, item_name, location, change, user, action_desc, unit):
+    new_qty = _apply_stock_change(s, item_name, location, change, user, action_desc, unit)
+    if new_qty is not None: execute_batch(s, low_stock_sync_actions([(item_name, location)]))
+    return new_qty
+
+def create_item(name, category, unit, location, qty, user):
+    """
+    Adds an inventory row. A starting qty is logged as "Opening Stock", so the stock history
+    (stock_logs) accounts for every unit the item ever held. Returns (ok, message).
+    """
+    qty = int(qty)
+    try:
+        with write_session(STOCK_TABLES) as s:
+            s.execute(text("INSERT INTO inventory (name_en, category, unit, location, qty, status, last_updated) VALUES (:n, :c, :unit, :loc, :q, 'Available', NOW())"),
+                      {"n": name, "c": category, "unit": unit, "loc": location, "q": qty})
+            actions = low_stock_sync_actions([(name, location)])
+            if qty:
+                actions.insert(0, (STOCK_LOG_INSERT, {"u": user, "act": "Opening Stock", "item": name, "loc": location, "chg": qty, "nq": qty, "unit": unit}))
+            execute_batch(s, actions)
+        return True, "Success"
+    except Exception as e: return False, str(e)
 
 def update_central_stock(item_name, location, change, user, action_desc, unit):
     change = int(change)
-    # Use 0 TTL for writes/checks to ensure consistency
-    df = run_query("SELECT qty FROM inventory WHERE name_en = :name AND location = :loc", params={"name": item_name, "loc": location}, ttl=0)
-    if df.empty: return False, "Item not found"
-    current_qty = int(df.iloc[0]['qty'])
-    new_qty = current_qty + change
-    
-    conn = get_connection()
-    if not conn: return False, "Database connection failed"
-    
+    # The delta is applied by the database (no read-modify-write), so concurrent storekeepers can't lose updates
     try:
-        with conn.session as s:
-            s.execute(text("UPDATE inventory SET qty = :nq WHERE name_en = :name AND location = :loc"), {"nq": new_qty, "name": item_name, "loc": location})
-            s.execute(text("INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit) VALUES (NOW(), :u, :act, :item, :loc, :chg, :nq, :unit)"),
-                      {"u": user, "act": action_desc, "item": item_name, "loc": location, "chg": change, "nq": new_qty, "unit": unit})
-            s.commit()
-            st.cache_data.clear() # Manually clear cache since we used raw session
+        with write_session(STOCK_TABLES) as s:
+            new_qty = _apply_and_sync(s, item_name, location, change, user, action_desc, unit)
+        if new_qty is None: return False, "Item not found"
         return True, "Success"
     except Exception as e: return False, str(e)
 
+def _apply_stock_changes(s, changes):
+    """
+    Set-based version of _apply_stock_change on session `s`.
+    changes: list of dicts with item_name, location, change, user, action_desc, unit.
+    Deltas are summed per (item, location) and applied with one UPDATE; the logs get the
+    running balance of each individual change and go out as one multi-row insert.
+    Raises LookupError if any item does not exist. Returns {(item, location): final qty}.
+    """
+    totals = {}
+    for ch in changes:
+        key = (ch['item_name'], ch['location'])
+        totals[key] = totals.get(key, 0) + int(ch['change'])
+    cte, params = values_cte("v", ["name", "loc", "chg"], [(k[0], k[1], d) for k, d in totals.items()], {"chg": "INTEGER"})
+    rows = s.execute(text(f"""
+        WITH {cte}
+        UPDATE inventory SET qty = inventory.qty + v.chg, last_updated = NOW()
+        FROM v WHERE inventory.name_en = v.name AND inventory.location = v.loc
+        RETURNING name_en, location, qty
+    """), params).fetchall()
+    final = {(r[0], r[1]): int(r[2]) for r in rows}
+    missing = [k for k in totals if k not in final]
+    if missing: raise LookupError("Item not found: " + ", ".join(f"{i} ({l})" for i, l in missing))
+
+    running = {k: final[k] - totals[k] for k in totals} # Balance before this batch
+    logs = []
+    for ch in changes:
+        key = (ch['item_name'], ch['location'])
+        running[key] += int(ch['change'])
+        logs.append((STOCK_LOG_INSERT, {"u": ch['user'], "act": ch['action_desc'], "item": key[0], "loc": key[1],
+                                        "chg": int(ch['change']), "nq": running[key], "unit": ch.get('unit')}))
+    execute_batch(s, logs + low_stock_sync_actions(list(totals)))
+    return final
+
+def update_central_stock_many(changes):
+    """Applies a list of stock deltas (see _apply_stock_changes) all-or-nothing in one transaction."""
+    if not changes: return True, "Nothing to update"
+    try:
+        with write_session(STOCK_TABLES) as s:
+            _apply_stock_changes(s, changes)
+        return True, "Success"
+    except Exception as e: return False, str(e)
+
+def apply_stock_take(location, counts, user):
+    """
+    Applies a stock take: counts is a list of (item_name, system_qty_when_loaded, physical_count).
+    Each row only applies if inventory.qty still equals the qty the sheet was loaded with; the others
+    are reported as conflicts (recount them). Updates, logs and low-stock alerts go out as one
+    statement on Postgres (data-modifying CTEs); other backends run the same steps in one transaction.
+    Returns (ok, {"updated": n, "conflicts": [item_name, ...]}) or (False, error message).
+    """
+    latest = {name: (int(sys_q), int(phy)) for name, sys_q, phy in counts} # One row per item (last count wins)
+    rows = [(name, sys_q, phy) for name, (sys_q, phy) in latest.items() if sys_q != phy]
+    if not rows: return True, {"updated": 0, "conflicts": []}
+    cte, params = values_cte("v", ["name", "expected", "counted"], rows, {"name": "TEXT", "expected": "INTEGER", "counted": "INTEGER"})
+    params.update({"loc": location, "u": user, "dflt": LOW_STOCK_DEFAULT_MIN})
+    update_sql = f"""
+        UPDATE inventory SET qty = v.counted, last_updated = NOW()
+        FROM v WHERE inventory.name_en = v.name AND inventory.location = :loc AND inventory.qty = v.expected
+        RETURNING inventory.name_en, inventory.unit, inventory.qty, COALESCE(inventory.min_qty, :dflt) AS min_q, inventory.max_qty
+    """
+    try:
+        with write_session(STOCK_TABLES) as s:
+            if dialect_name() == "postgresql":
+                # One round trip: the alert changes are derived from the updated rows, not re-read
+                done = [r[0] for r in s.execute(text(f"""
+                    WITH {cte}, upd AS ({update_sql}),
+                    logs AS (
+                        INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit)
+                        SELECT NOW(), :u, 'Stock Take', name_en, :loc, upd.qty - v.expected, upd.qty, unit FROM upd JOIN v ON v.name = upd.name_en
+                    ),
+                    cleared AS (
+                        DELETE FROM low_stock_alerts a USING upd
+                        WHERE a.item_name = upd.name_en AND a.location = :loc AND upd.qty >= upd.min_q
+                    ),
+                    raised AS (
+                        INSERT INTO low_stock_alerts (location, item_name, qty, min_qty, max_qty, since)
+                        SELECT :loc, name_en, qty, min_q, max_qty, NOW() FROM upd WHERE qty < min_q
+                        ON CONFLICT (location, item_name) DO UPDATE SET qty = excluded.qty, min_qty = excluded.min_qty, max_qty = excluded.max_qty
+                    )
+                    SELECT name_en FROM upd
+                """), params).fetchall()]
+            else:
+                updated = s.execute(text(f"WITH {cte} {update_sql}"), params).fetchall()
+                done = [r[0] for r in updated]
+                execute_batch(s, [(STOCK_LOG_INSERT, {"u": user, "act": "Stock Take", "item": name, "loc": location,
+                                                      "chg": qty - latest[name][0], "nq": qty, "unit": unit})
+                                  for name, unit, qty, _, _ in updated]
+                              + low_stock_sync_actions([(n, location) for n in done]))
+        done = set(done)
+        return True, {"updated": len(done), "conflicts": [r[0] for r in rows if r[0] not in done]}
+    except Exception as e: return False, str(e)
+
 def transfer_stock(item_name, qty, user, unit):
-    qty = int(qty)
-    ok, msg = update_central_stock(item_name, "SNC", -qty, user, "Transfer Out", unit)
-    if not ok: return False, msg
-    df = run_query("SELECT * FROM inventory WHERE name_en = :n AND location = 'NSTC'", params={"n": item_name}, ttl=0)
-    if df.empty: run_action("INSERT INTO inventory (name_en, category, unit, qty, location) VALUES (:n, 'Transferred', :u, 0, 'NSTC')", params={"n": item_name, "u": unit})
-    ok2, msg2 = update_central_stock(item_name, "NSTC", qty, user, "Transfer In", unit)
-    if not ok2: return False, msg2
-    return True, "Transfer Complete"
+    ok, results = transfer_stock_many([{"item_name": item_name, "qty": qty, "unit": unit}], user)
+    return ok, ("Transfer Complete" if ok else results[0][2])
+
+def transfer_stock_many(lines, user, src="SNC", dst="NSTC"):
+    """
+    Moves several items from `src` to `dst` in one transaction (all lines or none).
+    lines: list of dicts with item_name, qty, unit.
+    Returns (ok, results) with one (item_name, ok, msg) tuple per input line.
+    """
+    if src == dst: return False, [(l['item_name'], False, "Source and destination are the same") for l in lines]
+    totals = {}
+    for l in lines:
+        totals[l['item_name']] = totals.get(l['item_name'], 0) + int(l['qty'])
+    if not totals: return True, []
+
+    try:
+        with write_session(STOCK_TABLES) as s:
+            # 1. Validate every line against locked source rows in one query
+            names = list(totals)
+            ph = ", ".join(f":n{i}" for i in range(len(names)))
+            avail = dict(s.execute(text(f"SELECT name_en, qty FROM inventory WHERE location = :src AND name_en IN ({ph}) FOR UPDATE"),
+                                   {"src": src, **{f"n{i}": n for i, n in enumerate(names)}}).fetchall())
+            errors = {}
+            for name, total in totals.items():
+                if total <= 0: errors[name] = "Quantity must be positive"
+                elif name not in avail: errors[name] = f"Not found in {src}"
+                elif total > avail[name]: errors[name] = f"Request {total} > Available {avail[name]}"
+            if errors:
+                s.rollback()
+                return False, [(l['item_name'], False, errors.get(l['item_name'], "Not moved (batch rejected)")) for l in lines]
+
+            # 2. Create missing destination rows in one upsert
+            units = {l['item_name']: l.get('unit') for l in lines}
+            execute_batch(s, [("INSERT INTO inventory (name_en, category, unit, qty, location) VALUES (:n, 'Transferred', :u, 0, :dst) ON CONFLICT (name_en, location) DO NOTHING",
+                               {"n": n, "u": units[n], "dst": dst}) for n in names])
+
+            # 3. Move everything with paired Transfer Out / Transfer In logs
+            changes = []
+            for l in lines:
+                base = {"item_name": l['item_name'], "user": user, "unit": l.get('unit')}
+                changes.append({**base, "location": src, "change": -int(l['qty']), "action_desc": "Transfer Out"})
+                changes.append({**base, "location": dst, "change": int(l['qty']), "action_desc": "Transfer In"})
+            _apply_stock_changes(s, changes)
+        return True, [(l['item_name'], True, "Transferred") for l in lines]
+    except Exception as e:
+        return False, [(l['item_name'], False, str(e)) for l in lines]
+
+# --- Reorder levels / low-stock alerts ---
+# low_stock_alerts holds exactly the rows with qty < COALESCE(min_qty, LOW_STOCK_DEFAULT_MIN).
+# Every stock mutation re-evaluates the keys it touched (low_stock_sync_actions), so reading
+# the alerts costs O(alerts) instead of a scan of the whole inventory.
+
+def low_stock_sync_actions(keys):
+    """(query, params) actions refreshing low_stock_alerts for (item_name, location) keys; run them in the mutation's transaction."""
+    keys = list(dict.fromkeys(keys))
+    if not keys: return []
+    cte, params = values_cte("k", ["name", "loc"], keys)
+    params["dflt"] = LOW_STOCK_DEFAULT_MIN
+    return [
+        (f"""WITH {cte}
+            DELETE FROM low_stock_alerts
+            WHERE EXISTS (SELECT 1 FROM k WHERE k.name = low_stock_alerts.item_name AND k.loc = low_stock_alerts.location)
+            AND NOT EXISTS (SELECT 1 FROM inventory i WHERE i.name_en = low_stock_alerts.item_name AND i.location = low_stock_alerts.location
+                            AND i.qty < COALESCE(i.min_qty, :dflt))""", params),
+        (f"""WITH {cte}
+            INSERT INTO low_stock_alerts (location, item_name, qty, min_qty, max_qty, since)
+            SELECT i.location, i.name_en, i.qty, COALESCE(i.min_qty, :dflt), i.max_qty, NOW()
+            FROM inventory i JOIN k ON i.name_en = k.name AND i.location = k.loc
+            WHERE i.qty < COALESCE(i.min_qty, :dflt)
+            ON CONFLICT (location, item_name) DO UPDATE SET qty = excluded.qty, min_qty = excluded.min_qty, max_qty = excluded.max_qty""", params),
+    ]
+
+def get_low_stock(location=None):
+    """Items under their reorder level, lowest first, with a suggested reorder qty (up to max_qty, else min_qty)."""
+    q = "SELECT location, item_name, qty, min_qty, max_qty, since FROM low_stock_alerts"
+    params = {}
+    if location:
+        q += " WHERE location = :loc"
+        params["loc"] = location
+    df = run_query(q + " ORDER BY qty ASC, item_name", params=params, ttl=60, tables=["low_stock_alerts"])
+    if not df.empty:
+        df['reorder_qty'] = (df['max_qty'].fillna(df['min_qty']) - df['qty']).clip(lower=0).astype(int)
+    return df
+
+def set_reorder_levels(location, levels):
+    """levels: list of (item_name, min_qty, max_qty) (None = default / no max). One UPDATE plus the alert sync."""
+    if not levels: return True, "Nothing to update"
+    levels = [(name, None if pd.isna(lo) else int(lo), None if pd.isna(hi) else int(hi)) for name, lo, hi in levels]
+    for name, lo, hi in levels:
+        if lo is not None and hi is not None and hi < lo: return False, f"'{name}': max below min"
+    cte, params = values_cte("v", ["name", "lo", "hi"], levels, {"lo": "INTEGER", "hi": "INTEGER"})
+    try:
+        with write_session(["inventory", "low_stock_alerts"]) as s:
+            s.execute(text(f"""
+                WITH {cte}
+                UPDATE inventory SET min_qty = v.lo, max_qty = v.hi
+                FROM v WHERE inventory.name_en = v.name AND inventory.location = :loc
+            """), {**params, "loc": location})
+            execute_batch(s, low_stock_sync_actions([(name, location) for name, _, _ in levels]))
+        return True, "Success"
+    except Exception as e: return False, str(e)
 
 def handle_external_transfer(item_name, my_loc, ext_proj, action, qty, user, unit):
     desc = f"Loan {action} {ext_proj}"
@@ -48,43 +272,124 @@ def receive_from_cww(item_name, dest_loc, qty, user, unit):
     return update_central_stock(item_name, dest_loc, int(qty), user, "Received from CWW", unit)
 
 def update_local_inventory(region, item_name, new_qty, user):
-    new_qty = int(new_qty)
-    # Check if record exists for this item in this region
-    df = run_query("SELECT id FROM local_inventory WHERE region = :r AND item_name = :i", params={"r": region, "i": item_name}, ttl=0)
-    if not df.empty:
-        return run_action("UPDATE local_inventory SET qty = :q, last_updated = NOW(), updated_by = :u WHERE region = :r AND item_name = :i", 
-                          params={"q": new_qty, "u": user, "r": region, "i": item_name})
-    else:
-        return run_action("INSERT INTO local_inventory (region, item_name, qty, last_updated, updated_by) VALUES (:r, :i, :q, NOW(), :u)", 
-                          params={"r": region, "i": item_name, "q": new_qty, "u": user})
+    ok, msg = update_local_inventory_many(region, [(item_name, new_qty)], user)
+    if not ok: st.error(f"DB Action Error: {msg}")
+    return ok
+
+def update_local_inventory_many(region, counts, user, log=LOCAL_COUNT_LOG):
+    """
+    Applies a branch count sheet in one transaction: counts is a list of (item_name, qty).
+    One multi-row INSERT ... ON CONFLICT (region, item_name) DO UPDATE; with `log`, the rows that
+    actually changed are also recorded in local_inventory_logs (old -> new).
+    Returns (ok, number of items written or error message).
+    """
+    latest = {item: int(q) for item, q in counts} # Last entry wins (an upsert can't touch a row twice)
+    if not latest: return True, 0
+    items = list(latest)
+    params = {"r": region, "u": user}
+    try:
+        with write_session(["local_inventory", "local_inventory_logs"]) as s:
+            old = {}
+            if log:
+                ph = ", ".join(f":i{n}" for n in range(len(items)))
+                old = dict(s.execute(text(f"SELECT item_name, qty FROM local_inventory WHERE region = :r AND item_name IN ({ph}) FOR UPDATE"),
+                                     {"r": region, **{f"i{n}": i for n, i in enumerate(items)}}).fetchall())
+                items = [i for i in items if old.get(i) != latest[i]] # Unchanged rows are not rewritten
+                if not items: return True, 0
+            values = []
+            for n, item in enumerate(items):
+                values.append(f"(:r, :i{n}, :q{n}, NOW(), :u)")
+                params.update({f"i{n}": item, f"q{n}": latest[item]})
+            s.execute(text(f"""
+                INSERT INTO local_inventory (region, item_name, qty, last_updated, updated_by)
+                VALUES {", ".join(values)}
+                ON CONFLICT (region, item_name) DO UPDATE SET qty = excluded.qty, last_updated = excluded.last_updated, updated_by = excluded.updated_by
+            """), params)
+            if log:
+                execute_batch(s, [("INSERT INTO local_inventory_logs (log_date, region, item_name, old_qty, new_qty, counted_by) VALUES (NOW(), :r, :i, :o, :q, :u)",
+                                   {"r": region, "i": i, "o": old.get(i), "q": latest[i], "u": user}) for i in items])
+        return True, len(items)
+    except Exception as e: return False, str(e)
 
 def create_request(supervisor, region, item, category, qty, unit):
     return run_action("INSERT INTO requests (supervisor_name, region, item_name, category, qty, unit, status, request_date) VALUES (:s, :r, :i, :c, :q, :u, 'Pending', NOW())",
                       params={"s": supervisor, "r": region, "i": item, "c": category, "q": int(qty), "u": unit})
 
-def update_request_details(req_id, new_qty, notes):
-    query = "UPDATE requests SET qty = :q"
-    params = {"q": int(new_qty), "id": req_id}
-    if notes is not None:
-        query += ", notes = :n"
-        params['n'] = notes
-    query += " WHERE req_id = :id"
-    return run_action(query, params)
-
-def update_request_status(req_id, status, final_qty=None, notes=None):
-    query = "UPDATE requests SET status = :s"
-    params = {"s": status, "id": req_id}
-    if final_qty is not None: 
-        query += ", qty = :q"
-        params["q"] = int(final_qty)
-    if notes is not None: 
-        query += ", notes = :n"
-        params["n"] = notes
-    query += " WHERE req_id = :id"
-    return run_action(query, params)
-
-def delete_request(req_id):
-    return run_action("DELETE FROM requests WHERE req_id = :id", params={"id": req_id})
+def apply_pending_request_changes(supervisor, updates=(), cancellations=()):
+    """
+    Applies a supervisor's edits to their own Pending requests in one transaction.
+    updates: list of (req_id, new_qty); cancellations: list of req_ids (deleted; wins over an update).
+    Rows that are no longer Pending (e.g. approved meanwhile) or belong to someone else are left alone.
+    Returns (ok, {req_id: outcome}) with outcome 'Updated', 'Cancelled', 'Invalid quantity' or 'Not pending'.
+    """
+    cancel = {int(r) for r in cancellations}
+    outcomes = {r: "Not pending" for r in cancel}
+    upd = []
+    for rid, q in updates:
+        rid = int(rid)
+        if rid in cancel: continue
+        if q is None or pd.isna(q) or int(q) < 1: outcomes[rid] = "Invalid quantity"
+        else:
+            upd.append((rid, int(q)))
+            outcomes[rid] = "Not pending"
+    try:
+        with write_session(["requests"]) as s:
+            if upd:
+                cte, params = values_cte("v", ["id", "q"], upd, {"id": "INTEGER", "q": "INTEGER"})
+                for (rid,) in s.execute(text(f"""
+                    WITH {cte}
+                    UPDATE requests SET qty = v.q FROM v
+                    WHERE requests.req_id = v.id AND requests.supervisor_name = :s AND requests.status = 'Pending'
+                    RETURNING req_id
+                """), {**params, "s": supervisor}).fetchall():
+                    outcomes[rid] = "Updated"
+            if cancel:
+                cte, params = values_cte("v", ["id"], [(r,) for r in cancel], {"id": "INTEGER"})
+                for (rid,) in s.execute(text(f"""
+                    WITH {cte}
+                    DELETE FROM requests
+                    WHERE req_id IN (SELECT id FROM v) AND supervisor_name = :s AND status = 'Pending'
+                    RETURNING req_id
+                """), {**params, "s": supervisor}).fetchall():
+                    outcomes[rid] = "Cancelled"
+        return True, outcomes
+    except Exception as e: return False, str(e)
+
+def issue_requests_bulk(lines, user, location="NSTC"):
+    """
+    Issues approved requests all-or-nothing in one transaction.
+    lines: list of (req_id, item_name, qty, unit, notes, region).
+    Quantities are summed per item and taken off the stock with one UPDATE; every line still gets
+    its own "Issued <region>" log with the running balance. The statuses flip in one UPDATE (only
+    rows still Approved) and the reservations of the issued requests are consumed.
+    The batch is rejected if a request is no longer Approved or an item would go negative.
+    Returns (ok, issued count or error message).
+    """
+    lines = [(int(rid), item, int(q), unit, notes, region) for rid, item, q, unit, notes, region in lines]
+    if not lines: return True, 0
+    if any(q <= 0 for _, _, q, _, _, _ in lines): return False, "Issue quantities must be positive"
+    try:
+        with write_session(STOCK_TABLES + ["requests"] + RESERVATION_TABLES) as s:
+            cte, params = values_cte("v", ["id", "q", "n"], [(rid, q, notes) for rid, _, q, _, notes, _ in lines],
+                                     {"id": "INTEGER", "q": "INTEGER", "n": "TEXT"})
+            done = {r[0] for r in s.execute(text(f"""
+                WITH {cte}
+                UPDATE requests SET status = 'Issued', qty = v.q, notes = v.n
+                FROM v WHERE requests.req_id = v.id AND requests.status = 'Approved'
+                RETURNING req_id
+            """), params).fetchall()}
+            stale = [rid for rid, *_ in lines if rid not in done]
+            if stale: raise ValueError(f"No longer approved (reload the list): {', '.join(map(str, stale))}")
+
+            final = _apply_stock_changes(s, [{"item_name": item, "location": location, "change": -q, "user": user,
+                                              "action_desc": f"Issued {region}", "unit": unit}
+                                             for _, item, q, unit, _, region in lines])
+            short = sorted(f"{item} ({qty})" for (item, _), qty in final.items() if qty < 0)
+            if short: raise ValueError(f"Insufficient stock, nothing issued: {', '.join(short)}")
+            # Issuing consumes the reservations made at approval
+            release_and_sync(s, list(done))
+        return True, len(lines)
+    except Exception as e: return False, str(e)
 
 def get_local_inventory_by_item(region, item_name):
     # Optimizing read-heavy view
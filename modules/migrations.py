@@ -0,0 +1,339 @@
+import os
+import sys
+import threading
+import argparse
+
+# Add the project root to the path so the CLI can import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from sqlalchemy import text
+
+# Versioned schema migrations.
+# Each step is (version, description, [statements]). A statement is either SQL text or a
+# callable(conn) for data migrations. Applied versions are recorded in `schema_version`;
+# NEVER edit a released step - append a new one instead.
+
+def _seed_low_stock_alerts(conn):
+    from modules.config import LOW_STOCK_DEFAULT_MIN
+    conn.execute(text("""
+        INSERT INTO low_stock_alerts (location, item_name, qty, min_qty, max_qty)
+        SELECT location, name_en, qty, COALESCE(min_qty, :d), max_qty FROM inventory WHERE qty < COALESCE(min_qty, :d)
+    """), {"d": LOW_STOCK_DEFAULT_MIN})
+
+def _backfill_opening_stock(conn):
+    # Items created before creation was logged: their qty is not explained by stock_logs, so
+    # log the difference as an opening balance dated with their first movement
+    conn.execute(text("""
+        INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit)
+        SELECT COALESCE(l.first_at, i.last_updated, NOW()), 'system', 'Opening Stock', i.name_en, i.location,
+               i.qty - COALESCE(l.total, 0), i.qty - COALESCE(l.total, 0), i.unit
+        FROM inventory i LEFT JOIN (
+            SELECT item_name, location, MIN(log_date) AS first_at, SUM(change_amount) AS total FROM stock_logs GROUP BY item_name, location
+        ) l ON l.item_name = i.name_en AND l.location = i.location
+        WHERE i.qty <> COALESCE(l.total, 0)
+    """))
+
+MIGRATIONS = [
+    (1, "Baseline schema", [
+        # Users Table
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            name TEXT,
+            role TEXT,
+            region TEXT,
+            shift_id INTEGER,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        # Inventory Table
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            id SERIAL PRIMARY KEY,
+            name_en TEXT NOT NULL,
+            category TEXT,
+            unit TEXT,
+            qty INTEGER DEFAULT 0,
+            location TEXT NOT NULL,
+            status TEXT,
+            last_updated TIMESTAMP DEFAULT NOW(),
+            UNIQUE(name_en, location)
+        );
+        """,
+        # Requests Table
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            req_id SERIAL PRIMARY KEY,
+            supervisor_name TEXT,
+            region TEXT,
+            item_name TEXT,
+            category TEXT,
+            qty INTEGER,
+            unit TEXT,
+            status TEXT,
+            request_date TIMESTAMP DEFAULT NOW(),
+            notes TEXT
+        );
+        """,
+        # Workers Table
+        """
+        CREATE TABLE IF NOT EXISTS workers (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            role TEXT,
+            region TEXT,
+            status TEXT DEFAULT 'Active',
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        # Shifts Table
+        """
+        CREATE TABLE IF NOT EXISTS shifts (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            start_time TEXT,
+            end_time TEXT
+        );
+        """,
+        # Attendance Table
+        """
+        CREATE TABLE IF NOT EXISTS attendance (
+            id SERIAL PRIMARY KEY,
+            worker_id INTEGER REFERENCES workers(id),
+            date DATE NOT NULL,
+            status TEXT,
+            shift_id INTEGER,
+            return_date DATE,
+            notes TEXT,
+            supervisor TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        # 4.2 Migration (Safe Add Columns)
+        "ALTER TABLE workers ADD COLUMN IF NOT EXISTS shift_id INTEGER;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS shift_id INTEGER;",
+        "ALTER TABLE workers ADD COLUMN IF NOT EXISTS emp_id TEXT;", # Add EMP ID
+        "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS last_updated TIMESTAMP DEFAULT NOW();", # Fix for UndefinedColumn error
+        # Performance Indexes
+        "CREATE INDEX IF NOT EXISTS idx_inv_loc ON inventory(location);",
+        "CREATE INDEX IF NOT EXISTS idx_inv_name ON inventory(name_en);",
+        "CREATE INDEX IF NOT EXISTS idx_workers_reg ON workers(region);",
+        "CREATE INDEX IF NOT EXISTS idx_att_date ON attendance(date);",
+        "CREATE INDEX IF NOT EXISTS idx_req_stat ON requests(status);",
+        # Support for Batch Upsert in Warehouse
+        "CREATE TABLE IF NOT EXISTS local_inventory (region TEXT, item_name TEXT, qty INTEGER, last_updated TIMESTAMP, updated_by TEXT);",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_local_inv_uniq ON local_inventory (region, item_name);",
+        # Stock Logs Table (Fix for UndefinedColumn)
+        """
+        CREATE TABLE IF NOT EXISTS stock_logs (
+            id SERIAL PRIMARY KEY,
+            log_date TIMESTAMP DEFAULT NOW(),
+            item_name TEXT,
+            change_amount INTEGER,
+            location TEXT,
+            action_by TEXT,
+            action_type TEXT,
+            unit TEXT,
+            new_qty INTEGER,
+            user_name TEXT -- Legacy support
+        );
+        """,
+        # Safe migrations for stock_logs
+        "ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS action_by TEXT;",
+        "ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS unit TEXT;",
+        "ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS new_qty INTEGER;",
+        "ALTER TABLE stock_logs ADD COLUMN IF NOT EXISTS user_name TEXT;",
+        # Audit Logs Table - Track all user actions
+        """
+        CREATE TABLE IF NOT EXISTS audit_logs (
+            id SERIAL PRIMARY KEY,
+            timestamp TIMESTAMP DEFAULT NOW(),
+            user_name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            details TEXT,
+            module TEXT
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_audit_time ON audit_logs(timestamp DESC);",
+    ]),
+    (2, "Keyset pagination indexes for log browsing", [
+        "CREATE INDEX IF NOT EXISTS idx_stock_logs_date_id ON stock_logs (log_date DESC, id DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_audit_time_id ON audit_logs (timestamp DESC, id DESC);",
+        "CREATE INDEX IF NOT EXISTS idx_workers_reg_id ON workers (region, id DESC);",
+    ]),
+    (3, "Inventory delta reads by last_updated", [
+        "UPDATE inventory SET last_updated = NOW() WHERE last_updated IS NULL;",
+        "CREATE INDEX IF NOT EXISTS idx_inv_loc_updated ON inventory (location, last_updated);",
+    ]),
+    (4, "Stock checkpoints for point-in-time stock", [
+        """
+        CREATE TABLE IF NOT EXISTS stock_checkpoints (
+            taken_at TIMESTAMP NOT NULL,
+            location TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            qty INTEGER,
+            PRIMARY KEY (location, taken_at, item_name)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stock_logs_loc_item_date ON stock_logs (location, item_name, log_date);",
+    ]),
+    (5, "Reorder levels and low-stock alert set", [
+        "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS min_qty INTEGER;",
+        "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS max_qty INTEGER;",
+        """
+        CREATE TABLE IF NOT EXISTS low_stock_alerts (
+            location TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            qty INTEGER,
+            min_qty INTEGER,
+            max_qty INTEGER,
+            since TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (location, item_name)
+        );
+        """,
+        _seed_low_stock_alerts,
+    ]),
+    (6, "Stock reservations for approved requests", [
+        "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS reserved_qty INTEGER DEFAULT 0;",
+        """
+        CREATE TABLE IF NOT EXISTS reservations (
+            req_id INTEGER PRIMARY KEY,
+            item_name TEXT NOT NULL,
+            location TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_reservations_item ON reservations (item_name, location);",
+        # Approved-but-not-issued requests already promise NSTC stock
+        "INSERT INTO reservations (req_id, item_name, location, qty) SELECT req_id, item_name, 'NSTC', qty FROM requests WHERE status = 'Approved' AND qty > 0;",
+        """
+        UPDATE inventory SET reserved_qty = COALESCE((
+            SELECT SUM(r.qty) FROM reservations r WHERE r.item_name = inventory.name_en AND r.location = inventory.location
+        ), 0);
+        """,
+    ]),
+    (7, "Branch inventory count log", [
+        """
+        CREATE TABLE IF NOT EXISTS local_inventory_logs (
+            id SERIAL PRIMARY KEY,
+            log_date TIMESTAMP DEFAULT NOW(),
+            region TEXT NOT NULL,
+            item_name TEXT NOT NULL,
+            old_qty INTEGER,
+            new_qty INTEGER,
+            counted_by TEXT
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_local_inv_logs_region_date ON local_inventory_logs (region, log_date DESC);",
+    ]),
+    (8, "Stock checkpoints carry a stock_logs id watermark", [
+        "ALTER TABLE stock_checkpoints ADD COLUMN IF NOT EXISTS log_id INTEGER;",
+        # Older checkpoints only have a timestamp and can't be split from the log exactly; the next
+        # ensure_checkpoint() takes a new one (until then history is replayed from the live stock)
+        "DELETE FROM stock_checkpoints WHERE log_id IS NULL;",
+        _backfill_opening_stock,
+    ]),
+]
+
+# Arbitrary app-wide key for pg_advisory_lock (serializes runners across server processes)
+ADVISORY_LOCK_KEY = 72_640_001
+
+_lock = threading.Lock()
+_applied = False
+_error = None  # Why the last ensure_schema() failed (shown by the app instead of running on a half-migrated schema)
+
+def _execute(conn, step):
+    if callable(step): step(conn)
+    else: conn.execute(text(step))
+
+def current_version(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT NOW()
+        );
+    """))
+    conn.commit()
+    return int(conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar() or 0)
+
+def apply_migrations(engine, log=print):
+    """Applies every pending migration (each version in its own transaction). Returns applied versions."""
+    applied = []
+    with engine.connect() as conn:
+        is_pg = conn.dialect.name == "postgresql"
+        if is_pg:
+            conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY})
+            conn.commit()
+        try:
+            # Re-read under the lock: another process may have migrated while we waited
+            version = current_version(conn)
+            for v, desc, steps in MIGRATIONS:
+                if v <= version: continue
+                try:
+                    for step in steps:
+                        _execute(conn, step)
+                    conn.execute(text("INSERT INTO schema_version (version, description) VALUES (:v, :d)"), {"v": v, "d": desc})
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    raise RuntimeError(f"migration {v} ({desc}) failed: {e}") from e
+                applied.append(v)
+                log(f"[DB Migration] Applied {v}: {desc}")
+        finally:
+            if is_pg:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+                conn.commit()
+    return applied
+
+def ensure_schema():
+    """Runs pending migrations once per server process (safe to call on every Streamlit rerun)."""
+    global _applied, _error
+    if _applied: return True
+    with _lock:
+        if _applied: return True
+        from modules.database import get_connection, clear_cache
+        c = get_connection()
+        if not c:
+            _error = "no database connection"
+            return False
+        try:
+            if apply_migrations(c.engine): clear_cache()
+            _applied, _error = True, None
+        except Exception as e:
+            _error = str(e)
+            print(f"[DB Migration] Failed: {e}")
+            return False
+    return True
+
+def schema_error():
+    """Reason the schema could not be brought up to date (None if it is current)."""
+    return _error
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply database schema migrations (run at deploy time).")
+    parser.add_argument("--url", default=os.environ.get("DATABASE_URL"), help="SQLAlchemy URL (default: $DATABASE_URL, else Streamlit secrets)")
+    parser.add_argument("--status", action="store_true", help="Only print the current and latest schema version")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        from modules.backends import engine_from_url
+        engine = engine_from_url(args.url) # e.g. sqlite:///warehouse.db for the embedded backend
+    else:
+        from modules.database import get_connection
+        c = get_connection()
+        if not c: return 1
+        engine = c.engine
+
+    if args.status:
+        with engine.connect() as conn:
+            print(f"Schema version: {current_version(conn)} (latest: {MIGRATIONS[-1][0]})")
+        return 0
+    applied = apply_migrations(engine)
+    print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
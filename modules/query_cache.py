@@ -0,0 +1,129 @@
+import re
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+# Process-wide result cache for run_query.
+# Every entry is tagged with the tables it reads so that a write only drops
+# the entries that depend on the tables it touched (instead of st.cache_data.clear()).
+
+MAX_ENTRIES = 2000
+
+_lock = threading.RLock()
+_entries = OrderedDict()          # key -> (expires_at, frame, tables)
+_tag_index = defaultdict(set)     # table -> {key, ...}
+_generations = defaultdict(int)   # table -> write counter
+_epoch = 0                        # bumped by clear()
+
+# Table names follow these keywords in the statements we issue
+_TABLE_RE = re.compile(
+    r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?|INDEX(?:\s+IF\s+NOT\s+EXISTS)?\s+\w+\s+ON)\s+'
+    r'(?:ONLY\s+)?("?[A-Za-z_][\w]*"?(?:\."?[A-Za-z_][\w]*"?)?)',
+    re.IGNORECASE
+)
+_SQL_WORDS = {"select", "values", "lateral", "only", "set", "where"}
+# FROM-clause scan for comma joins (FROM a x, b JOIN c ON ..., d): the regex only sees the first entry
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|[(),;]|\"?[A-Za-z_]\w*\"?(?:\.\"?[A-Za-z_]\w*\"?)?")
+_FROM_END = {"where", "group", "order", "limit", "having", "union", "intersect", "except", "returning", "window", "offset", "for"}
+
+def _comma_joined(query):
+    """Tables after a top-level comma in each FROM list (entries starting with '(' are subqueries, already scanned)."""
+    names = []
+    for m in re.finditer(r'\bFROM\b', query, re.IGNORECASE):
+        depth, after_comma = 0, False
+        for tok in _TOKEN_RE.finditer(query, m.end()):
+            t = tok.group(0)
+            if t == "(": depth += 1
+            elif t == ")":
+                depth -= 1
+                if depth < 0: break
+            elif depth > 0: continue
+            elif t == ";": break
+            elif t == ",": after_comma = True; continue
+            elif t.lower() in _FROM_END: break
+            elif after_comma and t.lower() not in ("only", "lateral"): names.append(t)
+            after_comma = False
+    return names
+
+def extract_tables(query):
+    """Best-effort list of table names referenced by a SQL statement."""
+    if not isinstance(query, str): query = str(query)
+    tables = set()
+    for name in _TABLE_RE.findall(query) + _comma_joined(query):
+        name = name.replace('"', '').split('.')[-1].lower()
+        if name and name not in _SQL_WORDS:
+            tables.add(name)
+    return frozenset(tables)
+
+def make_key(query, params=None):
+    if not params: return (query, ())
+    return (query, tuple(sorted((k, repr(v)) for k, v in params.items())))
+
+def _ttl_seconds(ttl):
+    if isinstance(ttl, timedelta): return ttl.total_seconds()
+    return float(ttl)
+
+def generation(tables):
+    """Snapshot of the write counters for `tables` (used to detect racing writes)."""
+    with _lock:
+        return (_epoch,) + tuple(_generations[t] for t in sorted(tables))
+
+def table_version(*tables):
+    """Monotonic version of the given tables; changes whenever one of them is written."""
+    with _lock:
+        return _epoch + sum(_generations[t] for t in tables)
+
+def get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None: return None
+        expires_at, frame, tables = entry
+        if expires_at < time.monotonic():
+            _drop(key)
+            return None
+        _entries.move_to_end(key)
+    return frame.copy()
+
+def put(key, frame, tables, ttl, snapshot=None):
+    with _lock:
+        # A write landed on one of our tables while the query was running: don't cache stale data
+        if snapshot is not None and snapshot != (_epoch,) + tuple(_generations[t] for t in sorted(tables)):
+            return
+        _drop(key)
+        _entries[key] = (time.monotonic() + _ttl_seconds(ttl), frame, frozenset(tables))
+        for t in tables: _tag_index[t].add(key)
+        while len(_entries) > MAX_ENTRIES:
+            _drop(next(iter(_entries)))
+
+def _drop(key):
+    entry = _entries.pop(key, None)
+    if entry is None: return
+    for t in entry[2]:
+        keys = _tag_index.get(t)
+        if keys is not None:
+            keys.discard(key)
+            if not keys: del _tag_index[t]
+
+def invalidate(tables):
+    """Drop cached results that read any of `tables`. Returns the number of entries dropped."""
+    tables = {t.lower() for t in tables}
+    dropped = 0
+    with _lock:
+        for t in tables:
+            _generations[t] += 1
+            for key in list(_tag_index.get(t, ())):
+                _drop(key)
+                dropped += 1
+    return dropped
+
+def clear():
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _entries.clear()
+        _tag_index.clear()
+
+def stats():
+    with _lock:
+        return {"entries": len(_entries), "tables": len(_tag_index)}
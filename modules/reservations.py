@@ -0,0 +1,56 @@
+from sqlalchemy import text
+from modules.database import values_cte, execute_batch
+
+# Stock reservations.
+# An approved request reserves its qty (one row per req_id in `reservations`, written by the Bulk
+# Review approval) and issuing consumes it. Rejections and cancellations only apply to Pending
+# requests, which hold no reservation. inventory.reserved_qty is the sum
+# of the reservations of that (item, location) and is re-synced only for the keys a change
+# touched, so available-to-promise (qty - reserved_qty) is a plain column read.
+# Every *_actions() helper returns (query, params) actions to run inside the caller's transaction.
+
+TABLES = ["reservations", "inventory"]
+
+def sync_reserved_actions(keys):
+    """Recomputes inventory.reserved_qty for (item_name, location) keys."""
+    keys = list(dict.fromkeys(keys))
+    if not keys: return []
+    cte, params = values_cte("k", ["name", "loc"], keys)
+    return [(f"""
+        WITH {cte}
+        UPDATE inventory SET last_updated = NOW(), reserved_qty = COALESCE((
+            SELECT SUM(r.qty) FROM reservations r WHERE r.item_name = inventory.name_en AND r.location = inventory.location
+        ), 0)
+        WHERE EXISTS (SELECT 1 FROM k WHERE k.name = inventory.name_en AND k.loc = inventory.location)
+    """, params)]
+
+def reserve_actions(rows, location="NSTC"):
+    """rows: (req_id, item_name, qty). Creates or replaces the reservation of each request."""
+    rows = [(int(rid), item, int(q)) for rid, item, q in rows if int(q) > 0]
+    if not rows: return []
+    cte, params = values_cte("v", ["id", "item", "q"], rows, {"id": "INTEGER", "q": "INTEGER"})
+    params["loc"] = location
+    return [(f"""
+        WITH {cte}
+        INSERT INTO reservations (req_id, item_name, location, qty)
+        SELECT id, item, :loc, q FROM v WHERE true
+        ON CONFLICT (req_id) DO UPDATE SET item_name = excluded.item_name, location = excluded.location, qty = excluded.qty
+    """, params)] + sync_reserved_actions([(item, location) for _, item, _ in rows])
+
+def release_actions(req_ids):
+    """Drops the reservations of `req_ids` (issued, rejected, cancelled or deleted requests)."""
+    ids = [int(r) for r in req_ids]
+    if not ids: return []
+    cte, params = values_cte("v", ["id"], [(r,) for r in ids], {"id": "INTEGER"})
+    return [(f"""
+        WITH {cte}
+        DELETE FROM reservations WHERE req_id IN (SELECT id FROM v)
+    """, params)]
+
+def release_and_sync(session, req_ids):
+    """Releases `req_ids` on an open session and re-syncs the reserved_qty of the affected items."""
+    ids = [int(r) for r in req_ids]
+    if not ids: return
+    cte, params = values_cte("v", ["id"], [(r,) for r in ids], {"id": "INTEGER"})
+    keys = session.execute(text(f"WITH {cte} SELECT item_name, location FROM reservations WHERE req_id IN (SELECT id FROM v)"), params).fetchall()
+    execute_batch(session, release_actions(ids) + sync_reserved_actions([tuple(k) for k in keys]))
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+
+# Add the project root to the path so the CLI can import modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+import pandas as pd
+from sqlalchemy import text
+from modules.database import run_query, write_session, dialect_name
+from modules.config import CHECKPOINT_INTERVAL_HOURS
+
+# Point-in-time ("as of") stock positions.
+# `stock_checkpoints` holds periodic copies of inventory.qty together with log_id, the highest
+# stock_logs.id the copy already contains. A historical position is the nearest checkpoint
+# (before or after the requested time, or the live inventory) plus / minus the logs the
+# checkpoint did / did not cover, so a query only scans the logs between two checkpoints however
+# long the history gets. Logs are split from a checkpoint by id, never by time: a log written in
+# the same instant as the checkpoint, or committed just after it, is counted exactly once.
+# Convention: the position "as of T" includes every log with log_date < T.
+
+_lock = threading.Lock()
+_checked_at = 0.0
+
+def _ts(at):
+    """A date means 'end of that day'; datetimes are used as-is."""
+    if isinstance(at, datetime): return at
+    if isinstance(at, date): return datetime.combine(at + timedelta(days=1), datetime.min.time())
+    return pd.Timestamp(at).to_pydatetime()
+
+def take_checkpoint():
+    """Snapshots every inventory row into stock_checkpoints, with the stock_logs high-watermark in the same transaction."""
+    try:
+        with write_session(["stock_checkpoints"]) as s:
+            taken_at = "NOW()"
+            if dialect_name() == "postgresql":
+                # Wait for in-flight stock writers (and hold off new ones) so every log up to the
+                # watermark is in the copy and none after it; stamp the copy once the lock is held
+                s.execute(text("LOCK TABLE stock_logs IN SHARE MODE"))
+                taken_at = "clock_timestamp()"
+            s.execute(text(f"""
+                INSERT INTO stock_checkpoints (taken_at, location, item_name, qty, log_id)
+                SELECT {taken_at}, location, name_en, qty, (SELECT COALESCE(MAX(id), 0) FROM stock_logs) FROM inventory
+            """))
+        return True
+    except Exception as e:
+        print(f"[Stock Checkpoint] Failed: {e}")
+        return False
+
+def ensure_checkpoint(max_age_hours=CHECKPOINT_INTERVAL_HOURS):
+    """Takes a checkpoint if the latest one is older than max_age_hours (checks the DB at most hourly)."""
+    global _checked_at
+    if time.monotonic() - _checked_at < 3600: return False
+    with _lock:
+        if time.monotonic() - _checked_at < 3600: return False
+        _checked_at = time.monotonic()
+        df = run_query(f"SELECT COUNT(*) AS n FROM stock_checkpoints WHERE taken_at > NOW() - INTERVAL '{int(max_age_hours)} hours'", ttl=0)
+        if df.empty or int(df.iloc[0]['n']) > 0: return False
+        return take_checkpoint()
+
+def _nearest_checkpoints(location, at):
+    """(taken_at, log_id) of the last checkpoint before `at` and of the first one at or after it (None = no such checkpoint)."""
+    df = run_query("""
+        SELECT 'before' AS side, taken_at, log_id FROM (
+            SELECT taken_at, log_id FROM stock_checkpoints WHERE location = :loc AND taken_at < :at ORDER BY taken_at DESC LIMIT 1
+        ) b
+        UNION ALL
+        SELECT 'after', taken_at, log_id FROM (
+            SELECT taken_at, log_id FROM stock_checkpoints WHERE location = :loc AND taken_at >= :at ORDER BY taken_at LIMIT 1
+        ) a
+    """, params={"loc": location, "at": at}, ttl=600, tables=["stock_checkpoints"])
+    if 'side' not in df.columns: return None, None
+    found = {side: (pd.Timestamp(t).to_pydatetime(), int(wm)) for side, t, wm in df[['side', 'taken_at', 'log_id']].itertuples(index=False, name=None)}
+    return found.get("before"), found.get("after")
+
+def _position_rows(location, at, item_name=None):
+    """
+    Picks the anchor closest to `at` and returns item_name/qty rows (several per item) whose sum per
+    item is the position as of `at`: the anchor's qty plus the signed logs between it and `at`.
+    Anchor and logs come from one statement, so they are read from one consistent snapshot.
+    """
+    params = {"loc": location, "item": item_name, "at": at}
+    item_sql = " AND item_name = :item" if item_name else ""
+    before, after = _nearest_checkpoints(location, at)
+    # The live inventory acts as a checkpoint taken "now" when there is none after `at`
+    candidates = [(at - before[0], "before", before)] if before else []
+    candidates.append((after[0] - at, "after", after) if after else (max(datetime.now() - at, timedelta(0)), "live", None))
+    _, kind, anchor = min(candidates, key=lambda c: c[0])
+
+    if kind == "live":
+        base = "SELECT name_en AS item_name, qty FROM inventory WHERE location = :loc" + (" AND name_en = :item" if item_name else "")
+        changes = f"SELECT item_name, -SUM(change_amount) AS qty FROM stock_logs WHERE location = :loc AND log_date >= :at{item_sql} GROUP BY item_name"
+        return run_query(f"{base} UNION ALL {changes}", params=params, ttl=0)
+    params.update(cp=anchor[0], wm=anchor[1])
+    base = f"SELECT item_name, qty FROM stock_checkpoints WHERE location = :loc AND taken_at = :cp{item_sql}"
+    if kind == "before": # Add what happened before `at` but after the copy
+        changes = f"SELECT item_name, SUM(change_amount) AS qty FROM stock_logs WHERE location = :loc AND id > :wm AND log_date < :at{item_sql} GROUP BY item_name"
+    else: # Take back what the copy already has but happened at or after `at`
+        changes = f"SELECT item_name, -SUM(change_amount) AS qty FROM stock_logs WHERE location = :loc AND id <= :wm AND log_date >= :at{item_sql} GROUP BY item_name"
+    return run_query(f"{base} UNION ALL {changes}", params=params, ttl=600, tables=["stock_checkpoints", "stock_logs"])
+
+def stock_as_of(location, at, item_name=None):
+    """Stock of `location` (or one item) as of `at` (date = end of that day). Columns: item_name, qty."""
+    rows = _position_rows(location, _ts(at), item_name)
+    if rows.empty or 'item_name' not in rows.columns: return pd.DataFrame(columns=["item_name", "qty"])
+    df = rows.groupby('item_name', as_index=False)['qty'].sum()
+    df['qty'] = pd.to_numeric(df['qty'], errors='coerce').fillna(0).astype(int)
+    return df[['item_name', 'qty']].sort_values('item_name').reset_index(drop=True)
+
+def stock_series(location, start, end, item_name=None):
+    """
+    End-of-day stock for every day in [start, end] (dates). Long format: date, item_name, qty.
+    One reconstruction at `start` plus one grouped read of the daily changes in the range.
+    """
+    start_ts = datetime.combine(start, datetime.min.time())
+    base = stock_as_of(location, start_ts, item_name).set_index('item_name')['qty']
+    item_sql = " AND item_name = :item" if item_name else ""
+    daily = run_query(f"""
+        SELECT CAST(log_date AS DATE) AS day, item_name, SUM(change_amount) AS chg FROM stock_logs
+        WHERE location = :loc AND log_date >= :s AND log_date < :e{item_sql}
+        GROUP BY CAST(log_date AS DATE), item_name
+    """, params={"loc": location, "s": start_ts, "e": _ts(end), "item": item_name}, ttl=600, tables=["stock_logs"])
+    days = pd.date_range(start, end, freq="D")
+    if daily.empty: grid = pd.DataFrame(0, index=days, columns=base.index)
+    else:
+        daily['day'] = pd.to_datetime(daily['day'])
+        grid = daily.pivot_table(index='day', columns='item_name', values='chg', aggfunc='sum').reindex(days)
+    grid = grid.reindex(columns=grid.columns.union(base.index)).fillna(0)
+    if grid.columns.empty: return pd.DataFrame(columns=["date", "item_name", "qty"])
+    grid = grid.cumsum() + base.reindex(grid.columns).fillna(0)
+    out = grid.rename_axis(index='date', columns='item_name').stack().rename('qty').reset_index()
+    out['qty'] = out['qty'].astype(int)
+    return out
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stock checkpoints and point-in-time stock.")
+    parser.add_argument("--checkpoint", action="store_true", help="Take a checkpoint now (schedule daily/weekly)")
+    parser.add_argument("--location", help="Print stock of this location...")
+    parser.add_argument("--as-of", help="...as of this date (YYYY-MM-DD, end of day)")
+    parser.add_argument("--item", help="Limit to one item")
+    args = parser.parse_args(argv)
+
+    if args.checkpoint:
+        print("Checkpoint taken." if take_checkpoint() else "Checkpoint failed.")
+    if args.location and args.as_of:
+        print(stock_as_of(args.location, date.fromisoformat(args.as_of), args.item).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,12 @@
 
+import os
+import csv
+import tempfile
 import streamlit as st
 import pandas as pd
 from io import BytesIO
+from datetime import datetime
+from modules.config import EXPORT_DIR, EXPORT_MAX_AGE_SECONDS, EXPORT_MAX_FILES
 
 def convert_df_to_excel(df, sheet_name="Sheet1"):
     output = BytesIO()
@@ -37,6 +42,59 @@ def convert_df_to_excel(df, sheet_name="Sheet1"):
         df_export.to_excel(writer, index=False, sheet_name=sheet_name)
     return output.getvalue()
 
+def _excel_safe(value):
+    # Excel cannot store timezone-aware datetimes
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+def sweep_exports(max_age=EXPORT_MAX_AGE_SECONDS, max_files=EXPORT_MAX_FILES):
+    """Deletes export files older than max_age seconds, then the oldest beyond max_files. Returns the number removed."""
+    try: entries = [e for e in os.scandir(EXPORT_DIR) if e.is_file() and e.name.startswith("export_")]
+    except FileNotFoundError: return 0
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    cutoff = datetime.now().timestamp() - max_age
+    removed = 0
+    for i, e in enumerate(entries):
+        if i >= max_files or e.stat().st_mtime < cutoff:
+            try:
+                os.remove(e.path)
+                removed += 1
+            except OSError: pass # Already gone / being served
+    return removed
+
+def export_query_to_file(query, params=None, fmt="xlsx", sheet_name="Sheet1", chunk_size=5000):
+    """
+    Streams a query straight into a temporary CSV / write-only XLSX file, chunk by chunk,
+    so memory stays flat regardless of the row count. Returns the file path (in EXPORT_DIR,
+    removed by sweep_exports() once it is older than EXPORT_MAX_AGE_SECONDS).
+    """
+    from modules.database import iter_query_chunks
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    sweep_exports(max_files=EXPORT_MAX_FILES - 1) # Bounded directory: old and surplus files go first
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="export_", dir=EXPORT_DIR)
+    os.close(fd)
+    if fmt == "csv":
+        with open(path, "w", newline="", encoding="utf-8-sig") as f: # BOM so Excel opens Arabic text correctly
+            writer = None
+            for columns, rows in iter_query_chunks(query, params, chunk_size):
+                if writer is None:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                writer.writerows(rows)
+    else:
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet_name)
+        header_written = False
+        for columns, rows in iter_query_chunks(query, params, chunk_size):
+            if not header_written:
+                ws.append(columns); header_written = True
+            for row in rows:
+                ws.append([_excel_safe(v) for v in row])
+        wb.save(path)
+    return path
+
 def setup_styles():
     st.markdown("""
         <style>
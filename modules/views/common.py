@@ -1,27 +1,60 @@
 
+import os
 import streamlit as st
 import time
-from modules.inventory_logic import get_inventory, update_central_stock
-from modules.database import run_batch_action, get_connection
+import threading
+from collections import OrderedDict
+from datetime import date
+from modules.inventory_logic import get_inventory, apply_stock_take
+from modules.database import get_connection, fetch_page, page_key
+from modules.utils import export_query_to_file
+from modules import query_cache
+from modules.config import CHANGE_FEED_WATCH_SECONDS
 from sqlalchemy import text
 
+def stock_take_sheet(location, sheet_key):
+    """
+    The stock-take sheet of `location` as this session first loaded it (None if the location is empty).
+    It stays frozen until it is applied or reloaded: a rerun (the submit is one) must not swap in newer
+    system qtys, which are the expected qtys of the apply, or move the editor's row positions onto other items.
+    """
+    sheet = st.session_state.get(sheet_key)
+    if sheet is None:
+        inv = get_inventory(location)
+        if inv.empty: return None
+        sheet = inv[['name_en', 'category', 'qty', 'unit']].rename(columns={'qty': 'System Qty', 'name_en': 'Item Name'}).reset_index(drop=True)
+        sheet['Physical Count'] = sheet['System Qty']
+        st.session_state[sheet_key] = sheet
+    return sheet
+
+def reset_stock_take_sheet(sheet_key):
+    """Drops the loaded sheet; the next render reads the stock again into a fresh editor."""
+    st.session_state.pop(sheet_key, None)
+    st.session_state[f"{sheet_key}_rev"] = st.session_state.get(f"{sheet_key}_rev", 0) + 1
+
+def stock_take_counts(sheet, edited, editor_key):
+    """(item_name, system qty as loaded, physical count) of the rows counted differently from the loaded sheet."""
+    changed = changed_rows(sheet, edited, ['Physical Count'], editor_key)
+    changed = changed[changed['Physical Count'] != changed['System Qty']]
+    return list(zip(changed['Item Name'], changed['System Qty'], changed['Physical Count']))
+
 @st.fragment
 def render_bulk_stock_take(location, user_name, key_prefix):
-    inv = get_inventory(location)
-    if inv.empty:
+    sheet_key = f"stock_sheet_{key_prefix}_{location}"
+    df_view = stock_take_sheet(location, sheet_key)
+    if df_view is None:
         st.info(f"No inventory found in {location}")
         return
+    editor_key = f"stock_editor_{key_prefix}_{location}_{st.session_state.get(f'{sheet_key}_rev', 0)}"
 
-    df_view = inv[['name_en', 'category', 'qty', 'unit']].copy()
-    df_view.rename(columns={'qty': 'System Qty', 'name_en': 'Item Name'}, inplace=True)
-    df_view['Physical Count'] = df_view['System Qty'] 
-
-    st.markdown(f"### 📋 {location} Stock Take")
+    c1, c2 = st.columns([4, 1])
+    c1.markdown(f"### 📋 {location} Stock Take")
+    c2.button("🔄 Reload Sheet", key=f"{sheet_key}_reload", width="stretch", on_click=reset_stock_take_sheet, args=(sheet_key,))
     
     with st.form(key=f"stock_form_{key_prefix}_{location}"):
         edited_df = st.data_editor(
             df_view,
-            key=f"stock_editor_{key_prefix}_{location}",
+            key=editor_key,
             column_config={
                 "Item Name": st.column_config.TextColumn(disabled=True),
                 "category": st.column_config.TextColumn(disabled=True),
@@ -38,36 +71,139 @@ def render_bulk_stock_take(location, user_name, key_prefix):
         submitted = st.form_submit_button(f"💾 Update {location} Stock", width="stretch")
     
     if submitted:
-        # Collect all changes for batch processing (performance optimization)
-        batch_cmds = []
-        changes_count = 0
-        
-        for index, row in edited_df.iterrows():
-            sys_q = int(row['System Qty'])
-            phy_q = int(row['Physical Count'])
-            if sys_q != phy_q:
-                diff = phy_q - sys_q
-                item_name = row['Item Name']
-                unit = row['unit']
-                
-                # Update inventory
-                batch_cmds.append((
-                    "UPDATE inventory SET qty = qty + :diff, last_updated = NOW() WHERE name_en = :name AND location = :loc",
-                    {"diff": diff, "name": item_name, "loc": location}
-                ))
-                # Log the change
-                batch_cmds.append((
-                    "INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit) VALUES (NOW(), :u, 'Stock Take', :item, :loc, :diff, :nq, :unit)",
-                    {"u": user_name, "item": item_name, "loc": location, "diff": diff, "nq": phy_q, "unit": unit}
-                ))
-                changes_count += 1
-        
-        if changes_count > 0:
-            if run_batch_action(batch_cmds):
-                st.toast(f"✅ Updated {changes_count} items in {location}!")
-                time.sleep(1); st.rerun()
-            else:
-                st.error("Failed to update stock. Please try again.")
-        else:
+        # Only rows touched in the editor, compared with the system qty the sheet was loaded with
+        counts = stock_take_counts(df_view, edited_df, editor_key)
+        if not counts:
             st.info("No changes detected.")
+            return
+        ok, res = apply_stock_take(location, counts, user_name)
+        if not ok:
+            st.error(f"Failed to update stock: {res}")
+            return
+        reset_stock_take_sheet(sheet_key) # The next sheet shows the current stock (conflicting rows get recounted there)
+        if res['conflicts']:
+            st.warning(f"⚠️ Stock moved while counting, not applied (recount): {', '.join(res['conflicts'])}")
+        if res['updated']:
+            st.toast(f"✅ Updated {res['updated']} items in {location}!")
+            time.sleep(1); st.rerun()
+
+def changed_rows(original, edited, columns, editor_key=None):
+    """
+    Rows of a st.data_editor result whose `columns` differ from the frame it was given (NaN == NaN).
+    With editor_key, only the rows the editor reports as edited are compared.
+    """
+    candidates = edited
+    state = st.session_state.get(editor_key) if editor_key else None
+    if isinstance(state, dict) and "edited_rows" in state:
+        candidates = edited.iloc[sorted(int(i) for i in state["edited_rows"])]
+    if candidates.empty: return candidates
+    before = original.loc[candidates.index, columns]
+    after = candidates[columns]
+    same = (after == before) | (after.isna() & before.isna())
+    return candidates[~same.all(axis=1)]
+
+@st.fragment(run_every=CHANGE_FEED_WATCH_SECONDS)
+def _table_watcher(tables, state_key, message):
+    if query_cache.table_version(*tables) == st.session_state.get(state_key): return
+    c1, c2 = st.columns([4, 1])
+    c1.info(message)
+    if c2.button("🔄 Refresh", key=f"{state_key}_refresh", width="stretch"): st.rerun(scope="app")
+
+def watch_tables(tables, key, message="🔔 New changes are available."):
+    """
+    Shows `message` with a Refresh button within CHANGE_FEED_WATCH_SECONDS of a write to `tables`,
+    by this process or (through the change feed) another one. Only in-memory versions are
+    compared, no query. The page is never rerun on its own, so open forms keep their input.
+    Call it before the page reads its data.
+    """
+    state_key = f"watch_{key}"
+    st.session_state[state_key] = query_cache.table_version(*tables)
+    _table_watcher(tuple(tables), state_key, message)
+
+def _pager_nav(state_key, table, direction, df):
+    state = st.session_state[state_key]
+    if direction == "older":
+        state.update(after=page_key(df, table, "last"), before=None, page=state["page"] + 1)
+    else:
+        state.update(after=None, before=page_key(df, table, "first"), page=max(1, state["page"] - 1))
+
+def render_paged_table(table, key, filters=None, page_size=50, **df_kwargs):
+    """
+    Keyset-paginated table with Newer/Older navigation (constant cost per page).
+    Returns the DataFrame of the page being shown.
+    """
+    state_key = f"pager_{key}"
+    sig = repr(sorted((filters or {}).items(), key=lambda kv: kv[0]))
+    state = st.session_state.setdefault(state_key, {"after": None, "before": None, "page": 1, "filters": sig})
+    if state["filters"] != sig or state["page"] == 1: # New filters (or back at the top): start from the newest rows
+        state.update(after=None, before=None, page=1, filters=sig)
+
+    df, has_more = fetch_page(table, filters, after=state["after"], before=state["before"], limit=page_size)
+    if state["before"] is not None and len(df) < page_size:
+        # Walked back past the newest rows: show the first page instead of a partial one
+        state.update(after=None, before=None, page=1)
+        df, has_more = fetch_page(table, filters, limit=page_size)
+    can_older = has_more if state["before"] is None else True
+
+    if df.empty: st.info("No records found")
+    else: st.dataframe(df, width="stretch", **df_kwargs)
+
+    c1, c2, c3 = st.columns([1, 2, 1])
+    c1.button("⬅️ Newer", key=f"{key}_newer", disabled=state["page"] <= 1, width="stretch",
+              on_click=_pager_nav, args=(state_key, table, "newer", df))
+    c2.caption(f"Page {state['page']} · {len(df)} rows")
+    c3.button("Older ➡️", key=f"{key}_older", disabled=not can_older or df.empty, width="stretch",
+              on_click=_pager_nav, args=(state_key, table, "older", df))
+    return df
+
+EXPORT_MIME = {"xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "csv": "text/csv"}
+
+def render_stream_export(label, query, params, file_name, key, fmt="xlsx", sheet_name="Sheet1"):
+    """
+    Two-step export: "Prepare" streams the query into a temp file (server-side cursor, constant
+    memory), then a download button serves that file. Nothing is built until asked for.
+    """
+    state_key = f"export_{key}"
+    if st.button(f"⚙️ Prepare {label}", key=f"{key}_prepare"):
+        old = st.session_state.pop(state_key, None)
+        if old and os.path.exists(old): os.remove(old)
+        with st.spinner("Exporting..."):
+            st.session_state[state_key] = export_query_to_file(query, params, fmt, sheet_name)
+    path = st.session_state.get(state_key)
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            st.download_button(f"📥 {label}", f, file_name, EXPORT_MIME.get(fmt), key=f"{key}_download")
+
+def lazy_tabs(labels, key):
+    """
+    Tab strip that only runs the selected section (st.tabs executes every tab body on each rerun).
+    Returns the selected label:  `if lazy_tabs([...], "k") == "Reports": ...`
+    """
+    return st.radio(key, labels, key=key, horizontal=True, label_visibility="collapsed")
+
+EXPORT_CACHE_MAX = 32
+EXPORT_CACHE_TTL = 3600  # Seconds; also bounds exports of data that moves without a write (rolling date windows)
+_export_cache = OrderedDict()  # (key, data version, day) -> (expires_at, file bytes)
+_export_lock = threading.Lock()
 
+def render_lazy_download(label, build, file_name, key, tables, fmt="xlsx", ttl=EXPORT_CACHE_TTL):
+    """
+    Download button whose file is built by `build()` only when it is clicked. The bytes are kept
+    (process-wide) until one of `tables` is written, the day changes or `ttl` seconds pass, so
+    repeated downloads of unchanged data are free.
+    """
+    cache_key = (key, query_cache.table_version(*tables), date.today())
+    def data():
+        now = time.monotonic()
+        with _export_lock:
+            entry = _export_cache.get(cache_key)
+            if entry and entry[0] > now:
+                _export_cache.move_to_end(cache_key)
+                return entry[1]
+        out = build()
+        with _export_lock:
+            _export_cache[cache_key] = (now + ttl, out)
+            _export_cache.move_to_end(cache_key)
+            while len(_export_cache) > EXPORT_CACHE_MAX: _export_cache.popitem(last=False)
+        return out
+    st.download_button(label, data, file_name, EXPORT_MIME.get(fmt), key=key)
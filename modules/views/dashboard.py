@@ -1,47 +1,44 @@
-
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from modules.database import run_query
-from modules.config import AREAS
+from modules import dashboard_snapshot
+from modules.config import DASHBOARD_REFRESH_SECONDS
 
-@st.fragment(run_every=30)  # Auto-refresh every 30 seconds
+@st.fragment(run_every=DASHBOARD_REFRESH_SECONDS)  # Re-renders the shared snapshot (no queries of its own)
 def manager_dashboard():
     st.header("📊 Executive Dashboard")
-    st.caption("🔄 Auto-refreshes every 30 seconds")
+    snap = dashboard_snapshot.get()
+    if snap is None:
+        st.error("Dashboard data is unavailable right now.")
+        return
+    m, figures = snap['metrics'], snap['figures']
+    st.caption(f"🔄 Auto-refreshes every {int(DASHBOARD_REFRESH_SECONDS)} seconds · updated {snap['computed_at']:%H:%M:%S}")
     
     # --- Top Metrics Row ---
     col1, col2, col3, col4 = st.columns(4)
     
     # 1. Total Workers
-    workers = run_query("SELECT count(*) as count FROM workers WHERE status='Active'")
-    w_count = workers.iloc[0]['count'] if not workers.empty else 0
+    w_count = m['active_workers']
     col1.metric("👷 Active Workers", w_count)
     
     # 2. Today's Attendance Rate
-    today = pd.Timestamp.now().strftime('%Y-%m-%d')
-    att = run_query("SELECT status FROM attendance WHERE date = :d", {"d": today})
-    if not att.empty:
-        present = len(att[att['status'] == 'Present'])
+    if m['attendance_today'] > 0:
+        present = m['present_today']
         rate = round((present / w_count * 100), 1) if w_count > 0 else 0
         col2.metric("✅ Attendance Rate", f"{rate}%", f"{present} / {w_count}")
     else:
         col2.metric("✅ Attendance Rate", "0%", "No Data Today")
 
     # 3. Pending Requests
-    reqs = run_query("SELECT count(*) as count FROM requests WHERE status='Pending'")
-    r_count = reqs.iloc[0]['count'] if not reqs.empty else 0
-    col3.metric("📝 Pending Requests", r_count)
+    col3.metric("📝 Pending Requests", m['pending_requests'], f"{m['reserved_units']} units reserved ({m['reserved_lines']} approved)", delta_color="off")
     
-    # 4. Low Stock Alerts
-    low_stock = run_query("SELECT name_en, qty, location FROM inventory WHERE qty < 10 ORDER BY qty ASC")
-    ls_count = len(low_stock) if not low_stock.empty else 0
+    # 4. Low Stock Alerts (maintained incrementally by the stock mutations)
+    low_stock = snap['low_stock']
+    ls_count = len(low_stock)
     col4.metric("⚠️ Low Stock Items", ls_count)
     
     # Show low stock details if any
     if ls_count > 0:
         with st.expander(f"🚨 Low Stock Details ({ls_count} items)", expanded=True):
-            st.dataframe(low_stock, width="stretch", hide_index=True)
+            st.dataframe(low_stock[['item_name', 'qty', 'min_qty', 'reorder_qty', 'location']], width="stretch", hide_index=True)
     
     st.divider()
     
@@ -50,32 +47,15 @@ def manager_dashboard():
     
     with c1:
         st.subheader("👥 Workers by Region")
-        w_reg = run_query("SELECT region, count(*) as count FROM workers WHERE status='Active' GROUP BY region")
-        if not w_reg.empty:
-            fig = px.pie(w_reg, values='count', names='region', hole=0.4)
-            st.plotly_chart(fig, width="stretch")
+        if 'workers_by_region' in figures: st.plotly_chart(figures['workers_by_region'], width="stretch")
         else: st.info("No worker data")
         
     with c2:
         st.subheader("📦 Top 10 Stock Items (NSTC)")
-        stock = run_query("SELECT name_en as item, qty FROM inventory WHERE location='NSTC' ORDER BY qty DESC LIMIT 10")
-        if not stock.empty:
-            fig = px.bar(stock, x='item', y='qty', color='qty', color_continuous_scale='Blues')
-            fig.update_layout(xaxis_tickangle=-45)
-            st.plotly_chart(fig, width="stretch")
+        if 'top_stock' in figures: st.plotly_chart(figures['top_stock'], width="stretch")
         else: st.info("No stock data")
 
     # --- Charts Row 2 ---
     st.subheader("📈 Attendance Trend (Last 7 Days)")
-    trend = run_query("""
-        SELECT date, count(*) as present_count 
-        FROM attendance 
-        WHERE status='Present' AND date >= CURRENT_DATE - INTERVAL '7 days' 
-        GROUP BY date 
-        ORDER BY date
-    """)
-    if not trend.empty:
-        fig_line = px.line(trend, x='date', y='present_count', markers=True)
-        st.plotly_chart(fig_line, width="stretch")
+    if 'attendance_trend' in figures: st.plotly_chart(figures['attendance_trend'], width="stretch")
     else: st.info("No attendance history")
-
@@ -3,9 +3,9 @@ import streamlit as st
 import pandas as pd
 import time
 from datetime import datetime
-from modules.database import run_query, run_action, run_batch_action
+from modules.database import run_query, run_action, run_batch_action, update_rows
 from modules.config import AREAS, ATTENDANCE_STATUSES
-from modules.utils import convert_df_to_excel
+from modules.views.common import render_paged_table, render_stream_export, changed_rows, lazy_tabs
 
 # ==========================================
 # ============ MANAGER VIEW (MANPOWER) =====
@@ -13,9 +13,10 @@ from modules.utils import convert_df_to_excel
 @st.fragment
 def manager_view_manpower():
     st.header("👷‍♂️ Manpower Project Management")
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Reports", "👥 Worker Database", "⏰ Duty Roster / Shifts", "📍 Supervisors"])
+    # Only the selected section runs its queries
+    section = lazy_tabs(["📊 Reports", "👥 Worker Database", "⏰ Duty Roster / Shifts", "📍 Supervisors"], "mgr_mp_section")
 
-    with tab2: # Worker Database
+    if section == "👥 Worker Database":
         st.subheader("Manage Workers")
         
         # Search box for workers
@@ -38,8 +39,16 @@ def manager_view_manpower():
             ]
         
         if not workers.empty:
-            excel_data = convert_df_to_excel(workers, "Workers")
-            st.download_button("📥 Export Worker List", excel_data, "workers_list.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            export_sql = """
+                SELECT w.id, w.created_at, w.name, w.emp_id, w.role, w.region, w.status, w.shift_id, s.name as shift_name 
+                FROM workers w 
+                LEFT JOIN shifts s ON w.shift_id = s.id 
+            """
+            export_params = {}
+            if worker_search:
+                export_sql += " WHERE w.name ILIKE :q OR w.emp_id ILIKE :q"
+                export_params["q"] = f"%{worker_search}%"
+            render_stream_export("Export Worker List", export_sql + " ORDER BY w.id DESC", export_params, "workers_list.xlsx", "workers_list", sheet_name="Workers")
         
         # Add Worker
         with st.expander("➕ Add New Worker", expanded=True):
@@ -149,23 +158,22 @@ def manager_view_manpower():
                     submitted = st.form_submit_button("💾 Save Worker Changes", width="stretch")
                 
                 if submitted:
-                    changes = 0
-                    for index, row in edited_w.iterrows():
-                        # Basic validation
-                        eid = str(row['emp_id']) if row['emp_id'] else ""
-                        if eid and not eid.isdigit():
-                                st.error(f"Invalid EMP ID for {row['name']}: Numbers only."); continue
-                        
-                        # Resolve Shift ID
-                        new_sid = s_lookup.get(row['shift_name'])
-                        
-                        run_action("UPDATE workers SET name=:n, emp_id=:e, role=:r, region=:reg, status=:s, shift_id=:sid WHERE id=:id",
-                                   {"n":row['name'], "e":eid, "r":row['role'], "reg":row['region'], "s":row['status'], "sid":new_sid, "id":row['id']})
-                        changes += 1
-                    if changes > 0: st.success("Updated"); time.sleep(1); st.rerun()
+                    # Only rows whose editable cells changed are validated and written
+                    changed = changed_rows(w_df, edited_w, ["name", "emp_id", "role", "region", "status", "shift_name"], "worker_editor")
+                    if changed.empty: st.info("No changes detected.")
+                    else:
+                        eid = changed['emp_id'].fillna("").astype(str).str.strip()
+                        bad = eid.ne("") & ~eid.str.fullmatch(r"\d+")
+                        for name in changed.loc[bad, 'name']: st.error(f"Invalid EMP ID for {name}: Numbers only.")
+                        rows = changed.loc[~bad, ['id', 'name', 'role', 'region', 'status']].assign(
+                            emp_id=eid[~bad], shift_id=changed.loc[~bad, 'shift_name'].map(s_lookup).astype("Int64"))
+                        ok, res = update_rows("workers", "id", rows, {"id": "INTEGER", "shift_id": "INTEGER", "name": "TEXT", "emp_id": "TEXT",
+                                                                   "role": "TEXT", "region": "TEXT", "status": "TEXT"})
+                        if not ok: st.error(f"DB Action Error: {res}")
+                        elif res > 0: st.success(f"Updated {res} workers"); time.sleep(1); st.rerun()
             render_worker_edit(workers, shifts_lookup, shift_names_list)
 
-    with tab3: # Shifts
+    elif section == "⏰ Duty Roster / Shifts":
         st.subheader("⏰ Shift Management (Duty Roster)")
         shifts = run_query("SELECT * FROM shifts ORDER BY id") # Real-time here as we might benefit from instant updates during editing
         
@@ -180,12 +188,12 @@ def manager_view_manpower():
                         s_str = ss.strftime("%H:%M")
                         e_str = se.strftime("%H:%M")
                         run_action("INSERT INTO shifts (name, start_time, end_time) VALUES (:n, :s, :e)", {"n":sn, "s":s_str, "e":e_str})
-                        st.success("Shift Added"); st.cache_data.clear(); st.rerun()
+                        st.success("Shift Added"); st.rerun()
 
         if not shifts.empty:
             st.data_editor(shifts, key="shift_editor", disabled=["id"], hide_index=True, width="stretch")
             
-    with tab4: # Supervisors
+    elif section == "📍 Supervisors":
         st.subheader("📍 Supervisor Management")
         # Fetch all users who are not managers
         supervisors = run_query("SELECT username, name, region, role, shift_id FROM users WHERE role != 'manager' ORDER BY name")
@@ -227,25 +235,26 @@ def manager_view_manpower():
                         new_sid = s_opts.get(new_shift_name)
                         if run_action("UPDATE users SET region=:r, shift_id=:sid, role=:role WHERE username=:u", 
                                   {"r": new_reg_str, "sid":new_sid, "role":new_role, "u": selected_sup_u}):
-                            st.success(f"Updated {current_row['name']}"); st.cache_data.clear(); time.sleep(1); st.rerun()
+                            st.success(f"Updated {current_row['name']}"); time.sleep(1); st.rerun()
             
             st.divider()
             st.dataframe(supervisors[['username', 'name', 'role', 'region']], width="stretch", hide_index=True)
 
-    with tab1: # Reports
+    elif section == "📊 Reports":
         st.subheader("📊 Daily Attendance Report")
         
         # Date Selection
         report_date = st.date_input("Select Date", datetime.now()).strftime("%Y-%m-%d")
         
         # Fetch Data
-        df = run_query("""
+        attendance_sql = """
             SELECT w.name, w.region, w.role, a.status, s.name as shift, a.notes 
             FROM attendance a 
             JOIN workers w ON a.worker_id = w.id 
             LEFT JOIN shifts s ON a.shift_id = s.id
             WHERE a.date = :d
-        """, {"d": report_date})
+        """
+        df = run_query(attendance_sql, {"d": report_date})
         
         if df.empty:
             st.info(f"No attendance records for {report_date}.")
@@ -268,12 +277,11 @@ def manager_view_manpower():
                         reg_df = df[df['region'] == region]
                         st.dataframe(reg_df, width="stretch", hide_index=True)
                         
-                        xl = convert_df_to_excel(reg_df, "Attendance")
-                        st.download_button(f"📥 Export {region} Report", xl, f"attendance_{region}_{report_date}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key=f"dl_{region}")
+                        render_stream_export(f"Export {region} Report", attendance_sql + " AND w.region = :r", {"d": report_date, "r": region},
+                                             f"attendance_{region}_{report_date}.xlsx", f"dl_{region}", sheet_name="Attendance")
             else:
                  st.dataframe(df, width="stretch")
-                 xl = convert_df_to_excel(df, "Attendance")
-                 st.download_button("📥 Export Report", xl, f"attendance_{report_date}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+                 render_stream_export("Export Report", attendance_sql, {"d": report_date}, f"attendance_{report_date}.xlsx", "dl_attendance", sheet_name="Attendance")
 
 # ==========================================
 # ============ SUPERVISOR VIEW (MANPOWER) ==
@@ -369,19 +377,20 @@ def supervisor_view_manpower():
                     )
                     
                     if st.form_submit_button("💾 Submit Attendance"):
-                        batch_cmds = []
+                        delete_cmds, insert_cmds = [], []
                         for i, row in edited_att.iterrows():
                             # 1. Delete Existing using TARGET SHIFT ID (where the record belongs)
-                            batch_cmds.append(("DELETE FROM attendance WHERE worker_id=:wid AND date=:d AND shift_id=:sid", 
+                            delete_cmds.append(("DELETE FROM attendance WHERE worker_id=:wid AND date=:d AND shift_id=:sid", 
                                                {"wid": row['ID'], "d": date_str, "sid": target_shift_id}))
                             # 2. Insert New
-                            batch_cmds.append(("INSERT INTO attendance (worker_id, date, shift_id, status, notes, supervisor) VALUES (:wid, :d, :sid, :s, :n, :sup)",
+                            insert_cmds.append(("INSERT INTO attendance (worker_id, date, shift_id, status, notes, supervisor) VALUES (:wid, :d, :sid, :s, :n, :sup)",
                                                {"wid": row['ID'], "d": date_str, "sid": target_shift_id, "s": row['Status'], "n": row['Notes'], "sup": user['name']}))
                         
-                        if run_batch_action(batch_cmds):
+                        # All deletes then all inserts: each group goes out as a single executemany
+                        if run_batch_action(delete_cmds + insert_cmds):
                             st.toast(f"Attendance recorded for {len(edited_att)} workers on {date_str}!", icon="✅")
                             time.sleep(1); st.rerun()
             render_attendance_form(df_att)
 
     with tab2:
-        st.dataframe(run_query("SELECT * FROM workers WHERE region = :r", {"r": selected_region_mp}), width="stretch")
+        render_paged_table("workers", f"my_workers_{selected_region_mp}", {"region": selected_region_mp}, page_size=100)
@@ -11,7 +11,7 @@ def migrate_db():
     print("Starting migration NTCC -> NSTC...")
     try:
         # Update Inventory
-        res1 = run_action("UPDATE inventory SET location = 'NSTC' WHERE location = 'NTCC'")
+        res1 = run_action("UPDATE inventory SET location = 'NSTC', last_updated = NOW() WHERE location = 'NTCC'")
         if res1: print("Updated inventory location.")
         else: print("Failed or no changes in inventory.")
 
@@ -2,14 +2,25 @@
 import streamlit as st
 import pandas as pd
 import time
-from modules.database import run_query, run_action, run_batch_action
-from modules.config import TEXT as txt, CATS_EN, LOCATIONS, EXTERNAL_PROJECTS, AREAS
+from modules.database import run_query, run_batch_action, filtered_query
+from modules import instrumentation
+from modules.audit_writer import writer as audit_writer
+from modules.config import (
+    TEXT as txt, CATS_EN, LOCATIONS, EXTERNAL_PROJECTS, AREAS, LOW_STOCK_DEFAULT_MIN,
+    FORECAST_WINDOWS, FORECAST_LEAD_TIME_DAYS, FORECAST_COVER_DAYS
+)
 from modules.utils import convert_df_to_excel
 from modules.inventory_logic import (
     get_inventory, update_central_stock, get_local_inventory_by_item, 
-    update_local_inventory, update_request_details, delete_request, transfer_stock
+    update_local_inventory_many, apply_pending_request_changes, transfer_stock_many,
+    create_item, get_low_stock, set_reorder_levels, issue_requests_bulk
+)
+from modules.stock_history import stock_as_of, stock_series
+from modules.forecast import reorder_report, consumption_rates
+from modules.allocation import POLICIES, LINE_COLUMNS, allocate, available_stock, apply_review
+from modules.views.common import (
+    render_bulk_stock_take, render_paged_table, render_stream_export, watch_tables, lazy_tabs, render_lazy_download
 )
-from modules.views.common import render_bulk_stock_take
 
 # ==========================================
 # ============ MANAGER VIEW (WH) ===========
@@ -17,7 +28,7 @@ from modules.views.common import render_bulk_stock_take
 @st.fragment
 def manager_view_warehouse():
     st.header(txt['manager_role'])
-    view_option = st.radio("Navigate", ["📦 Stock Management", txt['ext_tab'], "⏳ Bulk Review", txt['local_inv'], "📜 Logs", "🔍 Audit"], horizontal=True, label_visibility="collapsed")
+    view_option = st.radio("Navigate", ["📦 Stock Management", txt['ext_tab'], "⏳ Bulk Review", txt['local_inv'], "📈 Forecast", "📜 Logs", "🔍 Audit", "⚡ DB Performance"], horizontal=True, label_visibility="collapsed")
     
     if view_option == "📦 Stock Management": # Stock
         # Search box
@@ -33,10 +44,11 @@ def manager_view_warehouse():
                 u = st.selectbox("Unit", ["Piece", "Carton", "Set"])
                 if st.form_submit_button(txt['create_btn'], width="stretch"):
                     if n and run_query("SELECT id FROM inventory WHERE name_en=:n AND location=:l", {"n":n, "l":l}).empty:
-                        run_action("INSERT INTO inventory (name_en, category, unit, location, qty, status) VALUES (:n, :c, :u, :l, :q, 'Available')",
-                                  {"n":n, "c":c, "u":u, "l":l, "q":int(q)})
-                        st.toast("Item Added Successfully!", icon="📦")
-                        st.rerun()
+                        ok, msg = create_item(n, c, u, l, q, st.session_state.user_info['name'])
+                        if ok:
+                            st.toast("Item Added Successfully!", icon="📦")
+                            st.rerun()
+                        else: st.error(msg)
                     else: st.error("Exists")
         
         with st.expander("🔄 Internal Stock Transfer (SNC ➡️ NSTC)", expanded=False):
@@ -69,37 +81,53 @@ def manager_view_warehouse():
                         if items_to_transfer.empty:
                             st.warning("Please enter quantity for at least one item.")
                         else:
-                            success_count = 0
-                            fail_count = 0
-                            
-                            for index, row in items_to_transfer.iterrows():
-                                t_item = row['Item Name']
-                                t_qty = int(row['Transfer Qty'])
-                                avail_qty = int(row['Available Qty'])
-                                unit = row['unit']
-                                
-                                if t_qty <= avail_qty:
-                                    res, msg = transfer_stock(t_item, t_qty, st.session_state.user_info['name'], unit)
-                                    if res: success_count += 1
-                                    else: fail_count += 1
-                                else:
-                                    st.error(f"❌ '{t_item}': Request {t_qty} > Available {avail_qty}")
-                                    fail_count += 1
-                            
-                            if success_count > 0:
+                            lines = [{"item_name": r['Item Name'], "qty": int(r['Transfer Qty']), "unit": r['unit']}
+                                     for r in items_to_transfer.to_dict('records')]
+                            ok, results = transfer_stock_many(lines, st.session_state.user_info['name'], "SNC", "NSTC")
+                            if ok:
                                 st.balloons()
-                                st.success(f"Successfully transferred {success_count} items!")
+                                st.success(f"Successfully transferred {len(results)} items!")
                                 time.sleep(1)
                                 st.rerun()
-                            if fail_count > 0:
-                                st.warning(f"Failed to transfer {fail_count} items. Check errors above.")
+                            else:
+                                st.error("❌ Transfer cancelled - nothing was moved. Fix the lines below and retry.")
+                                st.dataframe(pd.DataFrame(results, columns=["Item", "OK", "Message"]), hide_index=True, width="stretch")
             else:
                 st.info("SNC Inventory is empty.")
 
-        # Optimization: Use tabs for locations to avoid rendering both tables at once unless needed
-        st_tabs = st.tabs(["NSTC Stock", "SNC Stock"])
-        with st_tabs[0]: render_bulk_stock_take("NSTC", st.session_state.user_info['name'], "mgr")
-        with st_tabs[1]: render_bulk_stock_take("SNC", st.session_state.user_info['name'], "mgr")
+        with st.expander("🎚️ Reorder Levels", expanded=False):
+            st.caption(f"Items below Min Qty show up as low-stock alerts (blank = default {LOW_STOCK_DEFAULT_MIN}). Max Qty sets the reorder target.")
+            lvl_loc = st.selectbox("Location", LOCATIONS, key="lvl_loc")
+            # Expander bodies run on every rerun, even collapsed: the sheet is only read once asked for
+            if st.toggle("✏️ Edit Levels", key="lvl_edit"):
+                levels = run_query("SELECT name_en, qty, min_qty, max_qty FROM inventory WHERE location = :l ORDER BY name_en", {"l": lvl_loc}, tables=["inventory"])
+                if levels.empty: st.info(f"No inventory found in {lvl_loc}")
+                else:
+                    with st.form(f"levels_form_{lvl_loc}"):
+                        edited_lvl = st.data_editor(
+                            levels, key=f"levels_editor_{lvl_loc}",
+                            column_config={
+                                "name_en": st.column_config.TextColumn("Item Name", disabled=True),
+                                "qty": st.column_config.NumberColumn("Qty", disabled=True),
+                                "min_qty": st.column_config.NumberColumn("Min Qty", min_value=0, max_value=100000),
+                                "max_qty": st.column_config.NumberColumn("Max Qty", min_value=0, max_value=100000)
+                            },
+                            hide_index=True, width="stretch", height=400
+                        )
+                        if st.form_submit_button("💾 Save Reorder Levels", width="stretch"):
+                            cols = ['min_qty', 'max_qty']
+                            changed = ~(edited_lvl[cols].eq(levels[cols]) | (edited_lvl[cols].isna() & levels[cols].isna())).all(axis=1)
+                            rows = edited_lvl[changed]
+                            if rows.empty: st.info("No changes detected.")
+                            else:
+                                ok, msg = set_reorder_levels(lvl_loc, list(rows[['name_en'] + cols].itertuples(index=False, name=None)))
+                                if ok:
+                                    st.toast(f"✅ Updated {len(rows)} reorder levels"); time.sleep(1); st.rerun()
+                                else: st.error(msg)
+
+        # Only the selected location's stock-take sheet is built
+        st_loc = lazy_tabs(["NSTC Stock", "SNC Stock"], "mgr_stock_take_loc")
+        render_bulk_stock_take(st_loc.split()[0], st.session_state.user_info['name'], "mgr")
 
     elif view_option == txt['ext_tab']: # External
         c1, c2 = st.columns(2)
@@ -156,10 +184,12 @@ def manager_view_warehouse():
                         st.info("No items found.")
                         st.form_submit_button("Submit", disabled=True)
         st.divider()
-        loan_logs = run_query("SELECT log_date, item_name, change_amount, location, action_type FROM stock_logs WHERE action_type LIKE '%Lend%' OR action_type LIKE '%Borrow%' ORDER BY log_date DESC")
+        st.markdown("##### 🤝 Loan History")
+        loan_logs = render_paged_table("stock_logs", "loan_logs", {"action": ["Lend", "Borrow"]},
+                                       column_order=["log_date", "item_name", "change_amount", "location", "action_type"])
         if not loan_logs.empty: 
-            st.dataframe(loan_logs, width="stretch")
-            st.download_button("📥 Export Loan Logs", convert_df_to_excel(loan_logs, "Loans"), "loan_logs.xlsx")
+            loan_sql, loan_params = filtered_query("stock_logs", {"action": ["Lend", "Borrow"]}, "log_date, item_name, change_amount, location, action_type")
+            render_stream_export("Export Loan Logs", loan_sql, loan_params, "loan_logs.xlsx", "loan_logs", sheet_name="Loans")
 
     elif view_option == "⏳ Bulk Review": # Requests
         # Cache this query for 10s to avoid instant flicker but reduce load
@@ -169,6 +199,30 @@ def manager_view_warehouse():
         @st.fragment
         def render_manager_bulk_review(requests_df):
             regions = requests_df['region'].unique()
+            # Approvals are allocated against free NSTC stock (qty minus already approved) so it is never over-committed
+            p1, p2 = st.columns([1, 2])
+            policy = p1.selectbox("Allocation Policy", list(POLICIES), format_func=POLICIES.get, key="alloc_policy")
+            priorities = p2.multiselect("Region Priority (first = highest)", list(regions), key="alloc_prio") if policy == "priority" else None
+
+            def commit(approve, reject):
+                ok, plan = apply_review(approve, reject, policy, priorities)
+                if not ok:
+                    st.error(f"Failed to process changes: {plan}")
+                    return
+                for r in plan[plan['decision'] != "Approve"].itertuples():
+                    if r.decision == "Partial": st.toast(f"⚠️ {r.item_name}: approved {r.allocated} of {r.qty}", icon="⚠️")
+                    else: st.toast(f"❌ Low Stock for {r.item_name}. Kept pending.", icon="⚠️")
+                st.success(f"Processed {len(approve) + len(reject)} requests!"); time.sleep(1); st.rerun()
+
+            atp = available_stock()
+            with st.expander("⚖️ Allocate All Regions", expanded=False):
+                all_lines = requests_df[LINE_COLUMNS]
+                plan = allocate(all_lines, atp, policy, priorities)
+                st.dataframe(plan[['region', 'item_name', 'qty', 'avail', 'allocated', 'decision', 'request_date']].rename(columns={'avail': 'ATP'}),
+                             hide_index=True, width="stretch")
+                if st.button("✅ Approve Allocation Plan", key="alloc_all"):
+                    commit(all_lines.assign(note=None), None)
+
             region_tabs = st.tabs(list(regions))
             for i, region in enumerate(regions):
                 with region_tabs[i]:
@@ -179,9 +233,10 @@ def manager_view_warehouse():
                     elif bulk_action == "Reject All": reg_df['Action'] = "Reject"
                     else: reg_df['Action'] = "Keep Pending"
                     
+                    reg_df['ATP'] = reg_df['item_name'].map(atp).fillna(0).astype(int)
                     reg_df['Mgr Qty'] = reg_df['qty']
                     reg_df['Mgr Note'] = reg_df['notes']
-                    display_df = reg_df[['req_id', 'item_name', 'supervisor_name', 'qty', 'unit', 'Mgr Qty', 'Mgr Note', 'Action']]
+                    display_df = reg_df[['req_id', 'item_name', 'supervisor_name', 'qty', 'ATP', 'unit', 'Mgr Qty', 'Mgr Note', 'Action']]
                     
                     with st.form(key=f"mgr_form_{region}"):
                         edited_df = st.data_editor(
@@ -191,6 +246,7 @@ def manager_view_warehouse():
                                 "req_id": None, "item_name": st.column_config.TextColumn(disabled=True),
                                 "supervisor_name": st.column_config.TextColumn(disabled=True),
                                 "qty": st.column_config.NumberColumn(disabled=True, label="Req Qty"),
+                                "ATP": st.column_config.NumberColumn(disabled=True, help="NSTC stock not yet promised to approved requests"),
                                 "unit": st.column_config.TextColumn(disabled=True),
                                 "Mgr Qty": st.column_config.NumberColumn(min_value=1, max_value=10000, required=True),
                                 "Action": st.column_config.SelectboxColumn(options=["Keep Pending", "Approve", "Reject"], required=True)
@@ -199,46 +255,11 @@ def manager_view_warehouse():
                         )
                         
                         if st.form_submit_button(f"Process Updates for {region}"):
-                            batch_cmds = []
-                            count_changes = 0
-                            
-                            # Pre-fetch inventory to avoid queries in loop
-                            inv_items = edited_df['item_name'].unique().tolist()
-                            if inv_items:
-                                stock_data = run_query("SELECT name_en, qty FROM inventory WHERE location='NSTC'")
-                                stock_map = {row['name_en']: row['qty'] for _, row in stock_data.iterrows()}
-                            else:
-                                stock_map = {}
-
-                            for index, row in edited_df.iterrows():
-                                rid = row['req_id']
-                                action = row['Action']
-                                new_q = int(row['Mgr Qty'])
-                                new_n = row['Mgr Note']
-                                
-                                if action == "Approve":
-                                    avail = stock_map.get(row['item_name'], 0)
-                                    if avail >= new_q:
-                                        final_note = f"Manager: {new_n}" if new_n else ""
-                                        batch_cmds.append((
-                                            "UPDATE requests SET status='Approved', qty=:q, notes=:n WHERE req_id=:id",
-                                            {"q":new_q, "n":final_note, "id":rid}
-                                        ))
-                                        count_changes += 1
-                                    else: 
-                                        st.toast(f"❌ Low Stock for {row['item_name']}. Skipped.", icon="⚠️")
-                                elif action == "Reject":
-                                    batch_cmds.append((
-                                        "UPDATE requests SET status='Rejected', notes=:n WHERE req_id=:id",
-                                        {"n":new_n, "id":rid}
-                                    ))
-                                    count_changes += 1
-                            
-                            if batch_cmds:
-                                if run_batch_action(batch_cmds):
-                                    st.success(f"Processed {count_changes} requests!"); time.sleep(1); st.rerun()
-                                else:
-                                    st.error("Failed to process changes. Please try again.")
+                            lines = edited_df.merge(reg_df[['req_id', 'region', 'request_date']], on='req_id').rename(columns={'Mgr Note': 'note'})
+                            approve = lines[lines['Action'] == "Approve"].drop(columns=['qty']).rename(columns={'Mgr Qty': 'qty'})
+                            reject = lines[lines['Action'] == "Reject"]
+                            if approve.empty and reject.empty: st.info("No changes selected.")
+                            else: commit(approve[LINE_COLUMNS + ['note']], reject[['req_id', 'note']])
     
         if reqs.empty: st.info("No pending requests")
         else: render_manager_bulk_review(reqs)
@@ -248,32 +269,120 @@ def manager_view_warehouse():
         # Optimization: Fetch ALL local inventory in one query
         all_local = run_query("SELECT region, item_name, qty, last_updated, updated_by FROM local_inventory ORDER BY region, item_name")
         
-        m_tabs = st.tabs(AREAS)
-        for i, area in enumerate(AREAS):
-            with m_tabs[i]:
-                df = all_local[all_local['region'] == area] if not all_local.empty else pd.DataFrame()
-                if df.empty:
-                    st.info(f"No inventory record for {area}")
-                else:
-                    st.dataframe(df, width="stretch")
-                    st.download_button(f"📥 Export {area} Inv", convert_df_to_excel(df, area), f"{area}_inv.xlsx", key=f"dl_loc_{area}")
+        area = lazy_tabs(AREAS, "mgr_local_inv_area")
+        df = all_local[all_local['region'] == area] if not all_local.empty else pd.DataFrame()
+        if df.empty:
+            st.info(f"No inventory record for {area}")
+        else:
+            st.dataframe(df, width="stretch")
+            render_lazy_download(f"📥 Export {area} Inv", lambda: convert_df_to_excel(df, area), f"{area}_inv.xlsx", f"dl_loc_{area}", ["local_inventory"])
+
+    elif view_option == "📈 Forecast": # Consumption Forecast
+        st.subheader("📈 Consumption & Reorder Forecast")
+        fc1, fc2, fc3, fc4 = st.columns(4)
+        fc_loc = fc1.selectbox("Location", LOCATIONS, key="fc_loc")
+        fc_window = fc2.selectbox("Rate Window (days)", FORECAST_WINDOWS, index=min(1, len(FORECAST_WINDOWS) - 1), key="fc_window")
+        fc_lead = fc3.number_input("Lead Time (days)", 0, 365, FORECAST_LEAD_TIME_DAYS, key="fc_lead")
+        fc_cover = fc4.number_input("Cover (days)", 1, 365, FORECAST_COVER_DAYS, key="fc_cover")
+        report = reorder_report(fc_loc, fc_window, fc_lead, fc_cover)
+        if report.empty: st.info(f"No inventory found in {fc_loc}")
+        else:
+            due = report[report['suggested_qty'] > 0]
+            m1, m2 = st.columns(2)
+            m1.metric("🛒 Items to Reorder", len(due))
+            m2.metric("📦 Units Suggested", int(due['suggested_qty'].sum()))
+            st.dataframe(report, hide_index=True, width="stretch", column_config={
+                "days_of_cover": st.column_config.NumberColumn("Days of Cover", format="%.1f"),
+                "suggested_qty": st.column_config.NumberColumn("Suggested Qty"),
+                "open_demand": st.column_config.NumberColumn("Open Requests"),
+            })
+            render_lazy_download("📥 Export Forecast", lambda: convert_df_to_excel(report, "Forecast"), f"forecast_{fc_loc}_{fc_window}d.xlsx",
+                                 f"fc_export_{fc_loc}_{fc_window}_{fc_lead}_{fc_cover}", ["stock_logs", "inventory", "requests"])
+            with st.expander("🗺️ Consumption by Region", expanded=False):
+                st.dataframe(consumption_rates(), hide_index=True, width="stretch")
 
     elif view_option == "📜 Logs": # Logs
-        logs = run_query("SELECT * FROM stock_logs ORDER BY log_date DESC LIMIT 500")
-        st.dataframe(logs, width="stretch")
+        with st.expander("🔎 Filters", expanded=False):
+            f1, f2, f3 = st.columns(3)
+            log_dates = f1.date_input("Date Range", value=(), key="log_f_dates")
+            log_item = f2.text_input("Item", key="log_f_item")
+            log_loc = f3.selectbox("Location", ["All"] + LOCATIONS, key="log_f_loc")
+            f4, f5 = st.columns(2)
+            log_user = f4.text_input("User", key="log_f_user")
+            log_action = f5.text_input("Action Type", key="log_f_action")
+        log_filters = {
+            "date_from": log_dates[0] if len(log_dates) > 0 else None,
+            "date_to": log_dates[1] if len(log_dates) > 1 else None,
+            "item": log_item.strip(), "location": None if log_loc == "All" else log_loc,
+            "user": log_user.strip(), "action": log_action.strip()
+        }
+        logs = render_paged_table("stock_logs", "stock_logs", log_filters)
         if not logs.empty:
-            st.download_button("📥 Export Stock Logs", convert_df_to_excel(logs, "StockLogs"), "stock_logs.xlsx")
+            e1, e2 = st.columns(2)
+            log_sql, log_params = filtered_query("stock_logs", log_filters)
+            with e1: render_stream_export("Export Stock Logs (Excel)", log_sql, log_params, "stock_logs.xlsx", "stock_logs_xlsx", sheet_name="StockLogs")
+            with e2: render_stream_export("Export Stock Logs (CSV)", log_sql, log_params, "stock_logs.csv", "stock_logs_csv", fmt="csv")
+
+        with st.expander("🕰️ Stock As Of", expanded=False):
+            st.caption("Reconstructs historical stock from the nearest daily checkpoint plus the logs in between.")
+            a1, a2, a3 = st.columns(3)
+            asof_loc = a1.selectbox("Location", LOCATIONS, key="asof_loc")
+            asof_date = a2.date_input("As of (end of day)", key="asof_date")
+            asof_item = a3.text_input("Item (optional)", key="asof_item").strip() or None
+            if st.button("Show Stock", key="asof_go"):
+                snap = stock_as_of(asof_loc, asof_date, asof_item)
+                if snap.empty: st.info("No stock recorded for this selection.")
+                else: st.dataframe(snap, hide_index=True, width="stretch")
+                if asof_item:
+                    series = stock_series(asof_loc, asof_date - pd.Timedelta(days=30), asof_date, asof_item)
+                    if not series.empty: st.line_chart(series, x="date", y="qty")
 
     elif view_option == "🔍 Audit": # Audit Log
         st.subheader("🔍 Audit Log")
         st.caption("Track all system activities")
         
-        audit_logs = run_query("SELECT timestamp, user_name, action, details, module FROM audit_logs ORDER BY timestamp DESC LIMIT 200")
+        a1, a2, a3 = st.columns(3)
+        audit_dates = a1.date_input("Date Range", value=(), key="audit_f_dates")
+        audit_user = a2.text_input("User", key="audit_f_user")
+        audit_action = a3.text_input("Action", key="audit_f_action")
+        audit_filters = {
+            "date_from": audit_dates[0] if len(audit_dates) > 0 else None,
+            "date_to": audit_dates[1] if len(audit_dates) > 1 else None,
+            "user": audit_user.strip(), "action": audit_action.strip()
+        }
+        audit_logs = render_paged_table("audit_logs", "audit_logs", audit_filters, hide_index=True,
+                                        column_order=["timestamp", "user_name", "action", "details", "module"])
         if not audit_logs.empty:
-            st.dataframe(audit_logs, width="stretch", hide_index=True)
-            st.download_button("📥 Export Log", convert_df_to_excel(audit_logs, "AuditLog"), "audit_log.xlsx")
+            audit_sql, audit_params = filtered_query("audit_logs", audit_filters, "timestamp, user_name, action, details, module")
+            render_stream_export("Export Log", audit_sql, audit_params, "audit_log.xlsx", "audit_log", sheet_name="AuditLog")
+
+    elif view_option == "⚡ DB Performance": # Query Instrumentation
+        st.subheader("⚡ DB Performance")
+        st.caption("Statements recorded by this server process (in-memory ring buffer)")
+        
+        ov = instrumentation.overview()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Statements", ov['statements'])
+        c2.metric("p50 Latency", f"{ov['p50_ms']:.1f} ms")
+        c3.metric("p95 Latency", f"{ov['p95_ms']:.1f} ms")
+        c4.metric("Cache Hit Ratio", f"{ov['hit_ratio']:.0%}" if ov['hit_ratio'] is not None else "-")
+        
+        top_n = st.slider("Top statements by total time", 5, 100, 20)
+        summary = instrumentation.summarize(top_n)
+        if summary.empty:
+            st.info("No statements recorded yet")
         else:
-            st.info("No audit records yet")
+            st.dataframe(summary, width="stretch", hide_index=True, column_config={
+                "hit_ratio": st.column_config.NumberColumn("Hit Ratio", format="%.2f")
+            })
+        
+        a = audit_writer.stats()
+        st.caption(f"📝 Audit writer: {a['written']} written | {a['queued']} queued | {a['dropped']} dropped | {a['failed']} failed")
+        
+        b1, b2 = st.columns(2)
+        b1.download_button("📥 Export Raw (JSON Lines)", instrumentation.to_jsonl(), "db_statements.jsonl", width="stretch")
+        if b2.button("🗑️ Reset Statistics", width="stretch"):
+            instrumentation.reset(); st.rerun()
 
 # ==========================================
 # ============ STOREKEEPER VIEW ============
@@ -282,9 +391,15 @@ def manager_view_warehouse():
 def storekeeper_view():
     st.header(txt['storekeeper_role'])
     st.caption("Manage requests and inventory")
+    low = get_low_stock("NSTC")
+    if not low.empty:
+        with st.expander(f"⚠️ NSTC Low Stock ({len(low)} items)", expanded=False):
+            st.dataframe(low[['item_name', 'qty', 'min_qty', 'reorder_qty', 'since']], hide_index=True, width="stretch")
     view_option = st.radio("Navigate", [txt['approved_reqs'], "📋 Issued Today", "NSTC Stock Take", "SNC Stock Take"], horizontal=True, label_visibility="collapsed")
     
     if view_option == txt['approved_reqs']: # Bulk Issue
+        # Every change to the Approved set reserves or releases stock, so `reservations` moves exactly when this list does
+        watch_tables(["reservations"], "sk_bulk_issue", "🔔 The approved requests changed. Refresh to see them (unsaved selections are cleared).")
         # Optimized Query: Select only needed columns
         reqs = run_query("SELECT req_id, region, item_name, qty, unit, notes, status FROM requests WHERE status='Approved'")
         
@@ -318,39 +433,18 @@ def storekeeper_view():
                                 hide_index=True, width="stretch"
                             )
                             if st.form_submit_button(f"Confirm Bulk Issue for {region}"):
-                                batch_cmds = []
-                                issued_count = 0
-                                
-                                for index, row in edited_sk.iterrows():
-                                    if row['Ready to Issue']:
-                                        rid = row['req_id']
-                                        iq = int(row['Final Issue Qty'])
-                                        sn = row['SK Note']
-                                        existing_note = row['notes'] if row['notes'] else ""
-                                        final_note = f"{existing_note} | SK: {sn}" if sn else existing_note
-                                        item = row['item_name']
-                                        unit = row['unit']
-                                        
-                                        batch_cmds.append((
-                                            "UPDATE inventory SET qty = qty - :q, last_updated=NOW() WHERE name_en=:n AND location='NSTC'",
-                                            {"q": iq, "n": item}
-                                        ))
-                                        batch_cmds.append((
-                                            "INSERT INTO stock_logs (log_date, action_by, action_type, item_name, location, change_amount, new_qty, unit) VALUES (NOW(), :u, :t, :n, 'NSTC', :c, (SELECT qty FROM inventory WHERE name_en=:n AND location='NSTC') - :q, :un)",
-                                            {"n": item, "c": -iq, "u": st.session_state.user_info['name'], "t": f"Issued {region}", "un": unit, "q": iq}
-                                        ))
-                                        
-                                        batch_cmds.append((
-                                            "UPDATE requests SET status='Issued', qty=:q, notes=:n WHERE req_id=:id",
-                                            {"q":iq, "n":final_note, "id":rid}
-                                        ))
-                                        issued_count += 1
-                                        
-                                if issued_count > 0:
-                                    if run_batch_action(batch_cmds):
-                                        st.success(f"Issued {issued_count} items!"); time.sleep(1); st.rerun()
+                                sel = edited_sk[edited_sk['Ready to Issue'].fillna(False).astype(bool)]
+                                if not sel.empty:
+                                    notes = sel['notes'].fillna("")
+                                    sk_notes = sel['SK Note'].fillna("")
+                                    final_notes = notes.where(sk_notes == "", notes + " | SK: " + sk_notes)
+                                    lines = list(zip(sel['req_id'], sel['item_name'], sel['Final Issue Qty'].fillna(sel['qty']),
+                                                     sel['unit'], final_notes, [region] * len(sel)))
+                                    ok, res = issue_requests_bulk(lines, st.session_state.user_info['name'])
+                                    if ok:
+                                        st.success(f"Issued {res} items!"); time.sleep(1); st.rerun()
                                     else:
-                                        st.error("Transaction failed.")
+                                        st.error(f"Transaction failed: {res}")
         
         if reqs.empty: st.info("No tasks")
         else: render_storekeeper_bulk_issue(reqs)
@@ -386,8 +480,8 @@ def supervisor_view_warehouse():
         
         inv = get_inventory("NSTC")
         if not inv.empty:
-            inv_df = inv[['name_en', 'category', 'unit']].copy() 
-            inv_df.rename(columns={'name_en': 'Item Name'}, inplace=True)
+            inv_df = inv[['name_en', 'category', 'unit', 'atp']].copy() 
+            inv_df.rename(columns={'name_en': 'Item Name', 'atp': 'Available'}, inplace=True)
             inv_df['Order Qty'] = 0 
             st.info(f"Ordering for: {selected_region_wh}")
             
@@ -400,6 +494,7 @@ def supervisor_view_warehouse():
                             "Item Name": st.column_config.TextColumn(disabled=True),
                             "category": st.column_config.TextColumn(disabled=True),
                             "unit": st.column_config.TextColumn(disabled=True),
+                            "Available": st.column_config.NumberColumn(disabled=True, help="NSTC stock not yet promised to approved requests"),
                             "Order Qty": st.column_config.NumberColumn(min_value=0, max_value=1000, step=1)
                         },
                         hide_index=True, width="stretch", height=400
@@ -498,16 +593,16 @@ def supervisor_view_warehouse():
                         hide_index=True, width="stretch"
                     )
                     if st.form_submit_button("Apply Changes"):
-                        p_changes = 0
-                        for index, row in edited_pending.iterrows():
-                            rid = row['req_id']
-                            if row['Action'] == "Update":
-                                update_request_details(rid, int(row['Modify Qty']), None)
-                                p_changes += 1
-                            elif row['Action'] == "Cancel":
-                                delete_request(rid)
-                                p_changes += 1
-                        if p_changes > 0: st.success(f"Applied changes."); time.sleep(1); st.rerun()
+                        to_update = edited_pending[edited_pending['Action'] == "Update"]
+                        to_cancel = edited_pending[edited_pending['Action'] == "Cancel"]
+                        if not to_update.empty or not to_cancel.empty:
+                            ok, outcomes = apply_pending_request_changes(user['name'], list(zip(to_update['req_id'], to_update['Modify Qty'])), to_cancel['req_id'].tolist())
+                            if not ok: st.error(f"Failed to apply changes: {outcomes}")
+                            else:
+                                names = dict(zip(edited_pending['req_id'], edited_pending['item_name']))
+                                for rid, outcome in outcomes.items():
+                                    if outcome not in ("Updated", "Cancelled"): st.toast(f"⚠️ {names.get(rid, rid)}: {outcome}", icon="⚠️")
+                                st.success(f"Applied changes."); time.sleep(1); st.rerun()
             render_supervisor_pending_edit(pending_df)
 
     elif view_option == txt['local_inv']: # Local Inventory
@@ -536,13 +631,10 @@ def supervisor_view_warehouse():
                     )
                     
                     if st.form_submit_button(f"Update {selected_region_wh} Counts"):
-                        up_count = 0
-                        for index, row in edited_local.iterrows():
-                            sys = int(row['System Count'])
-                            phy = int(row['Physical Count'])
-                            if sys != phy:
-                                update_local_inventory(selected_region_wh, row['Item Name'], phy, user['name'])
-                                up_count += 1
-                        if up_count > 0: st.success(f"Updated {up_count} items."); time.sleep(1); st.rerun()
-                        else: st.info("No changes made.")
+                        changed = edited_local[edited_local['Physical Count'].astype(int) != edited_local['System Count'].astype(int)]
+                        if changed.empty: st.info("No changes made.")
+                        else:
+                            ok, res = update_local_inventory_many(selected_region_wh, list(zip(changed['Item Name'], changed['Physical Count'].astype(int))), user['name'])
+                            if ok: st.success(f"Updated {res} items."); time.sleep(1); st.rerun()
+                            else: st.error(f"Failed to update counts: {res}")
             render_supervisor_local_inventory(local_inv_df)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+from modules import database, backends, migrations, query_cache, inventory_index
+
+@pytest.fixture
+def db(monkeypatch):
+    """Fresh in-memory SQLite database with the full schema; the data layer's connection points at it."""
+    conn = backends.sqlite_connection(":memory:")
+    migrations.apply_migrations(conn.engine, log=lambda msg: None)
+    monkeypatch.setattr(database, "_conn", conn)
+    query_cache.clear()
+    inventory_index.reset()
+    yield conn
+    query_cache.clear()
+    inventory_index.reset()
+    conn.engine.dispose()
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+from modules.allocation import allocate, apply_review, LINE_COLUMNS
+from modules.database import run_action, run_query
+from modules.inventory_logic import create_item
+
+def _lines(rows):
+    return pd.DataFrame(rows, columns=LINE_COLUMNS)
+
+LINES = _lines([
+    (1, "A", "R1", "2026-01-03", 10),
+    (2, "A", "R2", "2026-01-01", 10),
+    (3, "A", "R3", "2026-01-02", 10),
+    (4, "B", "R1", "2026-01-01", 5),
+    (5, "B", "R2", "2026-01-02", 5),
+])
+AVAILABLE = pd.Series({"A": 15, "B": 7})
+
+def _by_id(plan):
+    return dict(zip(plan['req_id'], zip(plan['allocated'], plan['decision'])))
+
+def test_fifo_fills_oldest_first_with_a_partial_line():
+    plan = allocate(LINES, AVAILABLE, "fifo")
+    assert plan['req_id'].tolist() == [1, 2, 3, 4, 5]  # Original order kept
+    assert _by_id(plan) == {2: (10, "Approve"), 3: (5, "Partial"), 1: (0, "Reject"), 4: (5, "Approve"), 5: (2, "Partial")}
+
+def test_priority_serves_listed_regions_first():
+    plan = allocate(LINES, AVAILABLE, "priority", priorities=["R3", "R1"])
+    assert _by_id(plan) == {3: (10, "Approve"), 1: (5, "Partial"), 2: (0, "Reject"), 4: (5, "Approve"), 5: (2, "Partial")}
+
+def test_fair_share_is_proportional():
+    plan = allocate(LINES, AVAILABLE, "fair_share")
+    assert plan.groupby('item_name')['allocated'].sum().to_dict() == {"A": 15, "B": 7}
+    assert plan.set_index('req_id')['allocated'].loc[[1, 2, 3]].tolist() == [5, 5, 5]
+
+def test_without_partials_a_short_line_gets_nothing():
+    plan = allocate(LINES, AVAILABLE, "fifo", allow_partial=False)
+    assert _by_id(plan)[3] == (0, "Reject") and _by_id(plan)[5] == (0, "Reject")
+
+@pytest.mark.parametrize("policy", ["fifo", "priority", "fair_share"])
+def test_never_allocates_more_than_available(policy):
+    rng = pd.Series(range(300))
+    lines = _lines({"req_id": rng, "item_name": "I" + (rng % 7).astype(str), "region": "R" + (rng % 3).astype(str),
+                    "request_date": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng % 50, unit="h"), "qty": 1 + rng % 13})
+    available = pd.Series({f"I{i}": 40 * i for i in range(7)})
+    plan = allocate(lines, available, policy, priorities=["R2"])
+    assert (plan['allocated'] >= 0).all() and (plan['allocated'] <= plan['qty']).all()
+    assert (plan.groupby('item_name')['allocated'].sum() <= available.reindex(plan['item_name'].unique())).all()
+
+def test_unknown_item_gets_nothing():
+    plan = allocate(_lines([(1, "Z", "R1", "2026-01-01", 3)]), AVAILABLE)
+    assert _by_id(plan) == {1: (0, "Reject")}
+
+def test_apply_review_allocates_against_unreserved_stock(db):
+    assert create_item("A", "Electrical", "Piece", "NSTC", 15, "mgr")[0]
+    for rid, (region, day, qty) in enumerate([("R1", "2026-01-01", 10), ("R2", "2026-01-02", 10), ("R3", "2026-01-03", 10)], start=1):
+        run_action("INSERT INTO requests (req_id, supervisor_name, region, item_name, category, qty, unit, status, request_date) VALUES (:id, 'sup', :r, 'A', 'Electrical', :q, 'Piece', 'Pending', :d)",
+                   {"id": rid, "r": region, "q": qty, "d": day})
+    pending = run_query("SELECT req_id, item_name, region, request_date, qty FROM requests ORDER BY req_id", ttl=0).assign(note=None)
+
+    ok, plan = apply_review(pending.iloc[:2], reject_unfilled=True)
+    assert ok, plan
+    assert _by_id(plan) == {1: (10, "Approve"), 2: (5, "Partial")}
+    assert run_query("SELECT reserved_qty FROM inventory WHERE name_en = 'A'", ttl=0).iloc[0, 0] == 15
+
+    # Everything is promised now: the next approval gets nothing
+    ok, plan = apply_review(pending.iloc[2:], reject_unfilled=True)
+    assert ok and _by_id(plan) == {3: (0, "Reject")}
+    status = run_query("SELECT req_id, status, qty FROM requests ORDER BY req_id", ttl=0)
+    assert status.values.tolist() == [[1, "Approved", 10], [2, "Approved", 5], [3, "Rejected", 10]]
@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import text
+from modules.backends import sqlite_connection
+from modules.database import group_actions, execute_batch
+
+INSERT = "INSERT INTO t (v) VALUES (:v)"
+BUMP = "UPDATE t SET v = v + 1"
+
+def test_group_actions_keeps_parameterless_statements_separate():
+    groups = group_actions([(BUMP, None), (BUMP, {"x": 1}), (BUMP, None), (INSERT, {"v": 1}), (INSERT, {"v": 2})])
+    assert groups == [(BUMP, []), (BUMP, [{"x": 1}]), (BUMP, []), (INSERT, [{"v": 1}, {"v": 2}])]
+
+def test_execute_batch_runs_every_statement_with_mixed_params():
+    c = sqlite_connection(":memory:")
+    with c.session as s:
+        s.execute(text("CREATE TABLE t (v INTEGER)"))
+        stats = execute_batch(s, [(INSERT, {"v": 1}), (BUMP, None), (BUMP, {}), (BUMP, None), (INSERT, {"v": 10}), (INSERT, {"v": 20})])
+        rows = sorted(r[0] for r in s.execute(text("SELECT v FROM t")))
+    assert rows == [4, 10, 20]  # 1 bumped three times
+    assert stats == {"statements": 6, "round_trips": 5, "coalesced": 1}
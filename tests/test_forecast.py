@@ -0,0 +1,23 @@
+import pytest
+from modules import forecast
+from modules.inventory_logic import create_item, update_central_stock
+
+@pytest.fixture
+def stock(db):
+    forecast.reset()
+    for loc, qty in (("NSTC", 100), ("SNC", 20)):
+        assert create_item("Cable", "Electrical", "Piece", loc, qty, "mgr")[0]
+    assert update_central_stock("Cable", "NSTC", -30, "sk", "Issued OPD", "Piece")[0]
+    yield db
+    forecast.reset()
+
+def test_rates_are_per_issuing_location(stock):
+    assert forecast.consumption_rates((30,), by_region=False, location="NSTC")['rate_30d'].tolist() == [1.0]
+    assert forecast.consumption_rates((30,), by_region=False, location="SNC").empty
+
+def test_snc_gets_no_rate_from_nstc_issues(stock):
+    snc = forecast.reorder_report("SNC", 30).set_index('item_name').loc["Cable"]
+    assert snc['rate_30d'] == 0 and snc['open_demand'] == 0
+    assert snc['suggested_qty'] == 0
+    nstc = forecast.reorder_report("NSTC", 30).set_index('item_name').loc["Cable"]
+    assert nstc['rate_30d'] == 1.0 and nstc['days_of_cover'] == 70.0
@@ -0,0 +1,113 @@
+import pandas as pd
+from modules.allocation import apply_review
+from modules.database import run_action, run_query, write_session, execute_batch
+from modules.inventory_logic import (
+    create_item, get_inventory, issue_requests_bulk, transfer_stock_many, apply_pending_request_changes
+)
+from modules.reservations import reserve_actions
+
+def _qty(item, location):
+    df = run_query("SELECT qty FROM inventory WHERE name_en = :i AND location = :l", {"i": item, "l": location}, ttl=0)
+    return None if df.empty else int(df.iloc[0, 0])
+
+def _request(rid, item, qty, status="Pending", region="OPD"):
+    run_action("INSERT INTO requests (req_id, supervisor_name, region, item_name, category, qty, unit, status, request_date) VALUES (:id, 'sup', :r, :i, 'Electrical', :q, 'Piece', :s, NOW())",
+               {"id": rid, "r": region, "i": item, "q": qty, "s": status})
+
+def _approve(*rows):
+    """rows: (req_id, item, qty) - approved requests holding their reservation, as Bulk Review leaves them."""
+    for rid, item, qty in rows: _request(rid, item, qty, "Approved")
+    with write_session(["reservations", "inventory"]) as s:
+        execute_batch(s, reserve_actions(rows))
+
+def _logs(item):
+    return run_query("SELECT action_type, change_amount, new_qty FROM stock_logs WHERE item_name = :i AND action_type <> 'Opening Stock' ORDER BY id",
+                     {"i": item}, ttl=0).values.tolist()
+
+# --- issue_requests_bulk ---
+
+def test_bulk_issue_flips_status_and_logs_running_balance(db):
+    create_item("A", "Electrical", "Piece", "NSTC", 20, "mgr")
+    create_item("B", "Electrical", "Piece", "NSTC", 5, "mgr")
+    _approve((1, "A", 4), (2, "A", 6), (3, "B", 5))
+    ok, n = issue_requests_bulk([(1, "A", 4, "Piece", None, "OPD"), (2, "A", 6, "Piece", "ok", "ICU 28"), (3, "B", 5, "Piece", None, "OPD")], "sk")
+    assert ok and n == 3
+    reqs = run_query("SELECT req_id, status, notes FROM requests ORDER BY req_id", ttl=0)
+    assert reqs['status'].tolist() == ["Issued"] * 3 and reqs['notes'].iloc[1] == "ok"
+    assert _logs("A") == [["Issued OPD", -4, 16], ["Issued ICU 28", -6, 10]]
+    assert _qty("A", "NSTC") == 10 and _qty("B", "NSTC") == 0
+    # Issuing consumes the reservations
+    assert run_query("SELECT COUNT(*) FROM reservations", ttl=0).iloc[0, 0] == 0
+    assert run_query("SELECT SUM(reserved_qty) FROM inventory", ttl=0).iloc[0, 0] == 0
+
+def test_bulk_issue_is_all_or_nothing_on_short_stock(db):
+    create_item("A", "Electrical", "Piece", "NSTC", 5, "mgr")
+    _approve((1, "A", 3), (2, "A", 3))
+    ok, msg = issue_requests_bulk([(1, "A", 3, "Piece", None, "OPD"), (2, "A", 3, "Piece", None, "OPD")], "sk")
+    assert not ok and "Insufficient stock" in msg
+    assert _qty("A", "NSTC") == 5 and _logs("A") == []
+    assert set(run_query("SELECT status FROM requests", ttl=0)['status']) == {"Approved"}
+
+def test_bulk_issue_rejects_requests_no_longer_approved(db):
+    create_item("A", "Electrical", "Piece", "NSTC", 10, "mgr")
+    _approve((1, "A", 2))
+    _request(2, "A", 2, "Pending")
+    ok, msg = issue_requests_bulk([(1, "A", 2, "Piece", None, "OPD"), (2, "A", 2, "Piece", None, "OPD")], "sk")
+    assert not ok and "No longer approved" in msg and "2" in msg
+    assert _qty("A", "NSTC") == 10
+    assert run_query("SELECT status FROM requests WHERE req_id = 1", ttl=0).iloc[0, 0] == "Approved"
+
+# --- transfer_stock_many ---
+
+def test_transfer_moves_stock_and_creates_missing_destination_rows(db):
+    create_item("A", "Electrical", "Piece", "SNC", 10, "mgr")
+    create_item("B", "Electrical", "Piece", "SNC", 4, "mgr")
+    create_item("A", "Electrical", "Piece", "NSTC", 1, "mgr")
+    ok, results = transfer_stock_many([{"item_name": "A", "qty": 3, "unit": "Piece"}, {"item_name": "A", "qty": 2, "unit": "Piece"},
+                                       {"item_name": "B", "qty": 4, "unit": "Piece"}], "mgr")
+    assert ok and all(r[1] for r in results)
+    assert (_qty("A", "SNC"), _qty("A", "NSTC"), _qty("B", "SNC"), _qty("B", "NSTC")) == (5, 6, 0, 4)
+    assert run_query("SELECT action_type, location, change_amount, new_qty FROM stock_logs WHERE item_name = 'A' AND action_type LIKE 'Transfer%' ORDER BY id", ttl=0).values.tolist() == [
+        ["Transfer Out", "SNC", -3, 7], ["Transfer In", "NSTC", 3, 4], ["Transfer Out", "SNC", -2, 5], ["Transfer In", "NSTC", 2, 6]]
+
+def test_transfer_rejects_the_whole_batch_when_a_line_is_short(db):
+    create_item("A", "Electrical", "Piece", "SNC", 10, "mgr")
+    create_item("B", "Electrical", "Piece", "SNC", 1, "mgr")
+    ok, results = transfer_stock_many([{"item_name": "A", "qty": 5, "unit": "Piece"}, {"item_name": "B", "qty": 2, "unit": "Piece"},
+                                       {"item_name": "C", "qty": 1, "unit": "Piece"}], "mgr")
+    assert not ok
+    assert results == [("A", False, "Not moved (batch rejected)"), ("B", False, "Request 2 > Available 1"), ("C", False, "Not found in SNC")]
+    assert _qty("A", "SNC") == 10 and _qty("A", "NSTC") is None
+
+# --- reservations along the live request paths ---
+
+def _reserved():
+    return dict(run_query("SELECT req_id, qty FROM reservations", ttl=0).values.tolist())
+
+def test_request_lifecycle_reserves_on_approval_and_releases_on_issue(db):
+    create_item("A", "Electrical", "Piece", "NSTC", 10, "mgr")
+    for rid in (1, 2, 3): _request(rid, "A", 3)
+    pending = run_query("SELECT req_id, item_name, region, request_date, qty FROM requests ORDER BY req_id", ttl=0)
+    ok, _ = apply_review(pending[pending['req_id'] <= 2].assign(note=None), reject=pd.DataFrame({"req_id": [3], "note": ["no"]}))
+    assert ok
+    assert _reserved() == {1: 3, 2: 3}  # Approved reserves, Rejected holds nothing
+    assert get_inventory("NSTC").set_index('name_en').loc["A", ['qty', 'reserved_qty', 'atp']].tolist() == [10, 6, 4]
+
+    # Rejections and cancellations only touch Pending requests: an approved one keeps its reservation
+    ok, _ = apply_review(pending.iloc[:0].assign(note=None), reject=pd.DataFrame({"req_id": [1], "note": ["late"]}))
+    ok2, outcomes = apply_pending_request_changes("sup", cancellations=[2])
+    assert ok and ok2 and outcomes == {2: "Not pending"}
+    assert _reserved() == {1: 3, 2: 3}
+
+    assert issue_requests_bulk([(1, "A", 3, "Piece", None, "OPD")], "sk")[0]
+    assert _reserved() == {2: 3}  # Issued consumes
+    assert run_query("SELECT qty, reserved_qty FROM inventory WHERE name_en = 'A'", ttl=0).values.tolist() == [[7, 3]]
+
+def test_cancelled_pending_request_is_deleted(db):
+    create_item("A", "Electrical", "Piece", "NSTC", 10, "mgr")
+    _request(1, "A", 3)
+    _request(2, "A", 3)
+    ok, outcomes = apply_pending_request_changes("sup", updates=[(2, 5)], cancellations=[1])
+    assert ok and outcomes == {1: "Cancelled", 2: "Updated"}
+    assert run_query("SELECT req_id, qty FROM requests", ttl=0).values.tolist() == [[2, 5]]
+    assert _reserved() == {}
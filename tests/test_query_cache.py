@@ -0,0 +1,56 @@
+import pytest
+from modules import query_cache
+from modules.database import run_query, run_action, run_batch_action
+
+@pytest.mark.parametrize("query, tables", [
+    ("SELECT * FROM inventory WHERE location = :loc", {"inventory"}),
+    ("SELECT r.*, i.qty FROM requests r JOIN inventory i ON i.name_en = r.item_name", {"requests", "inventory"}),
+    ("SELECT * FROM workers w, attendance a WHERE a.worker_id = w.id", {"workers", "attendance"}),
+    ("SELECT * FROM a JOIN b ON a.x = b.x, c WHERE c.y = 1", {"a", "b", "c"}),
+    ("SELECT * FROM (SELECT item_name FROM stock_logs) s, public.reservations r", {"stock_logs", "reservations"}),
+    ("UPDATE inventory SET qty = 1 FROM v WHERE inventory.name_en = v.name", {"inventory", "v"}),
+    ("DELETE FROM low_stock_alerts WHERE location = 'NSTC'", {"low_stock_alerts"}),
+])
+def test_extract_tables(query, tables):
+    assert query_cache.extract_tables(query) == tables
+
+def _seed():
+    run_batch_action([("INSERT INTO inventory (name_en, category, unit, location, qty) VALUES ('A', 'x', 'Piece', 'NSTC', 5)", None),
+                      ("INSERT INTO workers (name, region, status) VALUES ('w1', 'OPD', 'Active')", None)])
+
+def test_write_drops_only_reads_of_the_written_table(db):
+    _seed()
+    inv_q, workers_q = "SELECT qty FROM inventory WHERE name_en = 'A'", "SELECT COUNT(*) AS n FROM workers"
+    assert run_query(inv_q).iloc[0, 0] == 5 and run_query(workers_q).iloc[0, 0] == 1
+    inv_key, workers_key = query_cache.make_key(inv_q), query_cache.make_key(workers_q)
+    assert query_cache.get(inv_key) is not None and query_cache.get(workers_key) is not None
+
+    run_action("UPDATE inventory SET qty = 7 WHERE name_en = 'A'")
+    assert query_cache.get(inv_key) is None  # Dropped: it read inventory
+    assert query_cache.get(workers_key) is not None  # Kept: unrelated table
+    assert run_query(inv_q).iloc[0, 0] == 7
+
+def test_comma_joined_read_is_dropped_by_a_write_to_any_of_its_tables(db):
+    _seed()
+    q = "SELECT i.qty, w.name FROM inventory i, workers w"
+    run_query(q)
+    run_action("UPDATE workers SET status = 'Inactive'")
+    assert query_cache.get(query_cache.make_key(q)) is None
+
+def test_explicit_tags_win_over_parsing(db):
+    _seed()
+    q = "SELECT qty FROM inventory"
+    run_query(q, tables=["stock_logs"])
+    run_action("UPDATE inventory SET qty = 0", tables=["workers"])
+    assert query_cache.get(query_cache.make_key(q)) is not None
+    run_action("UPDATE inventory SET qty = 1", tables=["stock_logs"])
+    assert query_cache.get(query_cache.make_key(q)) is None
+
+def test_read_racing_a_write_is_not_cached(db):
+    _seed()
+    q = "SELECT qty FROM inventory"
+    snapshot = query_cache.generation({"inventory"})
+    stale = run_query(q, ttl=0)
+    query_cache.invalidate(["inventory"])  # A write lands while the read is in flight
+    query_cache.put(query_cache.make_key(q), stale, {"inventory"}, 600, snapshot)
+    assert query_cache.get(query_cache.make_key(q)) is None
@@ -0,0 +1,62 @@
+from datetime import date, datetime
+from modules.database import run_action, run_query
+from modules.inventory_logic import create_item, update_central_stock
+from modules.stock_history import take_checkpoint, stock_as_of, stock_series
+
+def _qty(at, location="NSTC", item="Cable"):
+    df = stock_as_of(location, at, item)
+    return int(df['qty'].sum()) if not df.empty else 0
+
+def _set_dates(log_dates, taken_at):
+    """Pins the log ids 1..n and the checkpoint to fixed times, so the timeline doesn't depend on the clock."""
+    for log_id, ts in log_dates.items():
+        run_action("UPDATE stock_logs SET log_date = :ts WHERE id = :id", {"ts": ts, "id": log_id})
+    run_action("UPDATE stock_checkpoints SET taken_at = :ts", {"ts": taken_at})
+
+def _history(db):
+    assert create_item("Cable", "Electrical", "Piece", "NSTC", 10, "mgr")[0]  # log 1: +10
+    assert update_central_stock("Cable", "NSTC", 5, "mgr", "Received from CWW", "Piece")[0]  # log 2: +5
+    assert take_checkpoint()  # 15, watermark = log 2
+    assert update_central_stock("Cable", "NSTC", -3, "sk", "Issued OPD", "Piece")[0]  # log 3: -3
+
+def test_item_creation_logs_opening_stock(db):
+    assert create_item("Cable", "Electrical", "Piece", "NSTC", 10, "mgr")[0]
+    logs = run_query("SELECT action_type, change_amount, new_qty FROM stock_logs", ttl=0)
+    assert logs.values.tolist() == [["Opening Stock", 10, 10]]
+
+def test_checkpoint_records_log_watermark(db):
+    _history(db)
+    cp = run_query("SELECT item_name, qty, log_id FROM stock_checkpoints", ttl=0)
+    assert cp.values.tolist() == [["Cable", 15, 2]]
+
+def test_as_of_before_at_and_after_checkpoint(db):
+    _history(db)
+    _set_dates({1: "2026-01-01 09:00:00", 2: "2026-01-01 10:00:00", 3: "2026-01-01 12:00:00"}, "2026-01-01 11:00:00")
+    assert _qty(datetime(2026, 1, 1, 8)) == 0  # Before the item existed
+    assert _qty(datetime(2026, 1, 1, 9, 30)) == 10
+    assert _qty(datetime(2026, 1, 1, 11)) == 15  # At the checkpoint
+    assert _qty(datetime(2026, 1, 1, 11, 30)) == 15
+    assert _qty(datetime(2026, 1, 1, 12, 30)) == 12  # After the checkpoint
+    assert _qty(date(2026, 1, 1)) == 12  # End of day
+    assert _qty(datetime.now()) == 12
+
+def test_log_in_the_checkpoint_instant_is_counted_once(db):
+    _history(db)
+    # Log 2 is inside the copy, log 3 was committed after it; both carry the checkpoint's timestamp
+    _set_dates({1: "2026-01-01 09:00:00", 2: "2026-01-01 11:00:00", 3: "2026-01-01 11:00:00"}, "2026-01-01 11:00:00")
+    assert _qty(datetime(2026, 1, 1, 10)) == 10
+    assert _qty(datetime(2026, 1, 1, 11)) == 10  # Logs dated 11:00 are not part of "as of 11:00"
+    assert _qty(datetime(2026, 1, 1, 11, 0, 1)) == 12
+
+def test_late_commit_dated_before_checkpoint(db):
+    _history(db)
+    # Log 3 started before the checkpoint but committed after it (not in the copy)
+    _set_dates({1: "2026-01-01 09:00:00", 2: "2026-01-01 10:00:00", 3: "2026-01-01 10:59:00"}, "2026-01-01 11:00:00")
+    assert _qty(datetime(2026, 1, 1, 10, 30)) == 15
+    assert _qty(datetime(2026, 1, 1, 11, 30)) == 12
+
+def test_stock_series_never_goes_negative(db):
+    _history(db)
+    _set_dates({1: "2026-01-02 09:00:00", 2: "2026-01-03 10:00:00", 3: "2026-01-04 12:00:00"}, "2026-01-03 11:00:00")
+    series = stock_series("NSTC", date(2026, 1, 1), date(2026, 1, 5), "Cable")
+    assert series['qty'].tolist() == [0, 10, 15, 12, 12]
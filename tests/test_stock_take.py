@@ -0,0 +1,50 @@
+import pytest
+import streamlit as st
+from modules.database import run_query
+from modules.inventory_logic import create_item, update_central_stock, apply_stock_take
+from modules.views.common import stock_take_sheet, stock_take_counts, reset_stock_take_sheet
+
+SHEET, EDITOR = "stock_sheet_test_NSTC", "stock_editor_test_NSTC_0"
+
+@pytest.fixture
+def sheet(db):
+    for name, qty in (("Bolt", 10), ("Cable", 20), ("Fuse", 30)):
+        assert create_item(name, "Electrical", "Piece", "NSTC", qty, "mgr")[0]
+    yield stock_take_sheet("NSTC", SHEET)
+    for key in (SHEET, f"{SHEET}_rev", EDITOR): st.session_state.pop(key, None)
+
+def _submit(sheet, counts):
+    """What the editor hands back on submit: the loaded sheet with `counts` typed in, plus its edited_rows."""
+    edited = sheet.copy()
+    rows = {}
+    for pos, count in counts.items():
+        edited.loc[pos, 'Physical Count'] = count
+        rows[pos] = {"Physical Count": count}
+    st.session_state[EDITOR] = {"edited_rows": rows, "added_rows": [], "deleted_rows": []}
+    return stock_take_counts(sheet, edited, EDITOR)
+
+def _qty(name):
+    return int(run_query("SELECT qty FROM inventory WHERE name_en = :n AND location = 'NSTC'", {"n": name}, ttl=0).iloc[0, 0])
+
+def test_stock_moved_while_counting_is_a_conflict(sheet):
+    update_central_stock("Cable", "NSTC", -5, "sk", "Issued OPD", "Piece")  # Moves after the sheet was loaded
+    assert stock_take_sheet("NSTC", SHEET) is sheet  # A rerun (the submit) keeps the loaded sheet
+    counts = _submit(sheet, {0: 8, 1: 18})
+    assert counts == [("Bolt", 10, 8), ("Cable", 20, 18)]  # Expected = qty the counter saw
+    ok, res = apply_stock_take("NSTC", counts, "mgr")
+    assert ok and res == {"updated": 1, "conflicts": ["Cable"]}
+    assert (_qty("Bolt"), _qty("Cable")) == (8, 15)  # The issue is not overwritten
+
+def test_items_added_meanwhile_do_not_shift_counts(sheet):
+    create_item("Anchor", "Electrical", "Piece", "NSTC", 1, "mgr")  # Sorts first in a fresh read
+    counts = _submit(stock_take_sheet("NSTC", SHEET), {2: 25})
+    assert counts == [("Fuse", 30, 25)]
+    assert apply_stock_take("NSTC", counts, "mgr")[1] == {"updated": 1, "conflicts": []}
+    assert (_qty("Anchor"), _qty("Fuse")) == (1, 25)
+
+def test_reset_loads_the_current_stock(sheet):
+    update_central_stock("Cable", "NSTC", -5, "sk", "Issued OPD", "Piece")
+    reset_stock_take_sheet(SHEET)
+    fresh = stock_take_sheet("NSTC", SHEET)
+    assert fresh is not sheet and fresh.set_index('Item Name').loc["Cable", "System Qty"] == 15
+    assert st.session_state[f"{SHEET}_rev"] == 1  # New editor key: old edits don't carry over
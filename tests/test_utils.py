@@ -0,0 +1,25 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from modules import utils
+
+def test_sweep_exports_removes_old_and_surplus_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "EXPORT_DIR", str(tmp_path))
+    now = time.time()
+    for i in range(5):
+        path = tmp_path / f"export_{i}.xlsx"
+        path.write_bytes(b"x")
+        os.utime(path, (now - i * 100, now - i * 100))  # export_0 is the newest
+    (tmp_path / "other.txt").write_text("kept")  # Not an export
+    (tmp_path / "export_old.csv").write_bytes(b"x")
+    os.utime(tmp_path / "export_old.csv", (now - 7200, now - 7200))
+
+    assert utils.sweep_exports(max_age=3600, max_files=3) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["export_0.xlsx", "export_1.xlsx", "export_2.xlsx", "other.txt"]
+
+def test_sweep_exports_without_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "EXPORT_DIR", str(tmp_path / "missing"))
+    assert utils.sweep_exports() == 0